@@ -0,0 +1,70 @@
+"""
+Compare bulk vectorized GeoIP lookups with per-IP lookups.
+
+The per-IP path is the lean raw-record lookup used for hop enrichment,
+called once per address. The bulk path resolves the whole batch with
+BulkGeoEngine, once from address strings and once from an integer array.
+Compiling the databases and loading the compiled tables are timed
+separately.
+
+Without --data-dir, synthetic GeoLite2-shaped databases are generated.
+
+Usage:
+    python benchmarks/bench_bulk_geo.py [--lookups 1000000] [--networks 50000] [--data-dir data]
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+from geotraceroute.core.bulk_geo import BulkGeoEngine
+from geotraceroute.core.geoip_cache import lookup_record
+from geotraceroute.core.geoip_readers import GeoIPReaders
+from synthetic_mmdb import sample_ips, write_databases
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lookups', type=int, default=1000000)
+    parser.add_argument('--per-ip-lookups', type=int, default=50000, help='Lookups timed on the per-IP path')
+    parser.add_argument('--networks', type=int, default=50000, help='Networks in the synthetic databases')
+    parser.add_argument('--data-dir', type=str, help='Directory with real GeoLite2 databases')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        data_dir = args.data_dir
+        if data_dir is None:
+            write_databases(Path(workdir), networks=args.networks)
+            data_dir = workdir
+        cache_dir = str(Path(workdir) / 'compiled')
+        ips = sample_ips(args.lookups, networks=args.networks)
+
+        compile_time, engine = timed(lambda: BulkGeoEngine.open(data_dir, cache_dir))
+        load_time, engine = timed(lambda: BulkGeoEngine.open(data_dir, cache_dir))
+        print(f"compile: {compile_time:.2f}s once per database build, load compiled: {load_time * 1000:.1f}ms")
+
+        readers = GeoIPReaders(data_dir)
+        city_reader, asn_reader = readers.city, readers.asn
+        sample = ips[:args.per_ip_lookups]
+        per_ip_time, _ = timed(lambda: [lookup_record(city_reader, asn_reader, ip) for ip in sample])
+        per_ip_rate = len(sample) / per_ip_time
+        readers.close()
+
+        bulk_time, _ = timed(lambda: engine.lookup(ips))
+        numbers = np.array([int.from_bytes(bytes(map(int, ip.split('.'))), 'big') for ip in ips], dtype=np.uint32)
+        array_time, _ = timed(lambda: engine.lookup(numbers))
+        engine.close()
+
+    print(f"per-IP:              {per_ip_rate:12,.0f} IPs/s")
+    print(f"bulk, from strings:  {len(ips) / bulk_time:12,.0f} IPs/s ({len(ips) / bulk_time / per_ip_rate:.0f}x)")
+    print(f"bulk, from integers: {len(ips) / array_time:12,.0f} IPs/s ({len(ips) / array_time / per_ip_rate:.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
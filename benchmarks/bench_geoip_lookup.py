@@ -0,0 +1,87 @@
+"""
+Compare geoip2 model lookups with the lean raw-record lookup per IP.
+
+The model path is what hop enrichment did before: reader.city() and
+reader.asn() build full geoip2 model objects, of which six fields are read.
+The lean path reads the raw records and keeps only those six fields in a
+GeoRecord. Neither path is cached, so every lookup reaches the database.
+
+Without --data-dir, synthetic GeoLite2-shaped databases are generated.
+
+Usage:
+    python benchmarks/bench_geoip_lookup.py [--lookups 50000] [--data-dir data] [--mode auto]
+"""
+import argparse
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from geotraceroute.core.geoip_cache import lookup_record
+from geotraceroute.core.geoip_readers import GeoIPReaders
+from synthetic_mmdb import sample_ips, write_databases
+
+
+def model_lookup(city_reader, asn_reader, ip):
+    city = city_reader.city(ip)
+    asn = asn_reader.asn(ip)
+    return (city.city.name, city.country.name, city.location.latitude, city.location.longitude,
+            asn.autonomous_system_organization, asn.autonomous_system_number)
+
+
+def lean_lookup(city_reader, asn_reader, ip):
+    return lookup_record(city_reader, asn_reader, ip)
+
+
+def measure(lookup, readers, ips, retained_sample: int):
+    """Return (microseconds per lookup, peak bytes allocated during one lookup, bytes kept per result)"""
+    city_reader, asn_reader = readers.city, readers.asn
+    started = time.perf_counter()
+    for ip in ips:
+        lookup(city_reader, asn_reader, ip)
+    per_lookup = (time.perf_counter() - started) / len(ips) * 1e6
+
+    tracemalloc.start()
+    peak = 0
+    for ip in ips[:retained_sample]:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        lookup(city_reader, asn_reader, ip)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+    before = tracemalloc.get_traced_memory()[0]
+    # Kept results stand in for what the model path used to hand to its caller
+    kept = [lookup(city_reader, asn_reader, ip) if lookup is lean_lookup
+            else (city_reader.city(ip), asn_reader.asn(ip)) for ip in ips[:retained_sample]]
+    retained = (tracemalloc.get_traced_memory()[0] - before) / len(kept)
+    tracemalloc.stop()
+    return per_lookup, peak, retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lookups', type=int, default=50000)
+    parser.add_argument('--networks', type=int, default=20000, help='Networks in the synthetic databases')
+    parser.add_argument('--data-dir', type=str, help='Directory with real GeoLite2 databases')
+    parser.add_argument('--mode', type=str, default='auto', help='GeoIP open mode, see GEOIP_MODE')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        data_dir = args.data_dir
+        if data_dir is None:
+            write_databases(Path(workdir), networks=args.networks)
+            data_dir = workdir
+        ips = sample_ips(args.lookups, networks=args.networks)
+        readers = GeoIPReaders(data_dir, mode=args.mode)
+        results = {}
+        for name, lookup in (('model', model_lookup), ('lean', lean_lookup)):
+            results[name] = measure(lookup, readers, ips, retained_sample=min(2000, len(ips)))
+            print(f"{name:>6}: {results[name][0]:7.2f} us/lookup, "
+                  f"peak {results[name][1] / 1024:6.1f} KiB per lookup, {results[name][2]:7.0f} B kept per result")
+        readers.close()
+
+    model, lean = results['model'], results['lean']
+    print(f"lean path: {model[0] / lean[0]:.1f}x faster, "
+          f"{model[1] / max(lean[1], 1):.1f}x less transient memory, {model[2] / max(lean[2], 1):.1f}x less kept per result")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Compare single and batched IPInfo lookups against a local stub server.
+
+The stub answers like ipinfo.io after a fixed delay per request, standing in
+for the round trip to the real API. Every run starts with cold caches, and
+the rate limit is lifted so the plan quota does not set the pace.
+
+Usage:
+    python benchmarks/bench_ipinfo_batch.py [--lookups 2000] [--concurrency 200] [--latency 0.02]
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+from aiohttp import web
+from geotraceroute.core.ip_info import IPInfoService
+from geotraceroute.core.ipinfo_store import IPInfoStore
+from geotraceroute.core.resilience import TokenBucket
+
+
+async def start_stub(latency: float):
+    def answer(ip):
+        return {"ip": ip, "city": "Tokyo", "country": "JP", "loc": "35.68,139.69", "org": "AS2516 KDDI"}
+
+    async def single(request):
+        await asyncio.sleep(latency)
+        return web.json_response(answer(request.match_info["ip"]))
+
+    async def batch(request):
+        await asyncio.sleep(latency)
+        return web.json_response({ip: answer(ip) for ip in await request.json()})
+
+    app = web.Application()
+    app.router.add_get("/{ip}/json", single)
+    app.router.add_post("/batch", batch)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+
+async def run(url: str, batch_window: float, args, workdir: Path):
+    """Look up distinct IPs from many concurrent callers, returning (seconds, round trips)"""
+    service = IPInfoService(store=IPInfoStore(str(workdir / f"bench-{batch_window}.sqlite3")),
+                            base_url=url, batch_window=batch_window, batch_size=args.batch_size,
+                            limiter=TokenBucket(rate=1e9, burst=1e9))
+    service.api_key = "bench"
+    ips = [f"10.{n // 65536}.{n // 256 % 256}.{n % 256}" for n in range(args.lookups)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def lookup(ip):
+        async with semaphore:
+            await service.get_ip_info(ip)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(lookup(ip) for ip in ips))
+    elapsed = time.perf_counter() - started
+    await service.close()
+    return elapsed, service.round_trips
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='IPInfo batching benchmark')
+    parser.add_argument('--lookups', type=int, default=2000, help='Distinct IPs looked up')
+    parser.add_argument('--concurrency', type=int, default=200, help='Callers in flight at once')
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds the stub takes per request')
+    parser.add_argument('--batch-size', type=int, default=100, help='Lookups per batch request')
+    parser.add_argument('--batch-window', type=float, default=0.01, help='Seconds lookups are collected')
+    args = parser.parse_args()
+
+    runner, url = await start_stub(args.latency)
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            print(f"{'mode':<10}{'round trips':>12}{'seconds':>10}{'lookups/sec':>14}")
+            for mode, window in (('single', 0), ('batched', args.batch_window)):
+                elapsed, round_trips = await run(url, window, args, Path(workdir))
+                print(f"{mode:<10}{round_trips:>12}{elapsed:>10.2f}{args.lookups / elapsed:>14,.0f}")
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,42 @@
+"""
+Measure traceroute output parse throughput over the corpus of real output.
+
+Usage:
+    python benchmarks/bench_parser.py [--seconds 1.0]
+"""
+import argparse
+import time
+from pathlib import Path
+from geotraceroute.core.parser import TracerouteParser
+
+CORPUS_DIR = Path(__file__).parent / "corpus"
+
+
+def bench_file(path: Path, seconds: float):
+    """Parse one corpus file repeatedly and return (lines/sec, hops per pass, dialect)"""
+    output = path.read_text()
+    line_count = len(output.splitlines())
+    passes = 0
+    started = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < seconds:
+        parser = TracerouteParser()
+        hops = parser.parse(output)
+        passes += 1
+        elapsed = time.perf_counter() - started
+    return passes * line_count / elapsed, len(hops), parser.dialect
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Traceroute parser throughput benchmark')
+    parser.add_argument('--seconds', type=float, default=1.0, help='Time spent on each corpus file')
+    args = parser.parse_args()
+
+    print(f"{'corpus':<24}{'dialect':<10}{'hops':>6}{'lines/sec':>14}")
+    for path in sorted(CORPUS_DIR.glob('*.txt')):
+        rate, hops, dialect = bench_file(path, args.seconds)
+        print(f"{path.name:<24}{dialect:<10}{hops:>6}{rate:>14,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Write small GeoLite2-shaped City and ASN databases for the benchmarks.
+
+The real GeoLite2 files cannot be redistributed, so the GeoIP benchmarks
+build stand-ins with the same record layout: localized names, subdivisions,
+continent and registered country in the City records, organization and
+number in the ASN records. Only IPv4 /24 networks are written.
+
+Usage as a module:
+    from synthetic_mmdb import write_databases
+    city_path, asn_path = write_databases(directory, networks=20000)
+"""
+import ipaddress
+import json
+import random
+import struct
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+_METADATA_MARKER = b"\xab\xcd\xefMaxMind.com"
+_LANGUAGES = ["de", "en", "es", "fr", "ja", "pt-BR", "ru", "zh-CN"]
+
+
+class _Uint16(int):
+    """Written as uint16, which readers require for some metadata fields"""
+
+
+class _Uint64(int):
+    """Written as uint64"""
+
+
+def _control(type_number: int, size: int) -> bytes:
+    if size < 29:
+        first, extra = size, b""
+    elif size < 285:
+        first, extra = 29, bytes([size - 29])
+    elif size < 65821:
+        first, extra = 30, (size - 285).to_bytes(2, "big")
+    else:
+        first, extra = 31, (size - 65821).to_bytes(3, "big")
+    if type_number <= 7:
+        return bytes([type_number << 5 | first]) + extra
+    # Extended types store their number minus 7 in the byte after the control byte
+    return bytes([first, type_number - 7]) + extra
+
+
+def _encode(value) -> bytes:
+    if isinstance(value, bool):
+        return _control(14, int(value))
+    if isinstance(value, str):
+        data = value.encode()
+        return _control(2, len(data)) + data
+    if isinstance(value, float):
+        return _control(3, 8) + struct.pack(">d", value)
+    if isinstance(value, int):
+        data = value.to_bytes((value.bit_length() + 7) // 8, "big")
+        if isinstance(value, _Uint16):
+            return _control(5, len(data)) + data
+        return _control(6 if value < 2 ** 32 and not isinstance(value, _Uint64) else 9, len(data)) + data
+    if isinstance(value, dict):
+        return _control(7, len(value)) + b"".join(_encode(k) + _encode(v) for k, v in value.items())
+    if isinstance(value, list):
+        return _control(11, len(value)) + b"".join(_encode(item) for item in value)
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+def write_mmdb(path: Path, database_type: str, records: List[Tuple[ipaddress.IPv4Network, Dict]]) -> None:
+    """Write an IPv4 MaxMind DB mapping each network to its record"""
+    data = bytearray()
+    offsets: Dict[str, int] = {}
+    root: list = [None, None]
+    for network, record in records:
+        key = json.dumps(record, sort_keys=True)
+        if key not in offsets:
+            offsets[key] = len(data)
+            data += _encode(record)
+        node = root
+        bits = int(network.network_address)
+        for depth in range(network.prefixlen):
+            bit = bits >> (31 - depth) & 1
+            if depth == network.prefixlen - 1:
+                node[bit] = offsets[key]
+            else:
+                if node[bit] is None:
+                    node[bit] = [None, None]
+                node = node[bit]
+
+    # Number the nodes breadth first, then write each as two 32-bit records
+    nodes = [root]
+    numbers = {id(root): 0}
+    for node in nodes:
+        for child in node:
+            if isinstance(child, list):
+                numbers[id(child)] = len(nodes)
+                nodes.append(child)
+    node_count = len(nodes)
+
+    def pointer(child) -> int:
+        if child is None:
+            return node_count
+        if isinstance(child, list):
+            return numbers[id(child)]
+        return node_count + 16 + child
+
+    tree = b"".join(struct.pack(">II", pointer(node[0]), pointer(node[1])) for node in nodes)
+    metadata = {
+        "binary_format_major_version": _Uint16(2),
+        "binary_format_minor_version": _Uint16(0),
+        "build_epoch": _Uint64(int(time.time())),
+        "database_type": database_type,
+        "description": {"en": f"Synthetic {database_type} for benchmarks"},
+        "ip_version": _Uint16(4),
+        "languages": _LANGUAGES,
+        "node_count": node_count,
+        "record_size": _Uint16(32),
+    }
+    path.write_bytes(tree + bytes(16) + bytes(data) + _METADATA_MARKER + _encode(metadata))
+
+
+def _names(base: str) -> Dict[str, str]:
+    return {language: f"{base} ({language})" if language != "en" else base for language in _LANGUAGES}
+
+
+def write_databases(directory: Path, networks: int = 20000, cities: int = 2000, seed: int = 1) -> Tuple[Path, Path]:
+    """
+    Write GeoLite2-City.mmdb and GeoLite2-ASN.mmdb covering ``networks`` /24 networks.
+
+    Returns:
+        Tuple[Path, Path]: Paths of the City and ASN databases
+    """
+    rng = random.Random(seed)
+    city_records = []
+    for n in range(cities):
+        country = n % 200
+        city_records.append({
+            "city": {"geoname_id": 100000 + n, "names": _names(f"City {n}")},
+            "continent": {"code": "EU", "geoname_id": 6255148, "names": _names("Europe")},
+            "country": {"geoname_id": 200000 + country, "iso_code": f"C{country:03d}", "names": _names(f"Country {country}")},
+            "location": {"accuracy_radius": 20, "latitude": rng.uniform(-60, 60),
+                         "longitude": rng.uniform(-180, 180), "time_zone": "Europe/Dublin"},
+            "postal": {"code": f"{n:05d}"},
+            "registered_country": {"geoname_id": 200000 + country, "iso_code": f"C{country:03d}",
+                                   "names": _names(f"Country {country}")},
+            "subdivisions": [{"geoname_id": 300000 + n, "iso_code": "S1", "names": _names(f"Region {n}")}],
+        })
+    asn_records = [{"autonomous_system_number": 64512 + n, "autonomous_system_organization": f"Network {n} Ltd"}
+                   for n in range(cities // 4)]
+
+    subnets = [ipaddress.IPv4Network((0x0B000000 + n * 256, 24)) for n in range(networks)]
+    directory = Path(directory)
+    city_path = directory / "GeoLite2-City.mmdb"
+    asn_path = directory / "GeoLite2-ASN.mmdb"
+    write_mmdb(city_path, "GeoLite2-City", [(net, rng.choice(city_records)) for net in subnets])
+    write_mmdb(asn_path, "GeoLite2-ASN", [(net, rng.choice(asn_records)) for net in subnets])
+    return city_path, asn_path
+
+
+def sample_ips(count: int, networks: int = 20000, seed: int = 2) -> List[str]:
+    """Addresses spread over the networks written by write_databases"""
+    rng = random.Random(seed)
+    return [str(ipaddress.IPv4Address(0x0B000000 + rng.randrange(networks) * 256 + rng.randrange(1, 255)))
+            for _ in range(count)]
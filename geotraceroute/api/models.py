@@ -10,6 +10,61 @@ class TracerouteRequest(BaseModel):
         description="Maximum number of hops (1-64)"
     )
     include_reputation: Optional[bool] = False
+    parallel: Optional[bool] = Field(
+        default=False,
+        description="Probe all hops at once instead of one hop at a time"
+    )
+    timeout: Optional[float] = Field(
+        default=1.0,
+        gt=0,
+        le=10,
+        description="Seconds to wait for each hop's replies"
+    )
+    adaptive_timeout: Optional[bool] = Field(
+        default=False,
+        description="Shorten the wait per hop to a timeout estimated from earlier replies. Only the "
+                    "in-process probe engine honors it; the traceroute binary fallback always waits the full timeout"
+    )
+    gap_limit: Optional[int] = Field(
+        default=None,
+        ge=1,
+        le=64,
+        description="Stop after this many consecutive hops without a reply"
+    )
+
+class BulkTracerouteRequest(BaseModel):
+    targets: List[str] = Field(..., min_length=1, max_length=10000, description="Target hostnames or IP addresses")
+    max_hops: Optional[int] = Field(
+        default=30,
+        ge=1,
+        le=64,
+        description="Maximum number of hops (1-64)"
+    )
+    include_reputation: Optional[bool] = False
+    concurrency: Optional[int] = Field(
+        default=32,
+        ge=1,
+        le=1024,
+        description="Maximum number of targets traced at once"
+    )
+    target_budget: Optional[float] = Field(
+        default=60.0,
+        gt=0,
+        le=600,
+        description="Seconds allowed for each target"
+    )
+    timeout: Optional[float] = Field(
+        default=1.0,
+        gt=0,
+        le=10,
+        description="Seconds to wait for each hop's replies"
+    )
+    gap_limit: Optional[int] = Field(
+        default=3,
+        ge=1,
+        le=64,
+        description="Stop a target after this many consecutive hops without a reply"
+    )
 
 class ClientLocation(BaseModel):
     latitude: float = Field(..., description="客户端纬度")
@@ -21,7 +76,7 @@ class HopInfo(BaseModel):
     hop_number: int
     ip: Optional[str]
     hostname: Optional[str]
-    rtt_ms: List[float]
+    rtt_ms: Optional[List[float]]
     country: Optional[str]
     city: Optional[str]
     latitude: Optional[float]
@@ -29,9 +84,12 @@ class HopInfo(BaseModel):
     organization: Optional[str]
     asn: Optional[int]
     reputation_score: Optional[float]
+    inferred: bool = False
 
 class TracerouteResponse(BaseModel):
     target: str
     hops: List[HopInfo]
     total_hops: int
-    successful_hops: int 
\ No newline at end of file
+    successful_hops: int
+    stop_reason: Optional[str] = None
+    cache_age: float = 0.0 
\ No newline at end of file
@@ -4,10 +4,12 @@ from fastapi.templating import Jinja2Templates
 from pathlib import Path
 import json
 import logging
+import ipaddress
 from geotraceroute.core.data_processor import DataProcessor
 from geotraceroute.core.traceroute import Traceroute
-from geotraceroute.core.ip_info import IPInfoService
-from geotraceroute.api.models import TracerouteRequest, ClientLocation
+from geotraceroute.core.trace_cache import TraceCache
+from geotraceroute.core.scheduler import TraceScheduler
+from geotraceroute.api.models import TracerouteRequest, BulkTracerouteRequest, ClientLocation
 import os
 
 # Configure logging
@@ -20,7 +22,10 @@ templates = Jinja2Templates(directory=str(Path(__file__).resolve().parent.parent
 # Create DataProcessor instance
 data_processor = DataProcessor(test_mode='PYTEST_CURRENT_TEST' in os.environ)
 current_traceroute = None
-ip_info_service = IPInfoService()
+# The processor's service, so the API key, rate limit and circuit breaker apply to hop lookups too
+ip_info_service = data_processor.ip_info_service
+# Shares completed and in-progress traces between identical summary requests
+trace_cache = TraceCache()
 
 # Get client location information
 async def get_client_location(request: Request, 
@@ -61,14 +66,16 @@ async def get_client_location(request: Request,
     
     return None
 
-async def traceroute_generator(target: str, max_hops: int, include_reputation: bool = False, api_key: str = None, client_location: dict = None):
+async def traceroute_generator(target: str, max_hops: int, include_reputation: bool = False, api_key: str = None, client_location: dict = None, parallel: bool = False,
+                               timeout: float = 1.0, adaptive_timeout: bool = False, gap_limit: int = None):
     """Generate traceroute results in real-time."""
     tracer = None
     try:
         # Log start information for debugging
         logger.info(f"Starting traceroute to {target} with max_hops={max_hops}, include_reputation={include_reputation}")
         
-        tracer = Traceroute(target, max_hops=max_hops)
+        tracer = await Traceroute.create(target, max_hops=max_hops, parallel=parallel, timeout=timeout,
+                                         adaptive_timeout=adaptive_timeout, gap_limit=gap_limit)
         global current_traceroute
         current_traceroute = tracer
         
@@ -82,6 +89,11 @@ async def traceroute_generator(target: str, max_hops: int, include_reputation: b
         
         hop_count = 0
         async for hop in data_processor.process_traceroute_stream(tracer, include_reputation=include_reputation):
+            # Hostname updates for hops that were already sent
+            if hop.get('type') == 'hostname':
+                yield f"data: {json.dumps(hop)}\n\n"
+                continue
+
             # Use client location information for the first hop
             if hop['hop_number'] == 1 and client_location:
                 hop.update({
@@ -100,10 +112,10 @@ async def traceroute_generator(target: str, max_hops: int, include_reputation: b
             yield f"data: {json.dumps(hop_data)}\n\n"
             
         # Log completion message
-        logger.info(f"Traceroute to {target} completed with {hop_count} hops")
+        logger.info(f"Traceroute to {target} completed with {hop_count} hops ({tracer.stop_reason})")
         
         # Send completion message
-        yield f"data: {json.dumps({'status': 'completed'})}\n\n"
+        yield f"data: {json.dumps({'status': 'completed', 'reason': tracer.stop_reason})}\n\n"
     except Exception as e:
         logger.error(f"Error in traceroute: {str(e)}")
         error_data = {"error": str(e)}
@@ -117,17 +129,147 @@ async def traceroute_generator(target: str, max_hops: int, include_reputation: b
         # Send final completion message
         yield "data: {\"done\": true}\n\n"
 
+async def monitor_generator(target: str, max_hops: int, interval: float, rounds: int = None, include_reputation: bool = False, api_key: str = None, client_location: dict = None):
+    """Generate per-round path statistics in real-time."""
+    tracer = None
+    try:
+        logger.info(f"Starting monitor of {target} with max_hops={max_hops}, interval={interval}, rounds={rounds}")
+
+        tracer = await Traceroute.create(target, max_hops=max_hops, parallel=True)
+        global current_traceroute
+        current_traceroute = tracer
+
+        # Set API key if provided
+        if api_key:
+            ip_info_service.api_key = api_key
+
+        async for round_data in data_processor.process_monitor_stream(
+            tracer, interval=interval, rounds=rounds, include_reputation=include_reputation
+        ):
+            # Use client location information for the first hop
+            for hop in round_data['hops']:
+                if hop['hop_number'] == 1 and client_location and 'latitude' in hop:
+                    hop.update({
+                        "city": client_location.get('city'),
+                        "country": client_location.get('country'),
+                        "latitude": client_location.get('latitude'),
+                        "longitude": client_location.get('longitude')
+                    })
+            yield f"data: {json.dumps(round_data)}\n\n"
+
+        yield f"data: {json.dumps({'status': 'completed'})}\n\n"
+    except Exception as e:
+        logger.error(f"Error in monitor: {str(e)}")
+        yield f"data: {json.dumps({'error': str(e)})}\n\n"
+    finally:
+        if tracer:
+            logger.info(f"Stopping monitor of {target}")
+            await tracer.stop()
+            if current_traceroute == tracer:
+                current_traceroute = None
+        yield "data: {\"done\": true}\n\n"
+
+async def cached_traceroute(tracer: Traceroute, include_reputation: bool) -> dict:
+    """
+    Run and enrich a trace, reusing a fresh or in-progress identical trace.
+
+    The trace runs as a shared task that callers wait on, so it is never
+    stopped on behalf of one caller; a caller that goes away just stops waiting.
+    """
+    # Keyed by database version too, so a GeoIP reload retires results enriched from the old data
+    key = trace_cache.key_for(tracer, include_reputation=include_reputation,
+                              geoip_version=data_processor.geoip_readers.version,
+                              overrides_version=data_processor.overrides.version)
+    result, age = await trace_cache.get_or_run(
+        key, lambda: data_processor.process_traceroute(tracer, include_reputation=include_reputation)
+    )
+    if age:
+        logger.info(f"Serving cached traceroute to {tracer.target_ip} ({age}s old)")
+    # Other names may resolve to the same address
+    result["target"] = tracer.target
+    result["cache_age"] = age
+    return result
+
+async def bulk_generator(req: BulkTracerouteRequest, api_key: str = None):
+    """Generate results for many targets in real-time, tagged by target."""
+    try:
+        logger.info(f"Starting bulk traceroute of {len(req.targets)} targets with concurrency={req.concurrency}")
+        if api_key:
+            ip_info_service.api_key = api_key
+        scheduler = TraceScheduler(
+            data_processor,
+            concurrency=req.concurrency,
+            target_budget=req.target_budget,
+            max_hops=req.max_hops,
+            timeout=req.timeout,
+            gap_limit=req.gap_limit,
+            parallel=True
+        )
+        async for event in scheduler.run(req.targets, include_reputation=req.include_reputation):
+            yield f"data: {json.dumps(event)}\n\n"
+        yield f"data: {json.dumps({'status': 'completed'})}\n\n"
+    except Exception as e:
+        logger.error(f"Error in bulk traceroute: {str(e)}")
+        yield f"data: {json.dumps({'error': str(e)})}\n\n"
+    finally:
+        yield "data: {\"done\": true}\n\n"
+
 @router.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy"}
 
+@router.get("/geoip/status")
+async def geoip_status():
+    """GeoIP database open mode and state"""
+    return data_processor.geoip_readers.stats()
+
+@router.post("/geoip/reload")
+async def geoip_reload(force: bool = Query(False, description="Reload even if the files look unchanged")):
+    """Swap in replaced GeoIP database files without restarting"""
+    reloaded = await data_processor.reload_geoip(force=force)
+    logger.info(f"GeoIP reload requested, reloaded={reloaded}")
+    return {"reloaded": reloaded, **data_processor.geoip_readers.stats()}
+
+@router.get("/overrides")
+async def overrides_status():
+    """Loaded geo overrides and how many hops each one answered"""
+    return data_processor.overrides.stats()
+
+@router.post("/overrides/reload")
+async def overrides_reload():
+    """Load the geo override file again without restarting"""
+    reloaded = data_processor.overrides.reload(force=True)
+    logger.info(f"Geo overrides reload requested, reloaded={reloaded}")
+    return {"reloaded": reloaded, **data_processor.overrides.stats()}
+
+@router.get("/ipinfo/status")
+async def ipinfo_status():
+    """IPInfo circuit breaker and rate limiter state"""
+    return ip_info_service.status()
+
+@router.post("/location/{ip}/refresh")
+async def refresh_location(ip: str):
+    """Look up an IP's location again, bypassing cached and negative results"""
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid IP address: {ip}")
+    if address.is_private:
+        raise HTTPException(status_code=400, detail=f"Private IP addresses have no location: {ip}")
+    return {"ip": ip, **await data_processor.refresh_location(ip)}
+
 @router.get("/traceroute/{target}")
 async def traceroute_stream(
     request: Request,
     target: str, 
     max_hops: int = 30, 
     include_reputation: bool = True,
+    parallel: bool = Query(False, description="Probe all hops at once"),
+    timeout: float = Query(1.0, gt=0, le=10, description="Seconds to wait for each hop's replies"),
+    adaptive_timeout: bool = Query(False, description="Estimate the per-hop timeout from earlier replies "
+                                                      "(in-process probe engine only, ignored by the traceroute binary fallback)"),
+    gap_limit: int = Query(None, ge=1, le=64, description="Stop after this many consecutive silent hops"),
     api_key: str = Query(None, description="IPInfo API key"),
     client_location: dict = Depends(get_client_location)
 ):
@@ -138,6 +280,11 @@ async def traceroute_stream(
         target: The hostname or IP to traceroute to
         max_hops: Maximum number of hops
         include_reputation: Whether to include reputation scores
+        parallel: Whether to probe all hops at once
+        timeout: Seconds to wait for each hop's replies
+        adaptive_timeout: Whether to estimate the timeout from earlier replies; only the
+            in-process probe engine does, the traceroute binary fallback ignores it
+        gap_limit: Consecutive silent hops after which the trace stops
         api_key: IPInfo API key for geolocation and reputation data
         client_location: Client location information
         
@@ -145,10 +292,59 @@ async def traceroute_stream(
         StreamingResponse: Server-sent events stream of hop data
     """
     return StreamingResponse(
-        traceroute_generator(target, max_hops, include_reputation, api_key, client_location),
+        traceroute_generator(target, max_hops, include_reputation, api_key, client_location, parallel,
+                             timeout, adaptive_timeout, gap_limit),
+        media_type="text/event-stream"
+    )
+
+@router.get("/traceroute/{target}/monitor")
+async def traceroute_monitor(
+    request: Request,
+    target: str,
+    max_hops: int = 30,
+    interval: float = Query(1.0, ge=0.1, description="Seconds between probe rounds"),
+    rounds: int = Query(None, ge=1, description="Number of rounds, unlimited if omitted"),
+    include_reputation: bool = False,
+    api_key: str = Query(None, description="IPInfo API key"),
+    client_location: dict = Depends(get_client_location)
+):
+    """
+    Continuously monitor the path to a target, like mtr.
+    
+    Args:
+        target: The hostname or IP to monitor
+        max_hops: Maximum number of hops
+        interval: Seconds between probe rounds
+        rounds: Number of rounds to run
+        include_reputation: Whether to include reputation scores
+        api_key: IPInfo API key for geolocation and reputation data
+        client_location: Client location information
+        
+    Returns:
+        StreamingResponse: Server-sent events stream of per-round hop statistics
+    """
+    return StreamingResponse(
+        monitor_generator(target, max_hops, interval, rounds, include_reputation, api_key, client_location),
         media_type="text/event-stream"
     )
 
+@router.post("/traceroute/bulk")
+async def bulk_traceroute(
+    req: BulkTracerouteRequest,
+    api_key: str = Query(None, description="IPInfo API key")
+):
+    """
+    Trace many targets and stream their hops as they arrive.
+    
+    Args:
+        req: Targets and probe settings
+        api_key: IPInfo API key for geolocation and reputation data
+        
+    Returns:
+        StreamingResponse: Server-sent events stream of hops tagged with their target
+    """
+    return StreamingResponse(bulk_generator(req, api_key), media_type="text/event-stream")
+
 @router.post("/traceroute/stop")
 async def stop_traceroute():
     """Stop the current traceroute process"""
@@ -179,7 +375,11 @@ async def start_traceroute(
                 req.max_hops,
                 req.include_reputation,
                 api_key,
-                client_location
+                client_location,
+                req.parallel,
+                req.timeout,
+                req.adaptive_timeout,
+                req.gap_limit
             ),
             media_type="text/event-stream"
         )
@@ -197,20 +397,17 @@ async def run_traceroute(
     client_location: dict = Depends(get_client_location)
 ):
     """Run complete traceroute and return results."""
-    tracer = None
     try:
         logger.info(f"Running traceroute to {req.target}")
-        tracer = Traceroute(req.target, max_hops=req.max_hops)
+        tracer = await Traceroute.create(req.target, max_hops=req.max_hops, parallel=req.parallel, timeout=req.timeout,
+                                         adaptive_timeout=req.adaptive_timeout, gap_limit=req.gap_limit)
         
         # Set API key if provided
         if api_key:
             ip_info_service.api_key = api_key
             
         # Get location information and pass to processor
-        result = await data_processor.process_traceroute(
-            tracer,
-            include_reputation=req.include_reputation
-        )
+        result = await cached_traceroute(tracer, req.include_reputation)
         
         # If client location information is available, apply to first hop
         if client_location and result['hops'] and len(result['hops']) > 0:
@@ -226,9 +423,6 @@ async def run_traceroute(
     except Exception as e:
         logger.error(f"Error in traceroute: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if tracer:
-            await tracer.stop()
 
 @router.get("/traceroute/{target}/summary")
 async def traceroute_summary(
@@ -236,6 +430,11 @@ async def traceroute_summary(
     target: str, 
     max_hops: int = 30, 
     include_reputation: bool = False,
+    parallel: bool = Query(False, description="Probe all hops at once"),
+    timeout: float = Query(1.0, gt=0, le=10, description="Seconds to wait for each hop's replies"),
+    adaptive_timeout: bool = Query(False, description="Estimate the per-hop timeout from earlier replies "
+                                                      "(in-process probe engine only, ignored by the traceroute binary fallback)"),
+    gap_limit: int = Query(None, ge=1, le=64, description="Stop after this many consecutive silent hops"),
     api_key: str = Query(None, description="IPInfo API key"),
     client_location: dict = Depends(get_client_location)
 ):
@@ -246,6 +445,11 @@ async def traceroute_summary(
         target: The hostname or IP to traceroute to
         max_hops: Maximum number of hops
         include_reputation: Whether to include reputation scores
+        parallel: Whether to probe all hops at once
+        timeout: Seconds to wait for each hop's replies
+        adaptive_timeout: Whether to estimate the timeout from earlier replies; only the
+            in-process probe engine does, the traceroute binary fallback ignores it
+        gap_limit: Consecutive silent hops after which the trace stops
         api_key: IPInfo API key for geolocation and reputation data
         client_location: Client location information
         
@@ -253,13 +457,14 @@ async def traceroute_summary(
         dict: Summary of traceroute results
     """
     try:
-        tracer = Traceroute(target, max_hops=max_hops)
+        tracer = await Traceroute.create(target, max_hops=max_hops, parallel=parallel, timeout=timeout,
+                                         adaptive_timeout=adaptive_timeout, gap_limit=gap_limit)
         
         # Set API key if provided
         if api_key:
             ip_info_service.api_key = api_key
             
-        result = await data_processor.process_traceroute(tracer, include_reputation=include_reputation)
+        result = await cached_traceroute(tracer, include_reputation)
         
         # If client location information is available, apply to first hop
         if client_location and result['hops'] and len(result['hops']) > 0:
@@ -0,0 +1,250 @@
+import os
+import socket
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import maxminddb
+from geotraceroute.core.geoip_cache import GeoRecord, lookup_record
+from geotraceroute.core.geoip_readers import GeoIPReaders
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for bulk lookups
+    np = None
+
+# Columns of each database: (name, kind), kind being 'str', 'float' or 'int'
+CITY_COLUMNS = (('city', 'str'), ('country', 'str'), ('latitude', 'float'), ('longitude', 'float'))
+ASN_COLUMNS = (('organization', 'str'), ('asn', 'int'))
+
+
+def _english_name(record: Optional[Dict]) -> Optional[str]:
+    return record['names'].get('en') if record and 'names' in record else None
+
+
+def _city_row(record: Dict) -> Tuple:
+    location = record.get('location') or {}
+    return (_english_name(record.get('city')), _english_name(record.get('country')),
+            location.get('latitude'), location.get('longitude'))
+
+
+def _asn_row(record: Dict) -> Tuple:
+    return record.get('autonomous_system_organization'), record.get('autonomous_system_number')
+
+
+class IntervalTable:
+    """
+    One GeoLite2 database flattened into sorted IPv4 intervals.
+
+    ``starts`` and ``ends`` bound each network, ``rows`` points every network
+    at a row of the deduplicated attribute columns, and string columns point
+    into one deduplicated ``strings`` table. Row -1 means no record.
+    """
+    def __init__(self, columns: Sequence[Tuple[str, str]], arrays: Dict[str, Any]):
+        self.columns = tuple(columns)
+        self.arrays = arrays
+        self.starts = arrays['starts']
+        self.ends = arrays['ends']
+        self.rows = arrays['rows']
+        # Index -1, used for addresses without a record, selects the appended missing value
+        strings = np.append(arrays['strings'].astype(object), None)
+        self._values = {}
+        for name, kind in self.columns:
+            column = arrays[f'col_{name}']
+            if kind == 'str':
+                self._values[name] = strings[np.append(column, -1)]
+            elif kind == 'float':
+                self._values[name] = np.append(column, np.nan)
+            else:
+                self._values[name] = np.append(column, 0)
+
+    @classmethod
+    def compile(cls, networks: Iterable[Tuple[Any, Dict]], columns: Sequence[Tuple[str, str]],
+                extract: Callable[[Dict], Tuple]) -> 'IntervalTable':
+        """
+        Build a table from (network, record) pairs, as yielded by iterating a maxminddb reader.
+
+        Args:
+            networks: Networks and their raw records; IPv6 networks are skipped
+            columns: Names and kinds of the values extract() returns
+            extract: Turns a raw record into one value per column
+        """
+        starts: List[int] = []
+        ends: List[int] = []
+        rows: List[int] = []
+        row_ids: Dict[Tuple, int] = {}
+        strings: Dict[str, int] = {}
+        for network, record in networks:
+            if network.version != 4:
+                continue
+            row = extract(record)
+            row_id = row_ids.get(row)
+            if row_id is None:
+                row_id = row_ids[row] = len(row_ids)
+            starts.append(int(network.network_address))
+            ends.append(int(network.broadcast_address))
+            rows.append(row_id)
+
+        arrays = {}
+        order = np.argsort(np.asarray(starts, dtype=np.uint32), kind='stable')
+        arrays['starts'] = np.asarray(starts, dtype=np.uint32)[order]
+        arrays['ends'] = np.asarray(ends, dtype=np.uint32)[order]
+        arrays['rows'] = np.asarray(rows, dtype=np.int32)[order]
+        unique_rows = list(row_ids)
+        for position, (name, kind) in enumerate(columns):
+            values = [row[position] for row in unique_rows]
+            if kind == 'str':
+                arrays[f'col_{name}'] = np.asarray(
+                    [strings.setdefault(value, len(strings)) if value is not None else -1 for value in values],
+                    dtype=np.int32)
+            elif kind == 'float':
+                arrays[f'col_{name}'] = np.asarray(
+                    [value if value is not None else np.nan for value in values], dtype=np.float64)
+            else:
+                arrays[f'col_{name}'] = np.asarray([value or 0 for value in values], dtype=np.int64)
+        arrays['strings'] = np.asarray(list(strings) or [''], dtype=str)
+        return cls(columns, arrays)
+
+    @classmethod
+    def load(cls, path: str, columns: Sequence[Tuple[str, str]]) -> 'IntervalTable':
+        with np.load(path, allow_pickle=False) as saved:
+            return cls(columns, {name: saved[name] for name in saved.files})
+
+    def save(self, path: str) -> None:
+        """Write the table, replacing any older file only once it is complete"""
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'wb') as f:
+            np.savez(f, **self.arrays)
+        os.replace(temporary, path)
+
+    def find(self, addresses) -> Any:
+        """Row of every IPv4 address given as an integer array, -1 where there is none"""
+        if not len(self.starts):
+            return np.full(len(addresses), -1, dtype=np.int32)
+        positions = np.searchsorted(self.starts, addresses, side='right') - 1
+        clipped = np.clip(positions, 0, None)
+        inside = (positions >= 0) & (addresses <= self.ends[clipped])
+        return np.where(inside, self.rows[clipped], -1)
+
+    def values(self, name: str, rows) -> Any:
+        return self._values[name][rows]
+
+
+class BulkGeoEngine:
+    """
+    Vectorized GeoLite2 lookups for enriching millions of stored hop IPs at once.
+
+    The City and ASN databases are compiled into IntervalTables, cached on
+    disk next to the databases and reused until a database is replaced.
+    A lookup parses the addresses, finds every IPv4 address with one binary
+    search over the intervals and returns columns rather than per-IP
+    objects. IPv6 addresses, which numpy cannot hold as integers, are looked
+    up one by one through the lean per-IP path.
+
+    Needs numpy, which the server itself does not.
+    """
+    def __init__(self, city: IntervalTable, asn: IntervalTable, readers: Optional[GeoIPReaders] = None):
+        """
+        Args:
+            city: Compiled City database
+            asn: Compiled ASN database
+            readers: Readers for addresses the tables cannot answer (IPv6); without them those stay empty
+        """
+        if np is None:
+            raise RuntimeError("BulkGeoEngine needs numpy, install it with: pip install numpy")
+        self.city = city
+        self.asn = asn
+        self.readers = readers
+
+    @classmethod
+    def open(cls, data_dir: Optional[str] = None, cache_dir: Optional[str] = None) -> 'BulkGeoEngine':
+        """
+        Load the compiled databases, compiling and caching them first if needed.
+
+        Args:
+            data_dir: Directory holding the .mmdb files (GEOIP_DATA_DIR, default data/)
+            cache_dir: Where compiled tables are kept (BULK_GEO_CACHE_DIR, default the data directory)
+        """
+        if np is None:
+            raise RuntimeError("BulkGeoEngine needs numpy, install it with: pip install numpy")
+        readers = GeoIPReaders(data_dir)
+        cache_dir = cache_dir or os.getenv('BULK_GEO_CACHE_DIR') or readers.data_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        tables = {}
+        for name, columns, extract in (('city', CITY_COLUMNS, _city_row), ('asn', ASN_COLUMNS, _asn_row)):
+            tables[name] = cls._load_table(readers.path(name), cache_dir, columns, extract)
+        return cls(tables['city'], tables['asn'], readers)
+
+    @staticmethod
+    def _load_table(path: str, cache_dir: str, columns, extract) -> IntervalTable:
+        database = maxminddb.open_database(path)
+        try:
+            # A new database build gets a new file name, so stale tables are never read
+            stat = os.stat(path)
+            cached = os.path.join(cache_dir, f"{os.path.basename(path)}.{database.metadata().build_epoch}."
+                                             f"{stat.st_size}.npz")
+            if os.path.exists(cached):
+                return IntervalTable.load(cached, columns)
+            print(f"Compiling {os.path.basename(path)} for bulk lookups, this happens once per database build")
+            table = IntervalTable.compile(database, columns, extract)
+        finally:
+            database.close()
+        table.save(cached)
+        return table
+
+    def lookup(self, ips: Iterable) -> Dict[str, Any]:
+        """
+        Look up many addresses at once.
+
+        Args:
+            ips: IP address strings, or an integer array of IPv4 addresses
+
+        Returns:
+            Dict[str, np.ndarray]: One array per field, in input order: city, country and
+                organization (None where unknown), latitude and longitude (NaN where unknown),
+                asn (0 where unknown)
+        """
+        addresses, others = self._parse(ips)
+        city_rows = self.city.find(addresses)
+        asn_rows = self.asn.find(addresses)
+        result = {name: self.city.values(name, city_rows) for name, _ in CITY_COLUMNS}
+        result.update((name, self.asn.values(name, asn_rows)) for name, _ in ASN_COLUMNS)
+
+        for position, ip in others:
+            record = self._lookup_one(ip)
+            for name, _ in CITY_COLUMNS + ASN_COLUMNS:
+                value = getattr(record, name)
+                if value is not None:
+                    result[name][position] = value
+                elif name in ('latitude', 'longitude'):
+                    result[name][position] = np.nan
+                elif name == 'asn':
+                    result[name][position] = 0
+                else:
+                    result[name][position] = None
+        return result
+
+    def _parse(self, ips: Iterable) -> Tuple[Any, List[Tuple[int, str]]]:
+        """Pack IPv4 addresses into an integer array; the rest is returned with its position"""
+        if np is not None and isinstance(ips, np.ndarray) and ips.dtype.kind in 'ui':
+            return ips.astype(np.uint32, copy=False), []
+        packed = []
+        others = []
+        for position, ip in enumerate(ips):
+            try:
+                packed.append(socket.inet_pton(socket.AF_INET, ip))
+            except (OSError, TypeError):
+                # 0.0.0.0 has no record, so the placeholder finds nothing
+                packed.append(b'\0\0\0\0')
+                others.append((position, ip))
+        return np.frombuffer(b''.join(packed), dtype='>u4').astype(np.uint32), others
+
+    def _lookup_one(self, ip: str) -> GeoRecord:
+        if self.readers is None:
+            return GeoRecord()
+        try:
+            return lookup_record(self.readers.city, self.readers.asn, ip)
+        except (ValueError, TypeError):
+            # Not an IP address
+            return GeoRecord()
+
+    def close(self) -> None:
+        if self.readers is not None:
+            self.readers.close()
@@ -1,29 +1,131 @@
 import logging
-from typing import List, Dict, Any, AsyncGenerator, Optional
+from typing import List, Dict, Any, AsyncGenerator, Optional, Tuple
 from geotraceroute.core.traceroute import Traceroute, Hop
-from geotraceroute.core.ip_info import IPInfoService, IPInfo
+from geotraceroute.core.ip_info import IPInfoService, IPInfo, UnavailableIPInfo
+from geotraceroute.core.rdns import ReverseResolver
+from geotraceroute.core.monitor import HopStatistics
+from geotraceroute.core.geoip_cache import GeoIPPrefixCache
+from geotraceroute.core.geoip_readers import GeoIPReaders
+from geotraceroute.core.overrides import OverrideTable
+from geotraceroute.core.redis_cache import RedisCache, default_redis_cache
+from geotraceroute.core.enrichment_cache import EnrichmentCache, GEO_FIELDS, SOURCE_NONE, SOURCE_GEOIP, SOURCE_IPINFO, SOURCE_UNAVAILABLE
 import asyncio
-import geoip2.database
 import os
 import ipaddress
 
 class DataProcessor:
-    def __init__(self, test_mode=False):
+    def __init__(self, test_mode=False, reverse_resolver: Optional[ReverseResolver] = None,
+                 enrich_concurrency: Optional[int] = None, enrich_deadline: Optional[float] = None,
+                 enrichment_cache: Optional[EnrichmentCache] = None, shared_cache: Optional[RedisCache] = None,
+                 geoip_readers: Optional[GeoIPReaders] = None, overrides: Optional[OverrideTable] = None):
         """Initialize the DataProcessor with GeoIP databases.
 
+        The databases are opened on first use, or by open(), and closed by close().
+
         Args:
             test_mode (bool): If True, do not load GeoIP databases (for testing)
+            reverse_resolver: Resolver for hop hostnames. Defaults to a shared
+                ReverseResolver, or none at all in test mode.
+            enrich_concurrency: Maximum number of hops enriched at once
+                (ENRICH_CONCURRENCY, default 16)
+            enrich_deadline: Seconds allowed for enriching a whole trace; hops
+                still pending are returned without geo data (ENRICH_DEADLINE, default 10)
+            enrichment_cache: Cache of per-IP lookup results, a new EnrichmentCache by default
+            shared_cache: Cache tier shared with other instances behind enrichment_cache,
+                the Redis tier configured by REDIS_URL by default
+            geoip_readers: GeoLite2 readers, a new GeoIPReaders configured by
+                GEOIP_DATA_DIR and GEOIP_MODE by default
+            overrides: Corrections consulted before GeoIP and IPInfo, read from
+                GEO_OVERRIDES_PATH by default
         """
         self.test_mode = test_mode
-        if not test_mode:
-            base_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data')
-            self.city_reader = geoip2.database.Reader(os.path.join(base_path, 'GeoLite2-City.mmdb'))
-            self.asn_reader = geoip2.database.Reader(os.path.join(base_path, 'GeoLite2-ASN.mmdb'))
-        else:
-            self.city_reader = None
-            self.asn_reader = None
-        
+        self.enrich_concurrency = enrich_concurrency or int(os.getenv('ENRICH_CONCURRENCY', '16'))
+        self.enrich_deadline = enrich_deadline if enrich_deadline is not None else float(os.getenv('ENRICH_DEADLINE', '10'))
+        self.geoip_readers = geoip_readers if geoip_readers is not None else GeoIPReaders()
+        self.overrides = overrides if overrides is not None else OverrideTable()
+        # Readers set directly, e.g. by tests, take the place of geoip_readers
+        self._city_reader = None
+        self._asn_reader = None
+
         self.ip_info_service = IPInfoService()
+        if reverse_resolver is None and not test_mode:
+            reverse_resolver = ReverseResolver()
+        self.reverse_resolver = reverse_resolver
+        self.enrichment_cache = enrichment_cache if enrichment_cache is not None else EnrichmentCache()
+        self.geoip_cache = GeoIPPrefixCache()
+        self.shared_cache = shared_cache if shared_cache is not None else default_redis_cache
+
+    @property
+    def city_reader(self):
+        if self._city_reader is not None or self.test_mode:
+            return self._city_reader
+        return self.geoip_readers.city
+
+    @city_reader.setter
+    def city_reader(self, reader):
+        self._city_reader = reader
+
+    @property
+    def asn_reader(self):
+        if self._asn_reader is not None or self.test_mode:
+            return self._asn_reader
+        return self.geoip_readers.asn
+
+    @asn_reader.setter
+    def asn_reader(self, reader):
+        self._asn_reader = reader
+
+    def open(self) -> None:
+        """Open the GeoIP databases and load the overrides now, so the first trace does not wait for them"""
+        if not self.test_mode:
+            self.geoip_readers.open()
+            self.overrides.reload()
+
+    def close(self) -> None:
+        """Close the GeoIP databases"""
+        self.geoip_readers.close()
+        self.geoip_cache.clear()
+
+    async def reload_geoip(self, force: bool = False) -> bool:
+        """
+        Swap in replaced GeoIP database files and drop what was derived from the old ones.
+
+        Args:
+            force: Reload even if the files look unchanged
+
+        Returns:
+            bool: Whether the databases were reloaded
+        """
+        if self.test_mode or not await self.geoip_readers.reload(force):
+            return False
+        # Shared entries are keyed by database version, so only the local caches need clearing
+        self.geoip_cache.clear()
+        self.enrichment_cache.clear_locations()
+        return True
+
+    async def reload_data(self, force: bool = False) -> Dict[str, bool]:
+        """
+        Reload the GeoIP databases and the overrides, each only if its files changed unless forced.
+
+        Returns:
+            Dict[str, bool]: Whether each was reloaded
+        """
+        return {"geoip": await self.reload_geoip(force), "overrides": self.overrides.reload(force)}
+
+    async def watch_data_files(self, interval: float) -> None:
+        """Reload the GeoIP databases and overrides whenever their files change, checking every ``interval`` seconds"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reload_data()
+            except Exception as e:
+                print(f"Data file check failed: {str(e)}")
+
+    @property
+    def _location_namespace(self) -> str:
+        """Shared cache namespace of geo fields, tied to the databases that produced them"""
+        version = self.geoip_readers.version
+        return f'location:{version}' if version else 'location'
 
     async def _enrich_hop_data(self, hop: Hop, include_reputation: bool = False, client_info: Dict[str, Any] = None) -> Dict[str, Any]:
         """
@@ -37,19 +139,7 @@ class DataProcessor:
         Returns:
             dict: Enriched hop data with geographical and network information
         """
-        result = {
-            "hop_number": hop.hop_number,
-            "ip": hop.ip,
-            "hostname": hop.hostname,
-            "rtt_ms": hop.rtt_ms,
-            "city": None,
-            "country": None,
-            "latitude": None,
-            "longitude": None,
-            "organization": None,
-            "asn": None,
-            "reputation_score": None
-        }
+        result = self._base_hop_data(hop)
         
         if hop.ip and not hop.ip.startswith('*'):
             try:
@@ -137,69 +227,28 @@ class DataProcessor:
                     if include_reputation:
                         result["reputation_score"] = 0.8
                 else:
-                    location_found = False
-                    
-                    # Try GeoIP database lookup
-                    try:
-                        # Get city/location data
-                        response = self.city_reader.city(hop.ip)
-                        if response.location.latitude and response.location.longitude:
-                            result.update({
-                                "city": response.city.name,
-                                "country": response.country.name,
-                                "latitude": response.location.latitude,
-                                "longitude": response.location.longitude
-                            })
-                            location_found = True
-                            
-                        # Get ASN/organization data
-                        asn_response = self.asn_reader.asn(hop.ip)
-                        result.update({
-                            "organization": asn_response.autonomous_system_organization,
-                            "asn": asn_response.autonomous_system_number
-                        })
-                    except Exception as e:
-                        print(f"GeoIP database lookup failed: {str(e)}")
-                    
-                    # If GeoIP lookup fails, try using IPInfo service
-                    if not location_found:
-                        try:
-                            print(f"Trying to query IP using IPInfo service: {hop.ip}")
-                            ip_info = await self.ip_info_service.get_ip_info(hop.ip)
-                            
-                            if ip_info.latitude and ip_info.longitude:
-                                result.update({
-                                    "city": ip_info.city,
-                                    "country": ip_info.country,
-                                    "latitude": ip_info.latitude,
-                                    "longitude": ip_info.longitude,
-                                    "organization": ip_info.org
-                                })
-                                location_found = True
-                        except Exception as e:
-                            print(f"IPInfo service lookup failed: {str(e)}")
-                    
-                    # For specific IP ranges, if there's still no location data, use static mapping table
-                    if not location_found:
-                        # Use simple IP prefix mapping logic
-                        if hop.ip.startswith('84.116.'):
-                            print(f"Using Ireland default location data for IP: {hop.ip}")
-                            result.update({
-                                "city": "Dublin",
-                                "country": "Ireland",
-                                "latitude": 53.3498,
-                                "longitude": -6.2603,
-                                "organization": "Aorta Network"
-                            })
+                    # One IPInfo lookup per hop serves both the location fallback and
+                    # the reputation score; when the score is needed anyway it is
+                    # started right away so it overlaps the GeoIP lookup
+                    ip_info = self._ip_info_once(hop.ip)
+                    hit, score = self.enrichment_cache.get_reputation(hop.ip) if include_reputation else (True, None)
+                    if not hit:
+                        ip_info()
+
+                    result.update(await self._find_location(hop.ip, ip_info))
                     
                     # Get reputation score
                     if include_reputation:
-                        try:
-                            ip_info = await self.ip_info_service.get_ip_info(hop.ip)
-                            result["reputation_score"] = ip_info.reputation_score
-                        except:
-                            # If IPInfo fails, keep reputation_score as None
-                            pass
+                        if not hit:
+                            try:
+                                info = await ip_info()
+                                score = info.reputation_score
+                                if not isinstance(info, UnavailableIPInfo):
+                                    self.enrichment_cache.put_reputation(hop.ip, score)
+                            except:
+                                # If IPInfo fails, keep reputation_score as None
+                                pass
+                        result["reputation_score"] = score
                         
             except Exception as e:
                 print(f"Error enriching hop data: {str(e)}")
@@ -208,6 +257,216 @@ class DataProcessor:
             
         return result
 
+    def _ip_info_once(self, ip: str, refresh: bool = False):
+        """
+        Build the IPInfo lookup of one hop, started on first use and shared afterwards.
+
+        Args:
+            ip: IP address
+            refresh: Ask the API again instead of using cached IPInfo answers
+
+        Returns:
+            Callable[[], asyncio.Future]: Returns the same pending or finished lookup on every call
+        """
+        lookup = None
+
+        def get():
+            nonlocal lookup
+            if lookup is None:
+                lookup = asyncio.ensure_future(self.ip_info_service.get_ip_info(ip, refresh=refresh))
+            return lookup
+        return get
+
+    async def _find_location(self, ip: str, ip_info_lookup=None) -> Dict[str, Any]:
+        """Get the geo fields of a public IP, applying the most specific override covering it"""
+        override = self.overrides.lookup(ip)
+        if override is not None and override.located:
+            # The override's location stands in for GeoIP and IPInfo; only the
+            # local ASN database fills in what it leaves out
+            fields = dict.fromkeys(GEO_FIELDS)
+            if 'organization' not in override.fields or 'asn' not in override.fields:
+                record = self.geoip_cache.locate(None, self.asn_reader, ip)
+                fields.update(organization=record.organization, asn=record.asn)
+            fields.update(override.fields)
+            return fields
+        fields = await self._cached_location(ip, ip_info_lookup)
+        if override is not None:
+            fields.update(override.fields)
+        return fields
+
+    async def _cached_location(self, ip: str, ip_info_lookup=None) -> Dict[str, Any]:
+        """Get the geo fields of a public IP from the local cache, the shared cache or a lookup"""
+        cached = self.enrichment_cache.get(ip)
+        if cached is not None:
+            return cached
+        shared = await self.shared_cache.get(self._location_namespace, ip)
+        if shared is not None:
+            self._cache_shared_location(ip, shared)
+            return shared
+        fields, source = await self._lookup_location(ip, ip_info_lookup)
+        await self._cache_location(ip, fields, source)
+        return fields
+
+    async def refresh_location(self, ip: str) -> Dict[str, Any]:
+        """
+        Look up an IP again, ignoring every cached answer including a negative one.
+
+        Args:
+            ip: IP address
+
+        Returns:
+            Dict[str, Any]: The fresh GEO_FIELDS, which replace the cached ones
+        """
+        self.enrichment_cache.forget(ip)
+        fields, source = await self._lookup_location(ip, self._ip_info_once(ip, refresh=True))
+        # A forced lookup starts the negative backoff over
+        await self._cache_location(ip, fields, source, strikes=1 if source == SOURCE_NONE else None)
+        return fields
+
+    async def _cache_location(self, ip: str, fields: Dict[str, Any], source: str, strikes: Optional[int] = None) -> None:
+        """Keep a lookup's geo fields locally and in the shared cache, for as long as the local cache does"""
+        if source == SOURCE_UNAVAILABLE:
+            # A failed lookup is tried again by the next hop rather than remembered as empty
+            return
+        ttl = self.enrichment_cache.put(ip, fields, source, strikes)
+        shared = dict(fields, source=source)
+        if source == SOURCE_NONE:
+            shared['strikes'] = self.enrichment_cache.negative_strikes(ip)
+        await self.shared_cache.set_many(self._location_namespace, {ip: shared}, ttl)
+
+    def _cache_shared_location(self, ip: str, fields: Dict[str, Any]) -> None:
+        """Keep geo fields read from the shared cache locally, removing its bookkeeping keys"""
+        source = fields.pop('source')
+        self.enrichment_cache.put(ip, fields, source, fields.pop('strikes', None))
+
+    async def _prefetch_locations(self, hops: List[Hop]) -> None:
+        """Load the shared cache's geo fields for a trace's public hops in one round trip"""
+        if self.test_mode or not self.shared_cache.enabled:
+            return
+        missing = []
+        for hop in hops:
+            if not hop.ip or hop.hop_number == 1 or hop.ip in self.enrichment_cache:
+                continue
+            try:
+                if ipaddress.ip_address(hop.ip).is_private:
+                    continue
+            except ValueError:
+                continue
+            missing.append(hop.ip)
+        for ip, fields in (await self.shared_cache.get_many(self._location_namespace, missing)).items():
+            self._cache_shared_location(ip, fields)
+
+    async def _lookup_location(self, ip: str, ip_info_lookup=None) -> Tuple[Dict[str, Any], str]:
+        """
+        Look up the geographical and network data of a public IP.
+
+        Args:
+            ip: IP address
+            ip_info_lookup: The hop's shared IPInfo lookup from _ip_info_once, made here when omitted
+
+        Returns:
+            Tuple[Dict[str, Any], str]: The GEO_FIELDS found and the source they came from;
+                SOURCE_UNAVAILABLE when nothing was found because IPInfo could not answer
+        """
+        result = {name: None for name in GEO_FIELDS}
+        source = SOURCE_NONE
+        unavailable = False
+        
+        # Try GeoIP database lookup, answered per network by the prefix cache
+        try:
+            record = self.geoip_cache.locate(self.city_reader, self.asn_reader, ip)
+            if record.latitude and record.longitude:
+                result.update(city=record.city, country=record.country,
+                              latitude=record.latitude, longitude=record.longitude)
+                source = SOURCE_GEOIP
+            result.update(organization=record.organization, asn=record.asn)
+        except Exception as e:
+            print(f"GeoIP database lookup failed: {str(e)}")
+        
+        # If GeoIP lookup fails, try using IPInfo service
+        if source == SOURCE_NONE:
+            try:
+                print(f"Trying to query IP using IPInfo service: {ip}")
+                ip_info = await (ip_info_lookup or self._ip_info_once(ip))()
+                
+                if isinstance(ip_info, UnavailableIPInfo):
+                    unavailable = True
+                elif ip_info.latitude and ip_info.longitude:
+                    result.update({
+                        "city": ip_info.city,
+                        "country": ip_info.country,
+                        "latitude": ip_info.latitude,
+                        "longitude": ip_info.longitude,
+                        "organization": ip_info.org
+                    })
+                    source = SOURCE_IPINFO
+            except Exception as e:
+                print(f"IPInfo service lookup failed: {str(e)}")
+                unavailable = True
+
+
+        if source == SOURCE_NONE and unavailable:
+            source = SOURCE_UNAVAILABLE
+        
+        return result, source
+
+    def _base_hop_data(self, hop: Hop) -> Dict[str, Any]:
+        """Hop data without any geographical or network information"""
+        return {
+            "hop_number": hop.hop_number,
+            "ip": hop.ip,
+            "hostname": hop.hostname,
+            "rtt_ms": hop.rtt_ms,
+            "city": None,
+            "country": None,
+            "latitude": None,
+            "longitude": None,
+            "organization": None,
+            "asn": None,
+            "reputation_score": None,
+            "inferred": hop.inferred
+        }
+
+    async def _enrich_hops(self, hops: List[Hop], include_reputation: bool = False) -> List[Dict[str, Any]]:
+        """
+        Enrich all hops of a trace concurrently.
+
+        At most ``enrich_concurrency`` hops are looked up at once, and the
+        whole trace gets ``enrich_deadline`` seconds, so a trace takes about
+        as long as its slowest lookup rather than the sum of them.
+
+        Args:
+            hops: Hops to enrich
+            include_reputation: Whether to include reputation score
+
+        Returns:
+            List[Dict[str, Any]]: Enriched hops in hop order; hops not finished
+                by the deadline keep only their traceroute data
+        """
+        if not hops:
+            return []
+        await self._prefetch_locations(hops)
+        semaphore = asyncio.Semaphore(self.enrich_concurrency)
+
+        async def enrich(hop):
+            async with semaphore:
+                return await self._enrich_hop_data(hop, include_reputation)
+
+        tasks = [asyncio.ensure_future(enrich(hop)) for hop in hops]
+        done, pending = await asyncio.wait(tasks, timeout=self.enrich_deadline)
+        if pending:
+            print(f"Enrichment deadline reached with {len(pending)} hops pending")
+            for task in pending:
+                task.cancel()
+
+        enriched = []
+        for hop, task in zip(hops, tasks):
+            if task in done and task.exception() is None:
+                enriched.append(task.result())
+            else:
+                enriched.append(self._base_hop_data(hop))
+        return enriched
+
     async def process_traceroute_stream(self, tracer: Traceroute, include_reputation: bool = False) -> AsyncGenerator[Dict[str, Any], None]:
         """
         Process traceroute results as they arrive.
@@ -217,10 +476,138 @@ class DataProcessor:
             include_reputation: Whether to include reputation scores
             
         Yields:
-            dict: Enriched hop data with geographical and network information
+            dict: Enriched hop data with geographical and network information.
+                Hostnames that were not already cached arrive later as separate
+                {"type": "hostname", "hop_number", "ip", "hostname"} events, so
+                PTR lookups never delay a hop's RTT and geo data.
         """
-        async for hop in tracer.run_stream():
-            yield await self._enrich_hop_data(hop, include_reputation)
+        # Probing and enrichment are pipelined: a reader task keeps draining the
+        # trace and starts each hop's enrichment at once, while hops are emitted
+        # here in order. The bounded queue stops the reader when the consumer
+        # falls behind, so at most enrich_concurrency hops are buffered.
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.enrich_concurrency)
+        reader = asyncio.ensure_future(self._read_hops(tracer, queue, include_reputation))
+        pending = []
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                hop, enrichment = item
+                enriched = await enrichment
+                lookup = self._start_hostname_lookup(hop, enriched)
+                if lookup:
+                    pending.append(lookup)
+                yield enriched
+                for update in self._completed_hostname_lookups(pending):
+                    yield update
+            # Surface errors from the trace itself
+            await reader
+
+            if pending:
+                await asyncio.wait([task for _, _, task in pending])
+                for update in self._completed_hostname_lookups(pending):
+                    yield update
+        finally:
+            reader.cancel()
+            while not queue.empty():
+                item = queue.get_nowait()
+                if item is not None:
+                    item[1].cancel()
+            for _, _, task in pending:
+                task.cancel()
+
+    async def _read_hops(self, tracer: Traceroute, queue: asyncio.Queue, include_reputation: bool) -> None:
+        """Drain a trace into the queue as (hop, enrichment task) pairs, ending with None"""
+        hops = tracer.run_stream()
+        try:
+            async for hop in hops:
+                enrichment = asyncio.ensure_future(self._enrich_hop_data(hop, include_reputation))
+                try:
+                    await queue.put((hop, enrichment))
+                except asyncio.CancelledError:
+                    enrichment.cancel()
+                    raise
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Wake the consumer, which then raises the error from this task
+            await queue.put(None)
+            raise
+        finally:
+            await hops.aclose()
+        await queue.put(None)
+
+    def _start_hostname_lookup(self, hop: Hop, enriched: Dict[str, Any]):
+        """
+        Fill the hostname from the reverse DNS cache or start a lookup for it.
+
+        Returns:
+            Optional[tuple]: (hop_number, ip, task) for a lookup still in flight
+        """
+        if self.reverse_resolver is None or not hop.ip or hop.hostname:
+            return None
+        hit, hostname = self.reverse_resolver.cached(hop.ip)
+        if hit:
+            enriched["hostname"] = hostname
+            return None
+        return hop.hop_number, hop.ip, asyncio.ensure_future(self.reverse_resolver.resolve(hop.ip))
+
+    def _completed_hostname_lookups(self, pending: list) -> List[Dict[str, Any]]:
+        """Remove finished lookups from pending and build update events for the names found"""
+        updates = []
+        for lookup in [lookup for lookup in pending if lookup[2].done()]:
+            pending.remove(lookup)
+            hop_number, ip, task = lookup
+            hostname = task.result()
+            if hostname:
+                updates.append({"type": "hostname", "hop_number": hop_number, "ip": ip, "hostname": hostname})
+        return updates
+
+    async def process_monitor_stream(self, tracer: Traceroute, interval: float = 1.0, rounds: Optional[int] = None,
+                                     include_reputation: bool = False) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Monitor a path continuously and stream per-round statistics.
+
+        Each hop keeps constant-memory rolling statistics. Geographic data is
+        looked up only when a hop's responding IP changes and is sent once
+        with that round's delta instead of on every round.
+
+        Args:
+            tracer: Traceroute instance to re-probe
+            interval: Minimum seconds between rounds
+            rounds: Number of rounds, None to monitor until the tracer is stopped
+            include_reputation: Whether to include reputation scores
+
+        Yields:
+            dict: {"round", "hops", "removed_hops"} where each hop carries its
+                statistics and, when its IP changed, its enriched data
+        """
+        statistics: Dict[int, HopStatistics] = {}
+        round_number = 0
+        async for hops in tracer.run_rounds(interval=interval, rounds=rounds):
+            round_number += 1
+            deltas = []
+            for hop in hops:
+                stats = statistics.get(hop.hop_number)
+                if stats is None:
+                    stats = statistics[hop.hop_number] = HopStatistics(hop.hop_number)
+                ip_changed = stats.add_round(hop.ip, hop.rtt_ms, tracer.retries)
+                delta = stats.to_dict()
+                if ip_changed:
+                    enriched = await self._enrich_hop_data(hop, include_reputation)
+                    for key, value in enriched.items():
+                        if key not in ("hop_number", "ip", "rtt_ms"):
+                            delta[key] = value
+                deltas.append(delta)
+
+            # Hops beyond the end of this round's path are no longer part of it
+            last_hop = max((hop.hop_number for hop in hops), default=0)
+            removed = sorted(number for number in statistics if number > last_hop)
+            for number in removed:
+                del statistics[number]
+
+            yield {"round": round_number, "hops": deltas, "removed_hops": removed}
 
     async def process_traceroute(self, tracer: Traceroute, include_reputation: bool = False) -> Dict[str, Any]:
         """
@@ -244,13 +631,22 @@ class DataProcessor:
             hops = await tracer.run()
             
         print(f"Retrieved {len(hops)} hops")
+
+        # Resolve hostnames for all hops at once while the hops are enriched
+        hostnames = None
+        if self.reverse_resolver is not None:
+            hostnames = asyncio.ensure_future(
+                self.reverse_resolver.resolve_many(hop.ip for hop in hops if hop.ip and not hop.hostname)
+            )
         
-        # Process individual hops
-        processed_hops = []
-        for hop in hops:
-            print(f"Processing hop {hop.hop_number}: {hop.ip}")
-            enriched = await self._enrich_hop_data(hop, include_reputation)
-            processed_hops.append(enriched)
+        # Process all hops at once
+        processed_hops = await self._enrich_hops(hops, include_reputation)
+
+        if hostnames is not None:
+            resolved = await hostnames
+            for enriched in processed_hops:
+                if not enriched["hostname"] and enriched["ip"] in resolved:
+                    enriched["hostname"] = resolved[enriched["ip"]]
             
         # Count successful hops (those with valid IPs)
         successful_hops = sum(1 for hop in hops if hop.ip is not None)
@@ -259,7 +655,8 @@ class DataProcessor:
             "target": tracer.target,
             "hops": processed_hops,
             "total_hops": len(hops),
-            "successful_hops": successful_hops
+            "successful_hops": successful_hops,
+            "stop_reason": tracer.stop_reason
         }
         
         print(f"Processing complete: {result}")
@@ -277,7 +674,7 @@ class DataProcessor:
             Dict containing enriched hop data
         """
         # Run traceroute
-        traceroute = Traceroute(target, max_hops=max_hops)
+        traceroute = await Traceroute.create(target, max_hops=max_hops)
         async for hop in traceroute.run_stream():
             if hop.ip:
                 # Skip local IP addresses
@@ -363,13 +760,4 @@ class DataProcessor:
             'total_hops': len(hops),
             'successful_hops': len([h for h in hops if h['ip_address']])
         }
-
-    def __del__(self):
-        """Cleanup database readers when object is destroyed."""
-        try:
-            if self.city_reader:
-                self.city_reader.close()
-            if self.asn_reader:
-                self.asn_reader.close()
-        except:
-            pass 
\ No newline at end of file
+ 
\ No newline at end of file
@@ -0,0 +1,225 @@
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# Fields of an enriched hop that depend only on its IP
+GEO_FIELDS = ('city', 'country', 'latitude', 'longitude', 'organization', 'asn')
+
+# Where a hop's geo fields came from; each source has its own freshness
+SOURCE_GEOIP = 'geoip'
+SOURCE_IPINFO = 'ipinfo'
+SOURCE_NONE = 'none'
+# Nothing found because a lookup failed (IPInfo down or rate limited); never cached
+SOURCE_UNAVAILABLE = 'unavailable'
+
+DEFAULT_TTLS = {
+    SOURCE_GEOIP: 86400.0,   # changes only when the database is updated
+    SOURCE_IPINFO: 3600.0,
+    SOURCE_NONE: 300.0,      # nothing found, first retry; later ones back off
+    'reputation': 3600.0,
+}
+
+_INTERNED = ('city', 'country', 'organization')
+
+
+class _Entry:
+    __slots__ = ('geo', 'expires_at', 'reputation', 'reputation_expires_at')
+
+    def __init__(self):
+        self.geo: Optional[Tuple] = None
+        self.expires_at = 0.0
+        self.reputation: Optional[float] = None
+        self.reputation_expires_at = 0.0
+
+
+class _Negative:
+    __slots__ = ('geo', 'expires_at', 'strikes')
+
+    def __init__(self):
+        self.geo: Optional[Tuple] = None
+        self.expires_at = 0.0
+        self.strikes = 0
+
+
+class EnrichmentCache:
+    """
+    Size-bounded LRU cache of per-IP enrichment results.
+
+    The same backbone routers appear in almost every trace, so their GeoIP,
+    ASN and IPInfo answers are kept and reused. Geo fields and reputation
+    scores expire separately, and geo fields expire according to the source
+    they came from. Repeated strings such as city, country and organization
+    names are interned so thousands of entries share one copy of each.
+
+    IPs without a location are remembered apart from the positive entries,
+    so they neither push useful entries out nor get pushed out by them.
+    Each time a lookup comes back empty again the negative entry lives
+    twice as long, from the SOURCE_NONE TTL up to ``negative_max_ttl``.
+    """
+    def __init__(self, max_entries: Optional[int] = None, ttls: Optional[Dict[str, float]] = None,
+                 negative_max_ttl: Optional[float] = None):
+        """
+        Args:
+            max_entries: Maximum number of cached IPs (ENRICH_CACHE_SIZE, default 10000),
+                applied to positive and negative entries separately
+            ttls: Seconds entries stay fresh per source, overriding DEFAULT_TTLS
+            negative_max_ttl: Longest time an IP stays known to have no location
+                (NEGATIVE_CACHE_MAX_TTL, default 21600)
+        """
+        self.max_entries = max_entries or int(os.getenv('ENRICH_CACHE_SIZE', '10000'))
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.negative_max_ttl = (negative_max_ttl if negative_max_ttl is not None
+                                 else float(os.getenv('NEGATIVE_CACHE_MAX_TTL', '21600')))
+        self._entries: 'OrderedDict[str, _Entry]' = OrderedDict()
+        self._negatives: 'OrderedDict[str, _Negative]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.negative_hits = 0
+
+    def _entry(self, ip: str, create: bool = False) -> Optional[_Entry]:
+        entry = self._entries.get(ip)
+        if entry is not None:
+            self._entries.move_to_end(ip)
+        elif create:
+            if len(self._entries) >= self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            entry = self._entries[ip] = _Entry()
+        return entry
+
+    def get(self, ip: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached geo fields of an IP.
+
+        Returns:
+            Optional[Dict[str, Any]]: The GEO_FIELDS, or None when missing or expired. An IP
+                known to have no location gets fields without a location, so it is not looked up again.
+        """
+        entry = self._entry(ip)
+        if entry is not None and entry.geo is not None:
+            if entry.expires_at >= time.monotonic():
+                self.hits += 1
+                return dict(zip(GEO_FIELDS, entry.geo))
+            entry.geo = None
+            self.expirations += 1
+        negative = self._negatives.get(ip)
+        if negative is not None and negative.expires_at >= time.monotonic():
+            self._negatives.move_to_end(ip)
+            self.negative_hits += 1
+            return dict(zip(GEO_FIELDS, negative.geo))
+        self.misses += 1
+        return None
+
+    def __contains__(self, ip: str) -> bool:
+        """Whether fresh geo fields are cached, without touching LRU order or counters"""
+        now = time.monotonic()
+        entry = self._entries.get(ip)
+        if entry is not None and entry.geo is not None and entry.expires_at >= now:
+            return True
+        negative = self._negatives.get(ip)
+        return negative is not None and negative.expires_at >= now
+
+    def put(self, ip: str, fields: Dict[str, Any], source: str, strikes: Optional[int] = None) -> float:
+        """
+        Cache the geo fields of an IP.
+
+        Args:
+            ip: IP address
+            fields: Enriched hop data; only GEO_FIELDS are kept
+            source: One of the SOURCE_* constants, selecting the TTL
+            strikes: For SOURCE_NONE, how many lookups in a row found nothing; by default
+                one more than already recorded for the IP
+
+        Returns:
+            float: Seconds the entry stays fresh
+        """
+        geo = tuple(
+            sys.intern(fields[name]) if name in _INTERNED and isinstance(fields.get(name), str) else fields.get(name)
+            for name in GEO_FIELDS
+        )
+        if source == SOURCE_NONE:
+            return self._put_negative(ip, geo, strikes)
+        self._negatives.pop(ip, None)
+        entry = self._entry(ip, create=True)
+        entry.geo = geo
+        entry.expires_at = time.monotonic() + self.ttls[source]
+        return self.ttls[source]
+
+    def _put_negative(self, ip: str, geo: Tuple, strikes: Optional[int]) -> float:
+        entry = self._entries.get(ip)
+        if entry is not None:
+            entry.geo = None
+        negative = self._negatives.get(ip)
+        if negative is None:
+            if len(self._negatives) >= self.max_entries:
+                self._negatives.popitem(last=False)
+                self.evictions += 1
+            negative = self._negatives[ip] = _Negative()
+        else:
+            self._negatives.move_to_end(ip)
+        # Strikes survive expiry, so an IP that keeps coming back empty is retried less and less often
+        negative.strikes = strikes if strikes is not None else negative.strikes + 1
+        negative.geo = geo
+        ttl = min(self.negative_max_ttl, self.ttls[SOURCE_NONE] * 2 ** max(0, negative.strikes - 1))
+        negative.expires_at = time.monotonic() + ttl
+        return ttl
+
+    def negative_strikes(self, ip: str) -> int:
+        """How many lookups in a row found no location for an IP"""
+        negative = self._negatives.get(ip)
+        return negative.strikes if negative is not None else 0
+
+    def forget(self, ip: str) -> None:
+        """Drop everything cached for an IP, including its negative entry and reputation"""
+        self._entries.pop(ip, None)
+        self._negatives.pop(ip, None)
+
+    def get_reputation(self, ip: str) -> Tuple[bool, Optional[float]]:
+        """
+        Return the cached reputation score of an IP.
+
+        Returns:
+            Tuple[bool, Optional[float]]: (hit, score)
+        """
+        entry = self._entry(ip)
+        if entry is None or entry.reputation_expires_at < time.monotonic():
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        return True, entry.reputation
+
+    def put_reputation(self, ip: str, score: Optional[float]) -> None:
+        """Cache a reputation score; a missing score is retried after the SOURCE_NONE TTL"""
+        entry = self._entry(ip, create=True)
+        entry.reputation = score
+        ttl = self.ttls['reputation'] if score is not None else self.ttls[SOURCE_NONE]
+        entry.reputation_expires_at = time.monotonic() + ttl
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring the cache"""
+        return {
+            "size": len(self._entries),
+            "negative_size": len(self._negatives),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def clear_locations(self) -> None:
+        """Forget all geo fields, positive and negative, keeping reputation scores"""
+        for entry in self._entries.values():
+            entry.geo = None
+        self._negatives.clear()
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._negatives.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,208 @@
+import ipaddress
+import os
+from typing import Any, Callable, Dict, Optional, Tuple
+import geoip2.errors
+import maxminddb.reader
+from geotraceroute.core.prefix_trie import PrefixTrie
+
+try:
+    import maxminddb.extension
+    _RAW_READERS: Tuple[type, ...] = (maxminddb.reader.Reader, maxminddb.extension.Reader)
+except (ImportError, AttributeError):  # the C extension is optional
+    _RAW_READERS = (maxminddb.reader.Reader,)
+
+# Cached for networks the database has no record for
+_NOT_FOUND = object()
+
+
+class GeoRecord:
+    """The fields of an IP read from the City and ASN databases"""
+    __slots__ = ('city', 'country', 'latitude', 'longitude', 'organization', 'asn')
+
+    def __init__(self, city=None, country=None, latitude=None, longitude=None, organization=None, asn=None):
+        self.city = city
+        self.country = country
+        self.latitude = latitude
+        self.longitude = longitude
+        self.organization = organization
+        self.asn = asn
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f"GeoRecord({', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)})"
+
+
+def _raw_reader(reader):
+    """The maxminddb reader behind a geoip2 reader, or None when it is something else, e.g. a mock"""
+    raw = getattr(reader, '_db_reader', None)
+    return raw if isinstance(raw, _RAW_READERS) else None
+
+
+def _name(record: Optional[Dict]) -> Optional[str]:
+    return record['names'].get('en') if record and 'names' in record else None
+
+
+def _fetch_raw(raw, ip: str, extract: Callable[[Dict], Any], with_network: bool) -> Tuple[Any, Any]:
+    """Read the raw record of an address, building only the fields needed instead of geoip2 models"""
+    if with_network:
+        record, prefix_len = raw.get_with_prefix_len(ip)
+        network = ipaddress.ip_network((ip, prefix_len), strict=False)
+    else:
+        record, network = raw.get(ip), None
+    return (extract(record) if record is not None else _NOT_FOUND), network
+
+
+def _city_fields(record: Dict) -> Tuple:
+    location = record.get('location') or {}
+    return _name(record.get('city')), _name(record.get('country')), location.get('latitude'), location.get('longitude')
+
+
+def _asn_fields(record: Dict) -> Tuple:
+    return record.get('autonomous_system_organization'), record.get('autonomous_system_number')
+
+
+def _fetch_city(reader, ip: str, with_network: bool = True) -> Tuple[Any, Any]:
+    """Query the city database, returning (fields or _NOT_FOUND, network)"""
+    raw = _raw_reader(reader)
+    if raw is not None:
+        return _fetch_raw(raw, ip, _city_fields, with_network)
+    try:
+        response = reader.city(ip)
+    except geoip2.errors.AddressNotFoundError as e:
+        return _NOT_FOUND, e.network
+    return (
+        response.city.name,
+        response.country.name,
+        response.location.latitude,
+        response.location.longitude,
+    ), response.traits.network
+
+
+def _fetch_asn(reader, ip: str, with_network: bool = True) -> Tuple[Any, Any]:
+    """Query the ASN database, returning (fields or _NOT_FOUND, network)"""
+    raw = _raw_reader(reader)
+    if raw is not None:
+        return _fetch_raw(raw, ip, _asn_fields, with_network)
+    try:
+        response = reader.asn(ip)
+    except geoip2.errors.AddressNotFoundError as e:
+        return _NOT_FOUND, e.network
+    return (response.autonomous_system_organization, response.autonomous_system_number), response.network
+
+
+def lookup_record(city_reader, asn_reader, ip: str) -> GeoRecord:
+    """
+    Look up an address in both databases without caching.
+
+    Args:
+        city_reader: GeoLite2 City reader, or None to skip it
+        asn_reader: GeoLite2 ASN reader, or None to skip it
+        ip: IP address
+
+    Returns:
+        GeoRecord: The fields found; those the databases have no record for are None
+    """
+    record = GeoRecord()
+    if city_reader is not None:
+        location = _fetch_city(city_reader, ip, with_network=False)[0]
+        if location is not _NOT_FOUND:
+            record.city, record.country, record.latitude, record.longitude = location
+    if asn_reader is not None:
+        network = _fetch_asn(asn_reader, ip, with_network=False)[0]
+        if network is not _NOT_FOUND:
+            record.organization, record.asn = network
+    return record
+
+
+class GeoIPPrefixCache:
+    """
+    Cache GeoLite2 answers per network instead of per IP.
+
+    A GeoLite2 record holds for the whole network it was found in, and the
+    reader reports that network with every answer. Answers are stored in a
+    longest-prefix-match trie under that network, so any later address in
+    the same network (typically the other routers of a provider's /24) is
+    answered without touching the database. Networks the database has no
+    record for are cached the same way.
+
+    Answers are read from the raw database record, so only the fields in
+    use are decoded into Python objects and no geoip2 model is built.
+    Readers without a raw record interface go through geoip2's models.
+    """
+    def __init__(self, max_networks: Optional[int] = None):
+        """
+        Args:
+            max_networks: Networks kept per database before the cache starts
+                over (GEOIP_CACHE_NETWORKS, default 65536)
+        """
+        self.max_networks = max_networks or int(os.getenv('GEOIP_CACHE_NETWORKS', '65536'))
+        self._city = PrefixTrie()
+        self._asn = PrefixTrie()
+        self.hits = 0
+        self.misses = 0
+
+    def city(self, reader, ip: str) -> Optional[Tuple[Optional[str], Optional[str], Optional[float], Optional[float]]]:
+        """
+        Look up an address in the city database.
+
+        Returns:
+            Optional[tuple]: (city, country, latitude, longitude), or None if the address is not in the database
+        """
+        return self._lookup(self._city, _fetch_city, reader, ip)
+
+    def asn(self, reader, ip: str) -> Optional[Tuple[Optional[str], Optional[int]]]:
+        """
+        Look up an address in the ASN database.
+
+        Returns:
+            Optional[tuple]: (organization, ASN), or None if the address is not in the database
+        """
+        return self._lookup(self._asn, _fetch_asn, reader, ip)
+
+    def locate(self, city_reader, asn_reader, ip: str) -> GeoRecord:
+        """
+        Look up an address in both databases.
+
+        Args:
+            city_reader: GeoLite2 City reader, or None to skip it
+            asn_reader: GeoLite2 ASN reader, or None to skip it
+            ip: IP address
+
+        Returns:
+            GeoRecord: The fields found; those the databases have no record for are None
+        """
+        record = GeoRecord()
+        location = self.city(city_reader, ip) if city_reader is not None else None
+        if location is not None:
+            record.city, record.country, record.latitude, record.longitude = location
+        network = self.asn(asn_reader, ip) if asn_reader is not None else None
+        if network is not None:
+            record.organization, record.asn = network
+        return record
+
+    def _lookup(self, trie: PrefixTrie, fetch: Callable, reader, ip: str) -> Any:
+        match = trie.lookup(ip)
+        if match is not None:
+            self.hits += 1
+            value = match[1]
+            return None if value is _NOT_FOUND else value
+
+        self.misses += 1
+        value, network = fetch(reader, ip)
+        self._store(trie, network, value)
+        return None if value is _NOT_FOUND else value
+
+    def _store(self, trie: PrefixTrie, network, value) -> None:
+        if not isinstance(network, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+            return
+        if len(trie) >= self.max_networks:
+            # Bulk jobs move between regions, so starting over is as good as finer eviction
+            trie.clear()
+        trie.insert(network, value)
+
+    def clear(self) -> None:
+        """Forget all answers, e.g. after the databases were replaced"""
+        self._city.clear()
+        self._asn.clear()
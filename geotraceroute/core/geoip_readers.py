@@ -0,0 +1,205 @@
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+import geoip2.database
+import maxminddb
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data')
+
+DATABASES = {
+    'city': 'GeoLite2-City.mmdb',
+    'asn': 'GeoLite2-ASN.mmdb',
+}
+
+# How a database file is opened. The memory mapped modes share the file's
+# pages through the OS page cache, so every worker of a multi-worker server
+# reads the same copy; 'memory' gives each process its own copy.
+OPEN_MODES = {
+    'auto': maxminddb.MODE_AUTO,        # C extension with mmap when available, else pure Python mmap
+    'mmap_ext': maxminddb.MODE_MMAP_EXT,
+    'mmap': maxminddb.MODE_MMAP,
+    'file': maxminddb.MODE_FILE,        # read with seeks, the smallest footprint and the slowest lookups
+    'memory': maxminddb.MODE_MEMORY,    # whole file read into the process heap
+}
+
+
+class GeoIPReaders:
+    """
+    GeoLite2 City and ASN readers, opened on first use and closed explicitly.
+
+    Nothing is opened when the object is created, so importing the app is
+    cheap and a missing database only matters once a lookup needs it. The
+    app opens the readers in its startup hook so the first trace does not
+    pay for it, and closes them at shutdown.
+
+    When the files are replaced, reload() opens the new ones in a worker
+    thread and swaps them in with a single assignment. Lookups never hold a
+    reader across an await, so nothing is reading the old readers once the
+    swap is done; they are still closed only after ``close_grace`` seconds,
+    for lookups made from other threads.
+    """
+    def __init__(self, data_dir: Optional[str] = None, mode: Optional[str] = None, close_grace: float = 5.0):
+        """
+        Args:
+            data_dir: Directory holding the .mmdb files (GEOIP_DATA_DIR, default data/)
+            mode: One of OPEN_MODES (GEOIP_MODE, default 'auto')
+            close_grace: Seconds replaced readers stay open after a reload
+        """
+        self.data_dir = data_dir or os.getenv('GEOIP_DATA_DIR') or DEFAULT_DATA_DIR
+        self.mode = mode or os.getenv('GEOIP_MODE', 'auto')
+        if self.mode not in OPEN_MODES:
+            raise ValueError(f"Unknown GeoIP open mode {self.mode!r}, expected one of {', '.join(OPEN_MODES)}")
+        self.close_grace = close_grace
+        self._readers: Dict[str, geoip2.database.Reader] = {}
+        # Identity of each open file, to notice when it is replaced
+        self._signatures: Dict[str, Tuple] = {}
+        # Databases that failed to open, with the error, so they are not retried on every lookup
+        self._errors: Dict[str, str] = {}
+        self.open_seconds: Dict[str, float] = {}
+        self._reload_lock: Optional[asyncio.Lock] = None
+        # Build epochs of the open databases, changing whenever different data is served
+        self.version = ''
+        self.reloads = 0
+        self.last_reload: Optional[float] = None
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.data_dir, DATABASES[name])
+
+    def get(self, name: str) -> Optional[geoip2.database.Reader]:
+        """
+        Return the reader of a database, opening it if needed.
+
+        Args:
+            name: 'city' or 'asn'
+
+        Returns:
+            Optional[geoip2.database.Reader]: The reader, or None if the database cannot be opened
+        """
+        reader = self._readers.get(name)
+        if reader is None and name not in self._errors:
+            reader = self._open(name)
+        return reader
+
+    def _signature(self, name: str) -> Optional[Tuple]:
+        try:
+            stat = os.stat(self.path(name))
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def _open_reader(self, name: str) -> Tuple[geoip2.database.Reader, Optional[Tuple]]:
+        start = time.perf_counter()
+        # Taken first, so a file replaced while opening is noticed by the next check
+        signature = self._signature(name)
+        reader = geoip2.database.Reader(self.path(name), mode=OPEN_MODES[self.mode])
+        self.open_seconds[name] = time.perf_counter() - start
+        return reader, signature
+
+    def _open(self, name: str) -> Optional[geoip2.database.Reader]:
+        try:
+            reader, signature = self._open_reader(name)
+        except (OSError, maxminddb.InvalidDatabaseError) as e:
+            print(f"GeoIP {name} database unavailable, continuing without it: {str(e)}")
+            self._errors[name] = str(e)
+            return None
+        self._readers[name] = reader
+        self._signatures[name] = signature
+        self._update_version()
+        return reader
+
+    def _open_all(self) -> Dict[str, Tuple[geoip2.database.Reader, Optional[Tuple]]]:
+        opened = {}
+        try:
+            for name in DATABASES:
+                opened[name] = self._open_reader(name)
+        except BaseException:
+            self._close_readers({name: reader for name, (reader, _) in opened.items()})
+            raise
+        return opened
+
+    def _update_version(self) -> None:
+        self.version = '-'.join(str(self._readers[name].metadata().build_epoch) for name in sorted(self._readers))
+
+    @property
+    def city(self) -> Optional[geoip2.database.Reader]:
+        return self.get('city')
+
+    @property
+    def asn(self) -> Optional[geoip2.database.Reader]:
+        return self.get('asn')
+
+    def open(self) -> None:
+        """Open every database now instead of on first use"""
+        for name in DATABASES:
+            self.get(name)
+
+    def changed(self) -> bool:
+        """Whether a database file differs from the one open, or a database that failed to open now exists"""
+        for name in DATABASES:
+            signature = self._signature(name)
+            if signature is None:
+                # Missing, or being replaced right now
+                continue
+            if name in self._readers and signature != self._signatures.get(name):
+                return True
+            if name in self._errors:
+                return True
+        return False
+
+    async def reload(self, force: bool = False) -> bool:
+        """
+        Open the database files again and swap the new readers in.
+
+        Args:
+            force: Reload even if the files look unchanged
+
+        Returns:
+            bool: Whether new readers were swapped in; on failure the current ones are kept
+        """
+        if self._reload_lock is None:
+            self._reload_lock = asyncio.Lock()
+        async with self._reload_lock:
+            if not force and not self.changed():
+                return False
+            try:
+                # Opening reads the metadata, or the whole file in memory mode, so keep it off the event loop
+                opened = await asyncio.to_thread(self._open_all)
+            except (OSError, maxminddb.InvalidDatabaseError) as e:
+                print(f"GeoIP reload failed, keeping the current databases: {str(e)}")
+                return False
+            old = self._readers
+            self._readers = {name: reader for name, (reader, _) in opened.items()}
+            self._signatures = {name: signature for name, (_, signature) in opened.items()}
+            self._errors = {}
+            self._update_version()
+            self.reloads += 1
+            self.last_reload = time.time()
+        asyncio.get_running_loop().call_later(self.close_grace, self._close_readers, old)
+        print(f"GeoIP databases reloaded ({self.version})")
+        return True
+
+    @staticmethod
+    def _close_readers(readers: Dict[str, geoip2.database.Reader]) -> None:
+        for reader in readers.values():
+            reader.close()
+
+    def close(self) -> None:
+        """Close the open readers; later lookups open them again"""
+        readers, self._readers = self._readers, {}
+        self._signatures = {}
+        self._errors.clear()
+        self.version = ''
+        self._close_readers(readers)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "data_dir": self.data_dir,
+            "open": sorted(self._readers),
+            "errors": dict(self._errors),
+            "open_ms": {name: round(seconds * 1000, 3) for name, seconds in self.open_seconds.items()},
+            "version": self.version,
+            "reloads": self.reloads,
+            "last_reload": self.last_reload,
+        }
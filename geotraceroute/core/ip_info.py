@@ -1,10 +1,13 @@
 import os
 import requests
 import aiohttp
-from typing import Dict, Optional
-from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+from dataclasses import dataclass, asdict
 from dotenv import load_dotenv
 import asyncio
+import sqlite3
+from geotraceroute.core.redis_cache import default_redis_cache
+from geotraceroute.core.resilience import TokenBucket, CircuitBreaker, backoff_delay
 
 load_dotenv()
 
@@ -18,11 +21,63 @@ class IPInfo:
     org: Optional[str]
     reputation_score: Optional[float]
 
+class UnavailableIPInfo(IPInfo):
+    """
+    Empty IPInfo returned when the API could not be asked or did not answer:
+    an open circuit breaker, the rate limit, a retryable status or a timeout.
+    Unlike an empty answer it says nothing about the IP, so it is never cached.
+    """
+    def __init__(self, ip: str):
+        super().__init__(ip=ip, country=None, city=None, latitude=None, longitude=None, org=None,
+                         reputation_score=None)
+
+# Statuses worth retrying after a backoff
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
 class IPInfoService:
-    def __init__(self):
+    def __init__(self, store=None, shared_cache=None, base_url: Optional[str] = None,
+                 batch_window: Optional[float] = None, batch_size: Optional[int] = None,
+                 limiter: Optional[TokenBucket] = None, breaker: Optional[CircuitBreaker] = None,
+                 max_retries: Optional[int] = None):
+        """
+        Args:
+            store: Persistent result cache shared with other processes. Defaults
+                to an IPInfoStore at IPINFO_CACHE_PATH; set that to an empty
+                string to disable it.
+            shared_cache: Cache tier shared with other instances, checked after
+                the store; the Redis tier configured by REDIS_URL by default
+            base_url: API root (IPINFO_BASE_URL, default https://ipinfo.io)
+            batch_window: Seconds lookups from all traces are collected before they
+                go out as one batch request (IPINFO_BATCH_WINDOW, default 0.01);
+                0 sends every lookup on its own. Batching needs an API key.
+            batch_size: Lookups that send a batch at once (IPINFO_BATCH_SIZE, default 100); a batch
+                is charged one token per lookup, so it is never larger than the limiter's burst
+            limiter: Rate limiter sized to the plan quota, IPINFO_RATE lookups per second
+                (default 10) with bursts of IPINFO_BURST (default 20) by default
+            breaker: Circuit breaker opening after IPINFO_BREAKER_THRESHOLD consecutive
+                failures (default 5) for IPINFO_BREAKER_RESET seconds (default 30)
+            max_retries: Retries of a request that got a retryable status (IPINFO_MAX_RETRIES, default 2)
+        """
         # No longer getting API key from environment variables, default is None
         self._api_key = None
         self._session = None
+        self._store = store
+        self._store_disabled = store is None and os.getenv('IPINFO_CACHE_PATH') == ''
+        # ip -> upstream request in flight, shared by every caller asking for that IP
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.shared_cache = shared_cache if shared_cache is not None else default_redis_cache
+        self.shared_ttl = float(os.getenv('IPINFO_CACHE_TTL', '86400'))
+        self.base_url = (base_url or os.getenv('IPINFO_BASE_URL', 'https://ipinfo.io')).rstrip('/')
+        self.batch_window = batch_window if batch_window is not None else float(os.getenv('IPINFO_BATCH_WINDOW', '0.01'))
+        self.batch_size = batch_size or int(os.getenv('IPINFO_BATCH_SIZE', '100'))
+        # ip -> future of a lookup waiting for the next batch
+        self._batch: Dict[str, asyncio.Future] = {}
+        self._batch_timer = None
+        self.round_trips = 0
+        self.limiter = limiter or TokenBucket(float(os.getenv('IPINFO_RATE', '10')), float(os.getenv('IPINFO_BURST', '20')))
+        self.breaker = breaker or CircuitBreaker(int(os.getenv('IPINFO_BREAKER_THRESHOLD', '5')),
+                                                 float(os.getenv('IPINFO_BREAKER_RESET', '30')))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('IPINFO_MAX_RETRIES', '2'))
     
     @property
     def api_key(self):
@@ -37,46 +92,211 @@ class IPInfoService:
             self._session = aiohttp.ClientSession()
         return self._session
 
-    async def get_ip_info(self, ip: str) -> IPInfo:
+    def _get_store(self):
+        if self._store is None and not self._store_disabled:
+            from geotraceroute.core.ipinfo_store import IPInfoStore
+            self._store = IPInfoStore()
+        return None if self._store_disabled else self._store
+
+    def _store_call(self, method: str, *args):
+        """Call the persistent cache, turning it off for this process if it fails"""
+        store = self._get_store()
+        if store is None:
+            return None
+        try:
+            return getattr(store, method)(*args)
+        except (sqlite3.Error, OSError) as e:
+            print(f"IPInfo cache unavailable, continuing without it: {str(e)}")
+            self._store_disabled = True
+            return None
+
+    async def _store_call_async(self, method: str, *args):
+        """Call the persistent cache in a worker thread, for batch reads and writes that may wait on SQLite"""
+        if self._get_store() is None:
+            return None
+        return await asyncio.to_thread(self._store_call, method, *args)
+
+    async def get_ip_info(self, ip: str, refresh: bool = False) -> IPInfo:
         """
-        Get IP information from API (async version).
+        Get IP information from the persistent cache or the API (async version).
         
         Args:
             ip: IP address to query
+            refresh: Skip the caches and ask the API, replacing the cached answer
             
         Returns:
             IPInfo: IP information including location and reputation
         """
-        # Fetch from API asynchronously
-        try:
-            headers = {}
-            if self._api_key:
-                headers['Authorization'] = f'Bearer {self._api_key}'
+        if refresh:
+            return await self._fetch_shared(ip)
+        cached = self._store_call('get', ip)
+        if cached is not None:
+            return cached
+        shared = await self.shared_cache.get('ipinfo', ip)
+        if shared is not None:
+            info = IPInfo(**shared)
+            await self._store_call_async('put', info)
+            return info
+        return await self._fetch_shared(ip)
 
-            session = await self._get_session()
-            async with session.get(
-                f'https://ipinfo.io/{ip}/json',
-                headers=headers,
-                timeout=5
-            ) as response:
-                if response.status != 200:
-                    raise Exception(f"API request failed with status {response.status}")
-                
-                data = await response.json()
-                return self._parse_ip_info(ip, data)
+    async def get_ip_info_many(self, ips: Iterable[str]) -> Dict[str, IPInfo]:
+        """
+        Get IP information for many IPs, reading the persistent cache once for all of them.
+        
+        Args:
+            ips: IP addresses to query
             
-        except Exception as e:  # Catch all exceptions
-            print(f"Error getting IP info for {ip}: {str(e)}")
+        Returns:
+            Dict[str, IPInfo]: IP information for each unique IP
+        """
+        unique = list(dict.fromkeys(ips))
+        found = await self._store_call_async('get_many', unique) or {}
+        missing = [ip for ip in unique if ip not in found]
+        shared = await self.shared_cache.get_many('ipinfo', missing)
+        if shared:
+            infos = [IPInfo(**data) for data in shared.values()]
+            await self._store_call_async('put_many', infos)
+            found.update((info.ip, info) for info in infos)
+            missing = [ip for ip in missing if ip not in found]
+        for info in await asyncio.gather(*(self._fetch_shared(ip) for ip in missing)):
+            found[info.ip] = info
+        return found
+
+    async def _fetch_shared(self, ip: str) -> IPInfo:
+        """Join the upstream request already in flight for an IP, or start one"""
+        inflight = self._inflight.get(ip)
+        if inflight is None:
+            fetch = self._fetch_batched if self._api_key and self.batch_window > 0 else self._fetch_ip_info
+            inflight = asyncio.ensure_future(fetch(ip))
+            self._inflight[ip] = inflight
+            inflight.add_done_callback(lambda _: self._inflight.pop(ip, None))
+        # Shield so one cancelled trace does not cancel the request for the others
+        return await asyncio.shield(inflight)
+
+    async def _fetch_batched(self, ip: str) -> IPInfo:
+        """Queue a lookup for the next batch request and wait for its answer"""
+        loop = asyncio.get_running_loop()
+        future = self._batch.get(ip)
+        if future is None:
+            future = self._batch[ip] = loop.create_future()
+            if len(self._batch) >= min(self.batch_size, self.limiter.burst):
+                self._flush_batch()
+            elif self._batch_timer is None:
+                self._batch_timer = loop.call_later(self.batch_window, self._flush_batch)
+        return await future
+
+    def _flush_batch(self) -> None:
+        if self._batch_timer is not None:
+            self._batch_timer.cancel()
+            self._batch_timer = None
+        batch, self._batch = self._batch, {}
+        if batch:
+            asyncio.ensure_future(self._send_batch(batch))
+
+    async def _send_batch(self, batch: Dict[str, asyncio.Future]) -> None:
+        """Look up a batch with one request, falling back to single requests for whatever it misses"""
+        answers: Dict[str, IPInfo] = {}
+        data = await self._request('POST', f'{self.base_url}/batch', json=list(batch), tokens=len(batch))
+        if isinstance(data, dict):
+            for ip in batch:
+                entry = data.get(ip)
+                if isinstance(entry, dict) and 'error' not in entry:
+                    answers[ip] = self._parse_ip_info(ip, entry)
+
+        if answers:
+            await self._store_call_async('put_many', list(answers.values()))
+            await self.shared_cache.set_many('ipinfo', {ip: asdict(info) for ip, info in answers.items()}, self.shared_ttl)
+        missing: List[str] = [ip for ip in batch if ip not in answers]
+        for ip, info in zip(missing, await asyncio.gather(*(self._fetch_ip_info(ip) for ip in missing))):
+            answers[ip] = info
+        for ip, future in batch.items():
+            if not future.done():
+                future.set_result(answers[ip])
+
+    async def _request(self, method: str, url: str, json=None, tokens: int = 1):
+        """
+        Make one API request through the circuit breaker, rate limiter and retries.
+
+        Returns:
+            The decoded JSON body, or None if the request was refused or failed
+        """
+        if not self.breaker.allow():
+            return None
+        if not await self.limiter.acquire(tokens):
+            print("IPInfo rate limit reached, skipping lookup")
+            return None
+
+        headers = {}
+        if self._api_key:
+            headers['Authorization'] = f'Bearer {self._api_key}'
+        error = None
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                session = await self._get_session()
+                self.round_trips += 1
+                async with session.request(method, url, json=json, headers=headers, timeout=5) as response:
+                    if response.status == 200:
+                        data = await response.json()
+                        self.breaker.record_success()
+                        return data
+                    error = f"API request failed with status {response.status}"
+                    if response.status not in RETRYABLE_STATUSES:
+                        break
+                    retry_after = response.headers.get('Retry-After')
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                error = str(e) or type(e).__name__
+            if attempt < self.max_retries:
+                await asyncio.sleep(backoff_delay(attempt, retry_after=retry_after))
+
+        print(f"IPInfo request to {url} failed: {error}")
+        self.breaker.record_failure()
+        return None
+
+    async def compact_store(self) -> int:
+        """
+        Delete expired results from the persistent cache in a worker thread.
+
+        Returns:
+            int: Number of results deleted
+        """
+        store = self._get_store()
+        if store is None:
+            return 0
+        try:
+            return await asyncio.to_thread(store.compact)
+        except (sqlite3.Error, OSError) as e:
+            print(f"IPInfo cache compaction failed: {str(e)}")
+            return 0
+
+    async def compact_store_periodically(self, interval: float) -> None:
+        """Compact the persistent cache now and then every ``interval`` seconds"""
+        while True:
+            deleted = await self.compact_store()
+            if deleted:
+                print(f"Removed {deleted} expired IPInfo cache entries")
+            await asyncio.sleep(interval)
+
+    def status(self) -> Dict:
+        """Circuit breaker and rate limiter state, for monitoring"""
+        return {
+            "breaker": self.breaker.stats(),
+            "limiter": self.limiter.stats(),
+            "round_trips": self.round_trips,
+        }
+
+    async def _fetch_ip_info(self, ip: str) -> IPInfo:
+        """Query the API and keep successful answers in the persistent cache"""
+        # Fetch from API asynchronously; while the breaker is open this returns at once
+        data = await self._request('GET', f'{self.base_url}/{ip}/json')
+        if data is None:
             # If API fails, return minimal info
-            return IPInfo(
-                ip=ip,
-                country=None,
-                city=None,
-                latitude=None,
-                longitude=None,
-                org=None,
-                reputation_score=None
-            )
+            return UnavailableIPInfo(ip)
+
+        info = self._parse_ip_info(ip, data)
+        await self._store_call_async('put', info)
+        await self.shared_cache.set_many('ipinfo', {ip: asdict(info)}, self.shared_ttl)
+        return info
     
     # Backwards compatibility method - non-async version
     def get_ip_info_sync(self, ip: str) -> IPInfo:
@@ -96,7 +316,7 @@ class IPInfoService:
                 headers['Authorization'] = f'Bearer {self._api_key}'
 
             response = requests.get(
-                f'https://ipinfo.io/{ip}/json',
+                f'{self.base_url}/{ip}/json',
                 headers=headers,
                 timeout=5
             )
@@ -108,15 +328,7 @@ class IPInfoService:
         except Exception as e:  # Catch all exceptions
             print(f"Error getting IP info for {ip}: {str(e)}")
             # If API fails, return minimal info
-            return IPInfo(
-                ip=ip,
-                country=None,
-                city=None,
-                latitude=None,
-                longitude=None,
-                org=None,
-                reputation_score=None
-            )
+            return UnavailableIPInfo(ip)
 
     def _parse_ip_info(self, ip: str, data: Dict) -> IPInfo:
         """
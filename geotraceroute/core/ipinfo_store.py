@@ -0,0 +1,149 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict
+from typing import Dict, Iterable, Optional
+from geotraceroute.core.ip_info import IPInfo
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'ipinfo_cache.sqlite3')
+
+
+class IPInfoStore:
+    """
+    Persistent IPInfo cache in a SQLite file shared by processes.
+
+    The database runs in WAL mode so every uvicorn worker can read while
+    another writes, and the knowledge survives restarts. Lookups are
+    primary key reads on a WITHOUT ROWID table and take microseconds, so
+    single lookups are made directly on the event loop; batch reads and all
+    writes run in worker threads. Writes still give up almost at once when
+    another process holds the write lock, as the result is only a cache
+    entry. Each process opens its own connection on first use, which keeps
+    forked workers from sharing one; within a process the connection is
+    shared by threads under a lock.
+    """
+    # Opening the database and compacting it wait this long for a writer in another process
+    BUSY_TIMEOUT_MS = 2000
+    # Writes wait at most this long for another process, then are skipped
+    WRITE_TIMEOUT_MS = 10
+
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = None):
+        """
+        Args:
+            path: Database file (IPINFO_CACHE_PATH, default data/ipinfo_cache.sqlite3)
+            ttl: Seconds a result stays valid (IPINFO_CACHE_TTL, default 86400)
+        """
+        self.path = path or os.getenv('IPINFO_CACHE_PATH') or DEFAULT_PATH
+        self.ttl = ttl if ttl is not None else float(os.getenv('IPINFO_CACHE_TTL', '86400'))
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid = None
+        # Serializes use of the connection by the event loop and worker threads
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=self.BUSY_TIMEOUT_MS / 1000, isolation_level=None,
+                                     check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS ipinfo ('
+            'ip TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL'
+            ') WITHOUT ROWID'
+        )
+        return connection
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None or self._pid != os.getpid():
+            connection = self._open()
+            connection.execute(f'PRAGMA busy_timeout = {self.WRITE_TIMEOUT_MS}')
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, ip: str) -> Optional[IPInfo]:
+        """Return the stored result for an IP, None if missing or expired"""
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT data FROM ipinfo WHERE ip = ? AND expires_at > ?', (ip, time.time())
+            ).fetchone()
+        return IPInfo(**json.loads(row[0])) if row else None
+
+    def get_many(self, ips: Iterable[str]) -> Dict[str, IPInfo]:
+        """
+        Read the stored results of many IPs in one query.
+
+        Returns:
+            Dict[str, IPInfo]: Results for the IPs that are stored and fresh
+        """
+        unique = list(dict.fromkeys(ips))
+        found = {}
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            # Stay well below SQLite's limit on bound parameters
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = connection.execute(
+                    f'SELECT ip, data FROM ipinfo WHERE ip IN ({placeholders}) AND expires_at > ?', (*chunk, now)
+                ).fetchall()
+                for ip, data in rows:
+                    found[ip] = IPInfo(**json.loads(data))
+        return found
+
+    def put(self, info: IPInfo) -> bool:
+        """Store one result"""
+        return self.put_many([info])
+
+    def put_many(self, infos: Iterable[IPInfo]) -> bool:
+        """
+        Store several results in one transaction.
+
+        Returns:
+            bool: False if the write was skipped because another process held the write lock
+        """
+        expires_at = time.time() + self.ttl
+        rows = [(info.ip, json.dumps(asdict(info)), expires_at) for info in infos]
+        if not rows:
+            return True
+        try:
+            with self._lock:
+                connection = self._connect()
+                with connection:
+                    connection.execute('BEGIN IMMEDIATE')
+                    connection.executemany('INSERT OR REPLACE INTO ipinfo (ip, data, expires_at) VALUES (?, ?, ?)', rows)
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            return False
+        return True
+
+    def compact(self) -> int:
+        """
+        Delete expired results and give their space back to the file system.
+
+        Uses a connection of its own, so it can run in a worker thread.
+
+        Returns:
+            int: Number of results deleted
+        """
+        connection = self._open()
+        try:
+            deleted = connection.execute('DELETE FROM ipinfo WHERE expires_at <= ?', (time.time(),)).rowcount
+            connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            connection.execute('VACUUM')
+        finally:
+            connection.close()
+        return deleted
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connect().execute('SELECT COUNT(*) FROM ipinfo').fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
@@ -0,0 +1,98 @@
+import math
+from typing import Any, Dict, List, Optional
+
+
+class HopStatistics:
+    """
+    Rolling per-hop statistics for continuous monitoring, like mtr.
+
+    Every aggregate is updated in place as replies arrive (Welford's method
+    for mean and variance), so memory stays constant however long a path is
+    watched.
+    """
+    __slots__ = ('hop_number', 'ip', 'sent', 'received', 'last', 'best', 'worst',
+                 'mean', '_m2', 'jitter', '_jitter_count', '_previous')
+
+    def __init__(self, hop_number: int):
+        self.hop_number = hop_number
+        self.ip: Optional[str] = None
+        self.sent = 0
+        self.received = 0
+        self.last: Optional[float] = None
+        self.best: Optional[float] = None
+        self.worst: Optional[float] = None
+        self.mean = 0.0
+        self._m2 = 0.0
+        # Mean absolute difference between consecutive RTTs
+        self.jitter = 0.0
+        self._jitter_count = 0
+        self._previous: Optional[float] = None
+
+    def add_round(self, ip: Optional[str], rtts: Optional[List[float]], probes_sent: int) -> bool:
+        """
+        Fold one round of probes into the statistics.
+
+        Args:
+            ip: Address that answered this round, None if nothing did
+            rtts: RTTs of the probes that were answered
+            probes_sent: Number of probes sent to this hop in the round
+
+        Returns:
+            bool: True if the responding IP changed
+        """
+        rtts = rtts or []
+        self.sent += max(probes_sent, len(rtts))
+        for rtt in rtts:
+            self._add_rtt(rtt)
+        changed = ip is not None and ip != self.ip
+        if ip is not None:
+            self.ip = ip
+        return changed
+
+    def _add_rtt(self, rtt: float) -> None:
+        self.received += 1
+        self.last = rtt
+        self.best = rtt if self.best is None else min(self.best, rtt)
+        self.worst = rtt if self.worst is None else max(self.worst, rtt)
+        delta = rtt - self.mean
+        self.mean += delta / self.received
+        self._m2 += delta * (rtt - self.mean)
+        if self._previous is not None:
+            self._jitter_count += 1
+            self.jitter += (abs(rtt - self._previous) - self.jitter) / self._jitter_count
+        self._previous = rtt
+
+    @property
+    def loss_pct(self) -> float:
+        if not self.sent:
+            return 0.0
+        return 100.0 * (self.sent - self.received) / self.sent
+
+    @property
+    def avg(self) -> Optional[float]:
+        return self.mean if self.received else None
+
+    @property
+    def stddev(self) -> Optional[float]:
+        if not self.received:
+            return None
+        return math.sqrt(self._m2 / self.received)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Snapshot of the statistics, rounded for display"""
+        def ms(value):
+            return round(value, 3) if value is not None else None
+
+        return {
+            "hop_number": self.hop_number,
+            "ip": self.ip,
+            "sent": self.sent,
+            "received": self.received,
+            "loss_pct": round(self.loss_pct, 1),
+            "last_ms": ms(self.last),
+            "avg_ms": ms(self.avg),
+            "best_ms": ms(self.best),
+            "worst_ms": ms(self.worst),
+            "stddev_ms": ms(self.stddev),
+            "jitter_ms": ms(self.jitter) if self._jitter_count else None,
+        }
@@ -0,0 +1,186 @@
+import csv
+import hashlib
+import ipaddress
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from geotraceroute.core.enrichment_cache import GEO_FIELDS
+from geotraceroute.core.prefix_trie import PrefixTrie
+
+DEFAULT_OVERRIDES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'geo_overrides.csv')
+
+
+class Override:
+    """Corrected fields for one network, with the number of hops it answered"""
+    __slots__ = ('network', 'fields', 'hits')
+
+    def __init__(self, network, fields: Dict[str, Any]):
+        self.network = network
+        self.fields = fields
+        self.hits = 0
+
+    @property
+    def located(self) -> bool:
+        """Whether the override places the network on the map by itself"""
+        return self.fields.get('latitude') is not None and self.fields.get('longitude') is not None
+
+
+def _parse_fields(row: Dict[str, Any], where: str) -> Tuple[str, Dict[str, Any]]:
+    network = row.get('network')
+    if not network:
+        raise ValueError(f"{where}: missing network")
+    fields = {}
+    for name in GEO_FIELDS:
+        value = row.get(name)
+        if value is None or value == '':
+            continue
+        try:
+            if name in ('latitude', 'longitude'):
+                value = float(value)
+            elif name == 'asn':
+                value = int(str(value).upper().removeprefix('AS'))
+        except ValueError:
+            raise ValueError(f"{where}: invalid {name} {value!r}")
+        fields[name] = value
+    if not fields:
+        raise ValueError(f"{where}: no fields to override for {network}")
+    return network, fields
+
+
+def _read_rows(path: str) -> Tuple[List[Tuple[str, Dict[str, Any]]], str]:
+    """Read (network, fields) pairs from a CSV file with a header row, or from JSON, and a digest of the file"""
+    with open(path, 'rb') as f:
+        content = f.read()
+    digest = hashlib.sha1(content).hexdigest()[:16]
+    text = content.decode('utf-8')
+    if path.endswith('.json'):
+        data = json.loads(text)
+        if isinstance(data, dict):
+            # {"192.0.2.0/24": {"city": ...}, ...}
+            data = [dict(fields, network=network) for network, fields in data.items()]
+        return [_parse_fields(row, f"{path} entry {number}") for number, row in enumerate(data, 1)], digest
+    # Lines starting with # are comments
+    lines = (line for line in text.splitlines() if line.strip() and not line.lstrip().startswith('#'))
+    return [_parse_fields(row, f"{path} row {number}") for number, row in enumerate(csv.DictReader(lines), 1)], digest
+
+
+class OverrideTable:
+    """
+    User-supplied corrections for networks GeoLite2 places wrongly.
+
+    Entries map a CIDR network to any of the hop fields (city, country,
+    latitude, longitude, organization, asn) and are compiled into a
+    longest-prefix-match trie, so the most specific network wins and a
+    lookup costs one step per address bit however many entries there are.
+    The table is rebuilt and swapped in whole on reload, keeping the hit
+    counts of networks that are still listed.
+    """
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path: CSV or JSON file of overrides (GEO_OVERRIDES_PATH, default data/geo_overrides.csv);
+                a missing file means no overrides
+        """
+        self.path = path or os.getenv('GEO_OVERRIDES_PATH') or DEFAULT_OVERRIDES_PATH
+        self._trie = PrefixTrie()
+        self._signature: Optional[Tuple] = None
+        # Digest of the loaded file, empty without one
+        self._digest = ''
+        # Set by the first load attempt, made by the first lookup unless reload() came earlier
+        self._attempted = False
+        self.loaded_at: Optional[float] = None
+        self.loads = 0
+
+    def _file_signature(self) -> Optional[Tuple]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def load(self) -> int:
+        """
+        Read the file and swap in the new table.
+
+        Returns:
+            int: Number of overrides loaded
+
+        Raises:
+            ValueError: If an entry is invalid; the current table is kept
+        """
+        signature = self._file_signature()
+        rows, digest = _read_rows(self.path) if signature is not None else ([], '')
+        previous = {str(network): override for network, override in self._trie.items()}
+        trie = PrefixTrie()
+        for network, fields in rows:
+            try:
+                parsed = ipaddress.ip_network(network, strict=False)
+            except ValueError:
+                raise ValueError(f"{self.path}: invalid network {network!r}")
+            override = Override(parsed, fields)
+            kept = previous.get(str(parsed))
+            if kept is not None:
+                override.hits = kept.hits
+            trie.insert(parsed, override)
+        self._trie = trie
+        self._signature = signature
+        self._digest = digest
+        self.loaded_at = time.time()
+        self.loads += 1
+        return len(trie)
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Load the file again if it changed since the last load.
+
+        Returns:
+            bool: Whether the table was reloaded; an invalid file is reported and the current table kept
+        """
+        if not force and self._attempted and self._file_signature() == self._signature:
+            return False
+        self._attempted = True
+        try:
+            count = self.load()
+        except (OSError, ValueError) as e:
+            print(f"Geo overrides not reloaded, keeping the current ones: {str(e)}")
+            return False
+        if self._signature is not None:
+            print(f"Loaded {count} geo overrides from {self.path}")
+        return True
+
+    @property
+    def version(self) -> str:
+        """
+        Digest of the loaded file, for keying results that include overrides.
+
+        Derived from the content, so every worker that loaded the same file
+        agrees on it, whenever and however often each one loaded it.
+        """
+        return self._digest
+
+    def lookup(self, ip: str) -> Optional[Override]:
+        """Return the most specific override covering an IP and count the hit"""
+        if not self._attempted:
+            self.reload()
+        if not len(self._trie):
+            return None
+        match = self._trie.lookup(ip)
+        if match is None:
+            return None
+        override = match[1]
+        override.hits += 1
+        return override
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "overrides": len(self._trie),
+            "loaded_at": self.loaded_at,
+            "loads": self.loads,
+            "version": self.version,
+            "hits": {str(network): override.hits for network, override in self._trie.items()},
+        }
+
+    def __len__(self) -> int:
+        return len(self._trie)
@@ -0,0 +1,138 @@
+import re
+from typing import List, Optional
+from geotraceroute.core.traceroute import Hop
+
+# Unix rows: "<hop>  <tokens...>" where each token is a timeout, an RTT column,
+# a parenthesised address, an annotation such as !H, or a bare host/address
+UNIX_ROW = re.compile(r'^\s*(\d+)\s+(.*)$')
+UNIX_TOKEN = re.compile(r'(\*)|([0-9]+(?:\.[0-9]+)?)\s*ms\b|\(([^)\s]+)\)|(![A-Za-z0-9<>]*)|(\S+)')
+
+# Windows rows: "<hop>  <rtt|*>...  <host [ip] | ip | Request timed out.>"
+WINDOWS_ROW = re.compile(r'^\s*(\d+)\s+((?:(?:<?\d+\s*ms|\*)\s+)+)(.*?)\s*$')
+WINDOWS_RTT = re.compile(r'<?(\d+)\s*ms|\*')
+WINDOWS_ADDRESS = re.compile(r'^(?:(\S+)\s+\[([^\]]+)\]|(\S+))$')
+# A row whose first column is an RTT can only come from tracert
+WINDOWS_FIRST_RTT = re.compile(r'^\s*\d+\s+<?\d+\s*ms')
+
+IP_LITERAL = re.compile(r'^(?:\d{1,3}(?:\.\d{1,3}){3}|[0-9A-Fa-f]*:[0-9A-Fa-f:.]*)$')
+
+UNIX_HEADER = re.compile(r'^\s*traceroute6? to ')
+WINDOWS_HEADER = re.compile(r'^\s*(?:Tracing route to|over a maximum of|Trace complete)')
+
+
+class TracerouteParser:
+    """
+    Parse traceroute output with patterns compiled once per process.
+
+    The dialect is detected from the first non-empty line and every later
+    line is parsed with a single pass over its tokens, so any number of
+    ``-q`` RTT columns and mixed ``*``/address rows are handled alike.
+    """
+    DIALECT_LINUX = 'linux'
+    DIALECT_MACOS = 'macos'
+    DIALECT_WINDOWS = 'windows'
+
+    def __init__(self, dialect: Optional[str] = None):
+        """
+        Args:
+            dialect: Force a dialect instead of detecting it from the first line
+        """
+        self.dialect = dialect
+
+    def detect(self, line: str) -> str:
+        """
+        Detect the output dialect from the first line of output.
+
+        Linux traceroute prints its header on stdout, macOS prints it on
+        stderr so the first stdout line is already a hop row, and Windows
+        tracert announces itself with "Tracing route to".
+
+        Args:
+            line: First non-empty line of output
+
+        Returns:
+            str: One of the DIALECT_* constants
+        """
+        if WINDOWS_HEADER.match(line):
+            return self.DIALECT_WINDOWS
+        if UNIX_HEADER.match(line):
+            return self.DIALECT_LINUX
+        if WINDOWS_FIRST_RTT.match(line):
+            return self.DIALECT_WINDOWS
+        return self.DIALECT_MACOS
+
+    def parse_line(self, line: str) -> Optional[Hop]:
+        """
+        Parse a single line of traceroute output.
+
+        Args:
+            line: A line from traceroute output
+
+        Returns:
+            Optional[Hop]: Hop object if the line is a hop row, None otherwise
+        """
+        if not line or line.isspace():
+            return None
+        if self.dialect is None:
+            self.dialect = self.detect(line)
+        if self.dialect == self.DIALECT_WINDOWS:
+            return self._parse_windows(line)
+        return self._parse_unix(line)
+
+    def parse(self, output: str) -> List[Hop]:
+        """
+        Parse a complete traceroute output.
+
+        Args:
+            output: Traceroute output text
+
+        Returns:
+            List[Hop]: Parsed hops in output order
+        """
+        hops = []
+        for line in output.splitlines():
+            hop = self.parse_line(line)
+            if hop:
+                hops.append(hop)
+        return hops
+
+    def _parse_unix(self, line: str) -> Optional[Hop]:
+        row = UNIX_ROW.match(line)
+        if not row:
+            return None
+        ip = None
+        hostname = None
+        rtts = []
+        for timeout, rtt, address, annotation, bare in UNIX_TOKEN.findall(row.group(2)):
+            if rtt:
+                rtts.append(float(rtt))
+            elif address:
+                # "host (ip)": the bare token before it was a hostname
+                if ip is None or ip == hostname:
+                    ip = address
+            elif bare:
+                # Later bare tokens belong to a different responder; keep the first
+                if ip is None:
+                    ip = bare
+                    hostname = None if IP_LITERAL.match(bare) else bare
+        if ip is not None and ip == hostname:
+            # Unresolved name without a parenthesised address
+            ip = None
+        return Hop(int(row.group(1)), ip, hostname, rtts or None)
+
+    def _parse_windows(self, line: str) -> Optional[Hop]:
+        row = WINDOWS_ROW.match(line)
+        if not row:
+            return None
+        rtts = [float(rtt) for rtt in WINDOWS_RTT.findall(row.group(2)) if rtt]
+        ip = None
+        hostname = None
+        address = WINDOWS_ADDRESS.match(row.group(3))
+        if address and rtts:
+            if address.group(2):
+                hostname, ip = address.group(1), address.group(2)
+            elif IP_LITERAL.match(address.group(3)):
+                ip = address.group(3)
+            else:
+                hostname = address.group(3)
+        return Hop(int(row.group(1)), ip, hostname, rtts or None)
@@ -0,0 +1,89 @@
+import ipaddress
+from typing import Any, Iterator, Optional, Tuple, Union
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+class _Node:
+    __slots__ = ('children', 'network', 'value')
+
+    def __init__(self):
+        self.children = [None, None]
+        self.network: Optional[Network] = None
+        self.value: Any = None
+
+
+class PrefixTrie:
+    """
+    Binary trie mapping IPv4 and IPv6 networks to values with longest-prefix match.
+
+    Each address family has its own root, and a lookup walks at most one
+    node per address bit, so it costs the same however many networks are
+    stored.
+    """
+    def __init__(self):
+        self._roots = {4: _Node(), 6: _Node()}
+        self._size = 0
+
+    @staticmethod
+    def _bits(address: int, max_bits: int, length: int) -> Iterator[int]:
+        for shift in range(max_bits - 1, max_bits - 1 - length, -1):
+            yield (address >> shift) & 1
+
+    def insert(self, network: Union[str, Network], value: Any) -> None:
+        """
+        Map a network to a value, replacing any value it already had.
+
+        Args:
+            network: Network in CIDR notation or as an ipaddress network
+            value: Value returned for addresses inside the network
+        """
+        network = ipaddress.ip_network(network, strict=False)
+        node = self._roots[network.version]
+        for bit in self._bits(int(network.network_address), network.max_prefixlen, network.prefixlen):
+            child = node.children[bit]
+            if child is None:
+                child = node.children[bit] = _Node()
+            node = child
+        if node.network is None:
+            self._size += 1
+        node.network = network
+        node.value = value
+
+    def lookup(self, ip: Union[str, ipaddress.IPv4Address, ipaddress.IPv6Address]) -> Optional[Tuple[Network, Any]]:
+        """
+        Find the most specific network containing an address.
+
+        Returns:
+            Optional[Tuple[Network, Any]]: (network, value), or None if no network matches
+        """
+        address = ipaddress.ip_address(ip)
+        node = self._roots[address.version]
+        match = None
+        for bit in self._bits(int(address), address.max_prefixlen, address.max_prefixlen):
+            if node.network is not None:
+                match = node
+            node = node.children[bit]
+            if node is None:
+                break
+        else:
+            if node.network is not None:
+                match = node
+        return (match.network, match.value) if match is not None else None
+
+    def items(self) -> Iterator[Tuple[Network, Any]]:
+        """Yield every (network, value) pair, IPv4 first"""
+        for version in (4, 6):
+            stack = [self._roots[version]]
+            while stack:
+                node = stack.pop()
+                if node.network is not None:
+                    yield node.network, node.value
+                stack.extend(child for child in reversed(node.children) if child is not None)
+
+    def clear(self) -> None:
+        self._roots = {4: _Node(), 6: _Node()}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
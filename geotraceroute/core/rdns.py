@@ -0,0 +1,206 @@
+import asyncio
+import ipaddress
+import os
+import random
+import socket
+import struct
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+# A lookup takes an IP address and returns its PTR hostname, or None if it has none
+PTRLookup = Callable[[str], Awaitable[Optional[str]]]
+
+
+async def getnameinfo_lookup(ip: str) -> Optional[str]:
+    """Look up a PTR record with the system resolver, off the event loop thread"""
+    loop = asyncio.get_running_loop()
+    try:
+        hostname, _ = await loop.getnameinfo((ip, 0), socket.NI_NAMEREQD)
+    except (socket.gaierror, socket.herror, OSError):
+        return None
+    return hostname
+
+
+class DNSPTRLookup:
+    """
+    Minimal asynchronous DNS client that sends PTR queries over UDP.
+
+    Pointing it at a specific nameserver lets lookups bypass the system
+    resolver's thread pool, and lets tests run against a local stub server.
+    """
+    def __init__(self, nameserver: str, port: int = 53):
+        self.nameserver = nameserver
+        self.port = port
+
+    async def __call__(self, ip: str) -> Optional[str]:
+        query_id = random.randrange(0x10000)
+        query = self._build_query(query_id, ipaddress.ip_address(ip).reverse_pointer)
+        loop = asyncio.get_running_loop()
+        response = loop.create_future()
+
+        class _Protocol(asyncio.DatagramProtocol):
+            def datagram_received(self, data, addr):
+                if not response.done() and len(data) >= 2 and struct.unpack('!H', data[:2])[0] == query_id:
+                    response.set_result(data)
+
+            def error_received(self, exc):
+                if not response.done():
+                    response.set_exception(exc)
+
+        transport, _ = await loop.create_datagram_endpoint(_Protocol, remote_addr=(self.nameserver, self.port))
+        try:
+            transport.sendto(query)
+            return self._parse_response(await response)
+        except (OSError, IndexError, struct.error):
+            return None
+        finally:
+            transport.close()
+
+    @staticmethod
+    def _build_query(query_id: int, name: str) -> bytes:
+        header = struct.pack('!HHHHHH', query_id, 0x0100, 1, 0, 0, 0)
+        qname = b''.join(bytes([len(label)]) + label.encode('ascii') for label in name.split('.')) + b'\x00'
+        return header + qname + struct.pack('!HH', 12, 1)  # PTR, IN
+
+    @classmethod
+    def _parse_response(cls, data: bytes) -> Optional[str]:
+        _, flags, qdcount, ancount, _, _ = struct.unpack('!HHHHHH', data[:12])
+        if flags & 0x000f:  # any rcode other than NOERROR
+            return None
+        offset = 12
+        for _ in range(qdcount):
+            _, offset = cls._read_name(data, offset)
+            offset += 4
+        for _ in range(ancount):
+            _, offset = cls._read_name(data, offset)
+            rtype, _, _, rdlength = struct.unpack('!HHIH', data[offset:offset + 10])
+            offset += 10
+            if rtype == 12:
+                return cls._read_name(data, offset)[0].rstrip('.')
+            offset += rdlength
+        return None
+
+    @staticmethod
+    def _read_name(data: bytes, offset: int) -> Tuple[str, int]:
+        """Decode a possibly compressed domain name, returning it and the offset after it"""
+        labels = []
+        end = None
+        for _ in range(128):  # guard against pointer loops
+            length = data[offset]
+            if length & 0xc0 == 0xc0:
+                if end is None:
+                    end = offset + 2
+                offset = struct.unpack('!H', data[offset:offset + 2])[0] & 0x3fff
+                continue
+            offset += 1
+            if length == 0:
+                break
+            labels.append(data[offset:offset + length].decode('ascii', 'replace'))
+            offset += length
+        return '.'.join(labels), end if end is not None else offset
+
+
+class ReverseResolver:
+    """
+    Resolve hop IPs to hostnames concurrently with positive and negative caching.
+
+    Lookups are capped by a semaphore and each one has its own deadline, so a
+    slow or broken PTR zone never holds up the rest of the trace.
+    """
+    def __init__(self, lookup: Optional[PTRLookup] = None, concurrency: int = 16, deadline: float = 2.0,
+                 ttl: Optional[float] = None, negative_ttl: float = 300.0, max_entries: int = 10000):
+        """
+        Args:
+            lookup: Coroutine function performing one PTR lookup; the system
+                resolver by default, or DNSPTRLookup when RDNS_NAMESERVER is set
+            concurrency: Maximum number of lookups in flight
+            deadline: Seconds allowed for a single lookup
+            ttl: Seconds a found hostname is reused (RDNS_CACHE_TTL, default 3600)
+            negative_ttl: Seconds a missing or timed out PTR record is remembered
+            max_entries: Maximum number of cached IPs
+        """
+        if lookup is None:
+            nameserver = os.getenv('RDNS_NAMESERVER')
+            lookup = DNSPTRLookup(nameserver) if nameserver else getnameinfo_lookup
+        self.lookup = lookup
+        self.deadline = deadline
+        self.ttl = ttl if ttl is not None else float(os.getenv('RDNS_CACHE_TTL', '3600'))
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.concurrency = concurrency
+        self._semaphore = None
+        self._semaphore_loop = None
+        # ip -> (expires_at, hostname or None for a negative entry)
+        self._cache: Dict[str, Tuple[float, Optional[str]]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def cached(self, ip: str) -> Tuple[bool, Optional[str]]:
+        """
+        Look an IP up in the cache only.
+
+        Returns:
+            Tuple[bool, Optional[str]]: (hit, hostname)
+        """
+        entry = self._cache.get(ip)
+        if entry is None:
+            return False, None
+        expires_at, hostname = entry
+        if expires_at < time.monotonic():
+            del self._cache[ip]
+            return False, None
+        return True, hostname
+
+    def _store(self, ip: str, hostname: Optional[str]) -> None:
+        if len(self._cache) >= self.max_entries:
+            # Evict the oldest insertion
+            del self._cache[next(iter(self._cache))]
+        ttl = self.ttl if hostname else self.negative_ttl
+        self._cache[ip] = (time.monotonic() + ttl, hostname)
+
+    async def resolve(self, ip: str) -> Optional[str]:
+        """
+        Resolve one IP to its hostname.
+
+        Returns:
+            Optional[str]: Hostname, or None if there is no PTR record or the lookup timed out
+        """
+        hit, hostname = self.cached(ip)
+        if hit:
+            return hostname
+        inflight = self._inflight.get(ip)
+        if inflight is None:
+            inflight = asyncio.ensure_future(self._lookup(ip))
+            self._inflight[ip] = inflight
+            inflight.add_done_callback(lambda _: self._inflight.pop(ip, None))
+        return await asyncio.shield(inflight)
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily because the resolver may be built before the event loop runs
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def _lookup(self, ip: str) -> Optional[str]:
+        async with self._get_semaphore():
+            try:
+                hostname = await asyncio.wait_for(self.lookup(ip), self.deadline)
+            except (asyncio.TimeoutError, OSError, ValueError):
+                hostname = None
+        self._store(ip, hostname)
+        return hostname
+
+    async def resolve_many(self, ips: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        Resolve several IPs at once.
+
+        Args:
+            ips: IP addresses to resolve
+
+        Returns:
+            Dict[str, Optional[str]]: Hostname for each unique IP
+        """
+        unique = list(dict.fromkeys(ip for ip in ips if ip))
+        hostnames = await asyncio.gather(*(self.resolve(ip) for ip in unique))
+        return dict(zip(unique, hostnames))
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, Optional
+
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import RedisError
+except ImportError:  # redis is optional, the cache is then local only
+    aioredis = None
+    RedisError = OSError
+
+
+class RedisCache:
+    """
+    Optional cache tier shared by every app instance through Redis.
+
+    It sits behind the in-process caches: instances look here before doing
+    a lookup themselves and publish what they looked up. Reads and writes
+    for a whole trace go out as one pipeline, and every write carries a
+    TTL. Without REDIS_URL the tier is disabled, and when Redis stops
+    answering it is skipped for ``retry_after`` seconds, so the app keeps
+    working on its local caches.
+    """
+    def __init__(self, client=None, url: Optional[str] = None, prefix: str = 'geotraceroute:',
+                 timeout: float = 0.25, retry_after: float = 30.0):
+        """
+        Args:
+            client: redis.asyncio client, or a stand-in with the same pipeline interface
+            url: Redis URL used when no client is given (REDIS_URL)
+            prefix: Prepended to every key
+            timeout: Seconds a pipeline may take before Redis is treated as unavailable
+            retry_after: Seconds Redis is skipped after a failure
+        """
+        self.url = url or os.getenv('REDIS_URL')
+        self._client = client
+        self.prefix = prefix
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._unavailable_until = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self._client is not None or (aioredis is not None and bool(self.url))
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = aioredis.from_url(self.url)
+        return self._client
+
+    def _available(self) -> bool:
+        return self.enabled and time.monotonic() >= self._unavailable_until
+
+    def _failed(self, error: Exception) -> None:
+        print(f"Redis cache unavailable for {self.retry_after}s, continuing locally: {str(error)}")
+        self._unavailable_until = time.monotonic() + self.retry_after
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self.prefix}{namespace}:{key}"
+
+    async def get_many(self, namespace: str, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Read several keys in one pipeline.
+
+        Args:
+            namespace: Kind of value, e.g. 'location' or 'ipinfo'
+            keys: Keys to read
+
+        Returns:
+            Dict[str, Any]: Decoded values of the keys that were found; empty when Redis is unavailable
+        """
+        keys = list(dict.fromkeys(keys))
+        if not keys or not self._available():
+            return {}
+        try:
+            pipeline = self._get_client().pipeline(transaction=False)
+            for key in keys:
+                pipeline.get(self._key(namespace, key))
+            values = await asyncio.wait_for(pipeline.execute(), self.timeout)
+        except (RedisError, OSError, asyncio.TimeoutError) as e:
+            self._failed(e)
+            return {}
+        return {key: json.loads(value) for key, value in zip(keys, values) if value is not None}
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        return (await self.get_many(namespace, [key])).get(key)
+
+    async def set_many(self, namespace: str, values: Dict[str, Any], ttl: float) -> None:
+        """
+        Write several keys in one pipeline, each expiring after ``ttl`` seconds.
+
+        Failures are logged and otherwise ignored.
+        """
+        if not values or ttl <= 0 or not self._available():
+            return
+        try:
+            pipeline = self._get_client().pipeline(transaction=False)
+            for key, value in values.items():
+                pipeline.set(self._key(namespace, key), json.dumps(value), ex=max(1, int(ttl)))
+            await asyncio.wait_for(pipeline.execute(), self.timeout)
+        except (RedisError, OSError, asyncio.TimeoutError) as e:
+            self._failed(e)
+
+
+# Shared by the caches of this process; disabled unless REDIS_URL is set
+default_redis_cache = RedisCache()
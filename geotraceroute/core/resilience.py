@@ -0,0 +1,150 @@
+import asyncio
+import random
+import time
+from typing import Any, Dict, Optional
+
+BREAKER_CLOSED = 'closed'
+BREAKER_OPEN = 'open'
+BREAKER_HALF_OPEN = 'half_open'
+
+
+class TokenBucket:
+    """
+    Client-side rate limiter refilling ``rate`` tokens per second up to ``burst``.
+
+    Callers wait for tokens instead of being rejected, unless the wait would
+    exceed ``max_wait``, in which case they are told to skip the request.
+    """
+    def __init__(self, rate: float, burst: float, max_wait: float = 5.0):
+        """
+        Args:
+            rate: Tokens added per second, i.e. the sustained request rate
+            burst: Bucket size, the number of requests allowed back to back
+            max_wait: Longest wait accepted for tokens, in seconds
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self.waits = 0
+        self.rejections = 0
+        self.total_wait = 0.0
+        self.max_observed_wait = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0) -> bool:
+        """
+        Take tokens, waiting for them to refill if needed.
+
+        Returns:
+            bool: True when the tokens were taken, False when the wait would exceed max_wait
+
+        Raises:
+            ValueError: If more tokens than ``burst`` are asked for, which the bucket can never hold
+        """
+        if tokens > self.burst:
+            raise ValueError(f"Cannot take {tokens} tokens from a bucket of {self.burst}")
+        self._refill()
+        # Tokens are taken up front, so concurrent callers queue behind each other
+        wait = max(0.0, (tokens - self._tokens) / self.rate)
+        if wait > self.max_wait:
+            self.rejections += 1
+            return False
+        self._tokens -= tokens
+        if wait > 0:
+            self.waits += 1
+            self.total_wait += wait
+            self.max_observed_wait = max(self.max_observed_wait, wait)
+            await asyncio.sleep(wait)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        self._refill()
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "available_tokens": round(max(0.0, self._tokens), 2),
+            "waits": self.waits,
+            "rejections": self.rejections,
+            "total_wait_s": round(self.total_wait, 3),
+            "max_wait_s": round(self.max_observed_wait, 3),
+        }
+
+
+class CircuitBreaker:
+    """
+    Fail fast after repeated upstream errors.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    requests are refused without being attempted. Once ``reset_timeout``
+    seconds have passed a single trial request is let through; its success
+    closes the breaker again and its failure keeps it open.
+    """
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = BREAKER_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        """Whether a request may be attempted now"""
+        if self.state == BREAKER_OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = BREAKER_HALF_OPEN
+            self._trial_in_flight = False
+        if self.state == BREAKER_CLOSED:
+            return True
+        if self.state == BREAKER_HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        self.state = BREAKER_CLOSED
+        self.consecutive_failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == BREAKER_HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != BREAKER_OPEN:
+                self.times_opened += 1
+            self.state = BREAKER_OPEN
+            self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        retry_in = None
+        if self.state == BREAKER_OPEN:
+            retry_in = round(max(0.0, self.opened_at + self.reset_timeout - time.monotonic()), 3)
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+            "retry_in_s": retry_in,
+        }
+
+
+def backoff_delay(attempt: int, base: float = 0.2, cap: float = 2.0, retry_after: Optional[str] = None) -> float:
+    """
+    Seconds to wait before retry number ``attempt`` (0 for the first retry).
+
+    Exponential with jitter, so clients that failed together do not retry
+    together. A Retry-After header in seconds is honoured up to ``cap``.
+    """
+    if retry_after:
+        try:
+            return min(cap, max(0.0, float(retry_after)))
+        except ValueError:
+            pass
+    return min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.0)
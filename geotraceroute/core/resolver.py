@@ -0,0 +1,172 @@
+import asyncio
+import ipaddress
+import os
+import socket
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+
+@dataclass
+class ResolvedTarget:
+    """Addresses a trace target resolved to, split by family."""
+    name: str
+    ipv4: List[str] = field(default_factory=list)
+    ipv6: List[str] = field(default_factory=list)
+
+    def pick(self, family: Optional[int] = None) -> str:
+        """
+        Pick the address to trace.
+
+        Args:
+            family: socket.AF_INET or socket.AF_INET6 to require a family, None to prefer IPv4
+
+        Returns:
+            str: The chosen IP address
+        """
+        if family == socket.AF_INET6:
+            candidates = self.ipv6
+        elif family == socket.AF_INET:
+            candidates = self.ipv4
+        else:
+            candidates = self.ipv4 or self.ipv6
+        if not candidates:
+            raise ValueError(f"Could not resolve hostname: {self.name}")
+        return candidates[0]
+
+
+def _from_addrinfo(name: str, infos) -> ResolvedTarget:
+    """Collect unique addresses from getaddrinfo results, keeping resolver order"""
+    resolved = ResolvedTarget(name)
+    for family, _, _, _, sockaddr in infos:
+        address = sockaddr[0]
+        bucket = resolved.ipv6 if family == socket.AF_INET6 else resolved.ipv4
+        if address not in bucket:
+            bucket.append(address)
+    return resolved
+
+
+def _from_literal(name: str) -> Optional[ResolvedTarget]:
+    """Resolve IP literals without a lookup"""
+    try:
+        ip = ipaddress.ip_address(name)
+    except ValueError:
+        return None
+    if ip.version == 6:
+        return ResolvedTarget(name, ipv6=[str(ip)])
+    return ResolvedTarget(name, ipv4=[str(ip)])
+
+
+class HostResolver:
+    """
+    Non-blocking hostname resolution with a TTL cache.
+
+    Lookups run through the event loop's getaddrinfo so a slow resolver never
+    stalls other requests. Concurrent lookups of the same name share one
+    in-flight query, and failures are cached briefly so a bad name cannot be
+    used to hammer the resolver.
+    """
+    def __init__(self, ttl: Optional[float] = None, negative_ttl: float = 30.0, max_entries: int = 4096):
+        """
+        Args:
+            ttl: Seconds a successful answer is reused (DNS_CACHE_TTL, default 300).
+                getaddrinfo does not expose record TTLs, so this caps them.
+            negative_ttl: Seconds a failed lookup is remembered
+            max_entries: Maximum number of cached names
+        """
+        self.ttl = ttl if ttl is not None else float(os.getenv('DNS_CACHE_TTL', '300'))
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        # name -> (expires_at, resolved or None for a cached failure)
+        self._cache: Dict[str, Tuple[float, Optional[ResolvedTarget]]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _cached(self, name: str) -> Tuple[bool, Optional[ResolvedTarget]]:
+        entry = self._cache.get(name)
+        if entry is None:
+            return False, None
+        expires_at, resolved = entry
+        if expires_at < time.monotonic():
+            del self._cache[name]
+            return False, None
+        return True, resolved
+
+    def _store(self, name: str, resolved: Optional[ResolvedTarget]) -> None:
+        if len(self._cache) >= self.max_entries:
+            # Drop the entry closest to expiry
+            del self._cache[min(self._cache, key=lambda key: self._cache[key][0])]
+        ttl = self.ttl if resolved is not None else self.negative_ttl
+        self._cache[name] = (time.monotonic() + ttl, resolved)
+
+    async def resolve(self, name: str) -> ResolvedTarget:
+        """
+        Resolve a hostname to its IPv4 and IPv6 addresses.
+
+        Args:
+            name: Hostname or IP literal
+
+        Returns:
+            ResolvedTarget: Resolved addresses
+
+        Raises:
+            ValueError: If the name cannot be resolved
+        """
+        literal = _from_literal(name)
+        if literal is not None:
+            return literal
+
+        hit, resolved = self._cached(name)
+        if hit:
+            if resolved is None:
+                raise ValueError(f"Could not resolve hostname: {name}")
+            return resolved
+
+        inflight = self._inflight.get(name)
+        if inflight is None:
+            inflight = asyncio.ensure_future(self._lookup(name))
+            self._inflight[name] = inflight
+            inflight.add_done_callback(lambda _: self._inflight.pop(name, None))
+        # Shield so one cancelled caller does not cancel the shared lookup
+        resolved = await asyncio.shield(inflight)
+        if resolved is None:
+            raise ValueError(f"Could not resolve hostname: {name}")
+        return resolved
+
+    async def _lookup(self, name: str) -> Optional[ResolvedTarget]:
+        loop = asyncio.get_running_loop()
+        try:
+            infos = await loop.getaddrinfo(name, None, type=socket.SOCK_DGRAM)
+            resolved = _from_addrinfo(name, infos)
+        except (socket.gaierror, UnicodeError):
+            resolved = None
+        self._store(name, resolved)
+        return resolved
+
+    def resolve_blocking(self, name: str) -> ResolvedTarget:
+        """
+        Resolve a hostname synchronously, for callers outside the event loop.
+
+        Raises:
+            ValueError: If the name cannot be resolved
+        """
+        literal = _from_literal(name)
+        if literal is not None:
+            return literal
+        hit, resolved = self._cached(name)
+        if not hit:
+            try:
+                resolved = _from_addrinfo(name, socket.getaddrinfo(name, None, type=socket.SOCK_DGRAM))
+            except (socket.gaierror, UnicodeError):
+                resolved = None
+            self._store(name, resolved)
+        if resolved is None:
+            raise ValueError(f"Could not resolve hostname: {name}")
+        return resolved
+
+    def clear(self) -> None:
+        """Forget all cached answers"""
+        self._cache.clear()
+
+
+# Shared by every trace in the process so popular targets are looked up once
+default_resolver = HostResolver()
@@ -0,0 +1,123 @@
+import asyncio
+import os
+from typing import Any, AsyncGenerator, Dict, Iterable, Optional
+from geotraceroute.core.data_processor import DataProcessor
+from geotraceroute.core.resolver import HostResolver
+from geotraceroute.core.stop_set import StopSet
+from geotraceroute.core.traceroute import Traceroute
+
+# Why a target ended when it did not finish normally
+STOP_BUDGET = 'budget'
+
+_DONE = object()
+
+
+class TraceScheduler:
+    """
+    Trace many targets on one event loop under a global concurrency limit.
+
+    A fixed pool of workers takes targets in submission order, so thousands
+    of targets cost a queue entry each rather than a task or process each.
+    Results from the traces in flight are interleaved as they complete into
+    one bounded output queue, which also applies backpressure when the
+    consumer is slow. Each target has a time budget after which its trace
+    is stopped, and all traces share one stop set so the hops near this
+    host are probed once instead of once per target.
+    """
+    def __init__(self, processor: DataProcessor, concurrency: Optional[int] = None, target_budget: float = 60.0,
+                 stop_set: Optional[StopSet] = None, resolver: Optional[HostResolver] = None,
+                 **trace_options):
+        """
+        Args:
+            processor: DataProcessor enriching the hops of every trace
+            concurrency: Maximum number of traces in flight (TRACE_CONCURRENCY, default 32)
+            target_budget: Seconds a single target may take before its trace is stopped
+            stop_set: Stop set shared by the traces, a fresh one by default
+            resolver: Resolver for the targets, the shared cached resolver by default
+            **trace_options: Passed to every Traceroute, e.g. max_hops, timeout or parallel
+        """
+        self.processor = processor
+        self.concurrency = concurrency or int(os.getenv('TRACE_CONCURRENCY', '32'))
+        self.target_budget = target_budget
+        self.stop_set = stop_set if stop_set is not None else StopSet()
+        self.resolver = resolver
+        self.trace_options = trace_options
+
+    async def run(self, targets: Iterable[str], include_reputation: bool = False) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Trace every target and stream the results as they arrive.
+
+        Args:
+            targets: Hostnames or IP addresses to trace; duplicates are traced once
+            include_reputation: Whether to include reputation scores
+
+        Yields:
+            dict: Events tagged with "target": every enriched hop and hostname
+                update from DataProcessor.process_traceroute_stream, then one
+                {"type": "completed", "reason", "hops"} or {"type": "error", "error"}
+                event per target
+        """
+        pending: asyncio.Queue = asyncio.Queue()
+        for target in dict.fromkeys(targets):
+            pending.put_nowait(target)
+        if pending.empty():
+            return
+
+        results: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 4)
+        worker_count = min(self.concurrency, pending.qsize())
+        workers = [
+            asyncio.ensure_future(self._worker(pending, results, include_reputation))
+            for _ in range(worker_count)
+        ]
+        try:
+            finished = 0
+            while finished < worker_count:
+                event = await results.get()
+                if event is _DONE:
+                    finished += 1
+                    continue
+                yield event
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _worker(self, pending: asyncio.Queue, results: asyncio.Queue, include_reputation: bool) -> None:
+        while not pending.empty():
+            target = pending.get_nowait()
+            await self._trace(target, results, include_reputation)
+        await results.put(_DONE)
+
+    async def _trace(self, target: str, results: asyncio.Queue, include_reputation: bool) -> None:
+        """Trace one target within its budget, putting its events on the results queue"""
+        tracer = None
+        hop_count = 0
+
+        async def drain():
+            nonlocal hop_count
+            stream = self.processor.process_traceroute_stream(tracer, include_reputation=include_reputation)
+            try:
+                async for event in stream:
+                    if event.get("type") != "hostname":
+                        hop_count += 1
+                    await results.put({"target": target, **event})
+            finally:
+                await stream.aclose()
+
+        try:
+            tracer = await Traceroute.create(target, resolver=self.resolver, stop_set=self.stop_set,
+                                             **self.trace_options)
+            try:
+                await asyncio.wait_for(drain(), self.target_budget)
+                reason = tracer.stop_reason
+            except asyncio.TimeoutError:
+                reason = STOP_BUDGET
+            await results.put({"target": target, "type": "completed", "reason": reason, "hops": hop_count})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error tracing {target}: {str(e)}")
+            await results.put({"target": target, "type": "error", "error": str(e)})
+        finally:
+            if tracer:
+                await tracer.stop()
@@ -0,0 +1,105 @@
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+class _StopSetEntry:
+    __slots__ = ('expires_at', 'destinations')
+
+    def __init__(self):
+        self.expires_at = 0.0
+        self.destinations: Set[str] = set()
+
+
+class StopSet:
+    """
+    Doubletree-style stop set of (TTL, interface IP) pairs learned from recent traces.
+
+    When many destinations are traced from one host the first hops are the
+    same every time. A TTL whose only recently seen interface was observed on
+    the way to at least ``min_destinations`` different targets is considered
+    shared, and the run of shared TTLs starting at 1 can be filled in instead
+    of probed. Entries are refreshed whenever a trace observes them and
+    expire after ``ttl`` seconds otherwise, so skipped hops are re-probed
+    once their knowledge goes stale.
+    """
+    def __init__(self, ttl: float = 300.0, min_destinations: int = 2, max_ttl: int = 64):
+        """
+        Args:
+            ttl: Seconds an observed (TTL, IP) pair stays valid
+            min_destinations: Distinct traced targets needed before a hop is considered shared
+            max_ttl: Highest TTL remembered
+        """
+        self.ttl = ttl
+        self.min_destinations = min_destinations
+        self.max_ttl = max_ttl
+        self._entries: Dict[int, Dict[str, _StopSetEntry]] = {}
+
+    def learn(self, hops: Iterable, destination: str) -> None:
+        """
+        Record the interfaces a trace towards ``destination`` passed through.
+
+        Args:
+            hops: Hops observed by the trace; inferred hops and the destination itself are ignored
+            destination: IP address that was traced
+        """
+        now = time.monotonic()
+        expires_at = now + self.ttl
+        for hop in hops:
+            if not hop.ip or getattr(hop, 'inferred', False) or hop.ip == destination:
+                continue
+            if hop.hop_number > self.max_ttl:
+                continue
+            # Sweep expired interfaces so far TTLs, unique per destination, do not pile up
+            self._live(hop.hop_number, now)
+            entry = self._entries.setdefault(hop.hop_number, {}).get(hop.ip)
+            if entry is None:
+                entry = self._entries[hop.hop_number][hop.ip] = _StopSetEntry()
+            entry.expires_at = expires_at
+            # Only enough destinations to reach the threshold are kept
+            if len(entry.destinations) < self.min_destinations:
+                entry.destinations.add(destination)
+
+    def _live(self, ttl: int, now: float) -> Dict[str, _StopSetEntry]:
+        entries = self._entries.get(ttl)
+        if not entries:
+            return {}
+        for ip in [ip for ip, entry in entries.items() if entry.expires_at < now]:
+            del entries[ip]
+        if not entries:
+            del self._entries[ttl]
+        return entries
+
+    def known_prefix(self, destination: Optional[str] = None, max_hops: Optional[int] = None) -> List[Tuple[int, str]]:
+        """
+        Return the shared hops that can be skipped on the way to ``destination``.
+
+        The prefix ends at the first TTL that is unknown, has more than one
+        live interface (paths diverge or are load balanced there), has not yet
+        been seen for enough destinations, or is the destination itself.
+
+        Returns:
+            List[Tuple[int, str]]: (TTL, interface IP) pairs starting at TTL 1
+        """
+        now = time.monotonic()
+        limit = min(self.max_ttl, max_hops or self.max_ttl)
+        prefix = []
+        for ttl in range(1, limit + 1):
+            entries = self._live(ttl, now)
+            if len(entries) != 1:
+                break
+            ip, entry = next(iter(entries.items()))
+            if ip == destination or len(entry.destinations) < self.min_destinations:
+                break
+            prefix.append((ttl, ip))
+        return prefix
+
+    def forget_up_to(self, ttl: int) -> None:
+        """Drop everything learned for TTLs up to and including ``ttl`` after the path was seen to change"""
+        for known_ttl in [known_ttl for known_ttl in self._entries if known_ttl <= ttl]:
+            del self._entries[known_ttl]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._entries.values())
@@ -0,0 +1,120 @@
+import asyncio
+import copy
+import hashlib
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from geotraceroute.core.redis_cache import RedisCache, default_redis_cache
+from geotraceroute.core.traceroute import STOP_STOPPED
+
+
+class TraceCache:
+    """
+    Cache of completed trace results with single-flight coalescing.
+
+    Results are keyed by the traced IP and the probe parameters, so every
+    name that resolves to the same address shares one entry. Concurrent
+    requests for a key that is not cached wait on the one trace already in
+    progress instead of starting their own. Failed traces and traces that
+    were stopped before the end are not cached.
+    Results are also published to the shared cache tier, so another app
+    instance can answer the same request without tracing again.
+    """
+    def __init__(self, ttl: Optional[float] = None, max_entries: int = 1024, shared: Optional[RedisCache] = None):
+        """
+        Args:
+            ttl: Seconds a result stays fresh (TRACE_CACHE_TTL, default 30); 0 disables caching
+                but still coalesces concurrent requests
+            max_entries: Maximum number of cached results
+            shared: Cache tier shared with other instances, the Redis tier configured by REDIS_URL by default
+        """
+        self.ttl = ttl if ttl is not None else float(os.getenv('TRACE_CACHE_TTL', '30'))
+        self.max_entries = max_entries
+        # key -> (completed_at, result)
+        self._cache: Dict[Hashable, Tuple[float, Dict[str, Any]]] = {}
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.shared = shared if shared is not None else default_redis_cache
+
+    @staticmethod
+    def key_for(tracer, **options) -> Tuple:
+        """
+        Build the cache key of a trace.
+
+        Args:
+            tracer: Traceroute whose resolved IP and probe parameters identify the trace
+            **options: Further settings that change the result, such as include_reputation
+
+        Returns:
+            Tuple: Hashable key
+        """
+        return (
+            tracer.target_ip, tracer.max_hops, tracer.timeout, tracer.retries, tracer.backend,
+            tracer.parallel, tracer.adaptive_timeout, tracer.gap_limit,
+        ) + tuple(sorted(options.items()))
+
+    def _cached(self, key: Hashable) -> Optional[Tuple[float, Dict[str, Any]]]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > self.ttl:
+            del self._cache[key]
+            return None
+        return entry
+
+    def _store(self, key: Hashable, result: Dict[str, Any], age: float = 0.0) -> float:
+        completed_at = time.monotonic() - age
+        if self.ttl <= 0:
+            return completed_at
+        if key not in self._cache and len(self._cache) >= self.max_entries:
+            # Drop the oldest result
+            del self._cache[min(self._cache, key=lambda cached: self._cache[cached][0])]
+        self._cache[key] = (completed_at, result)
+        return completed_at
+
+    async def get_or_run(self, key: Hashable,
+                         run: Callable[[], Awaitable[Dict[str, Any]]]) -> Tuple[Dict[str, Any], float]:
+        """
+        Return a fresh cached result for ``key`` or run the trace to produce one.
+
+        Args:
+            key: Cache key, usually from key_for()
+            run: Coroutine function performing the trace and enrichment
+
+        Returns:
+            Tuple[Dict[str, Any], float]: A private copy of the result and its age in seconds
+        """
+        entry = self._cached(key)
+        if entry is None:
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                inflight = asyncio.ensure_future(self._run(key, run))
+                self._inflight[key] = inflight
+                inflight.add_done_callback(lambda _: self._inflight.pop(key, None))
+            # Shield so one disconnected client does not cancel the shared trace
+            entry = await asyncio.shield(inflight)
+        completed_at, result = entry
+        # Callers adjust results per client, so each gets its own copy
+        return copy.deepcopy(result), round(time.monotonic() - completed_at, 3)
+
+    async def _run(self, key: Hashable, run: Callable[[], Awaitable[Dict[str, Any]]]) -> Tuple[float, Dict[str, Any]]:
+        shared_key = hashlib.sha1(repr(key).encode()).hexdigest()
+        shared = await self.shared.get('trace', shared_key) if self.ttl > 0 else None
+        if shared is not None:
+            age = max(0.0, time.time() - shared['completed_at'])
+            if age <= self.ttl:
+                return self._store(key, shared['result'], age), shared['result']
+
+        result = await run()
+        if result.get('stop_reason') == STOP_STOPPED:
+            # Cut short, so only the callers already waiting get it
+            return time.monotonic(), result
+        completed_at = self._store(key, result)
+        await self.shared.set_many('trace', {shared_key: {'completed_at': time.time(), 'result': result}}, self.ttl)
+        return completed_at, result
+
+    def clear(self) -> None:
+        """Forget all cached results"""
+        self._cache.clear()
+
+    def __len__(self) -> int:
+        return len(self._cache)
@@ -1,37 +1,484 @@
 import subprocess
-import re
-from typing import List, Dict, Optional, AsyncGenerator
+from typing import List, Dict, Optional, AsyncGenerator, Callable, Tuple
 from dataclasses import dataclass
 import asyncio
 import socket
+import struct
+import time
 import platform
 import ipaddress
+import os
+from geotraceroute.core.resolver import HostResolver, ResolvedTarget, default_resolver
+from geotraceroute.core.stop_set import StopSet
 
 @dataclass
 class Hop:
     hop_number: int
     ip: Optional[str]
     hostname: Optional[str]
+    # None when no probe was answered
     rtt_ms: Optional[List[float]]
+    # Filled in from the stop set instead of being probed
+    inferred: bool = False
+
+@dataclass
+class ProbeReply:
+    """An ICMP reply matched back to the probe that triggered it."""
+    probe_id: int
+    ip: str
+    final: bool
+    received_at: float
+
+class ProbeTransport:
+    """
+    Socket layer used by ProbeEngine.
+
+    A transport sends TTL-limited probes towards one target and delivers the
+    replies it can match to a probe id. Tests substitute a fake transport.
+    """
+    # Number of distinct probe ids the transport can tell apart
+    id_space = 1024
+
+    def open(self) -> None:
+        pass
+
+    def send(self, ttl: int, probe_id: int) -> None:
+        raise NotImplementedError
+
+    async def receive(self) -> ProbeReply:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+class UDPProbeTransport(ProbeTransport):
+    """
+    Send UDP probes to high ports and read ICMP replies on a raw socket.
+
+    The destination port encodes the probe id and the bound source port tells
+    our probes apart from other traces running in the same process. Both
+    sockets are non-blocking and serviced by the event loop.
+    """
+    BASE_PORT = 33434
+
+    def __init__(self, target_ip: str):
+        self.target_ip = target_ip
+        self.family = socket.AF_INET6 if ipaddress.ip_address(target_ip).version == 6 else socket.AF_INET
+        self._target_packed = socket.inet_pton(self.family, target_ip)
+        self._send_sock = None
+        self._recv_sock = None
+        self._source_port = None
+        self._replies = None
+        self._loop = None
+
+    def open(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._replies = asyncio.Queue()
+        icmp_proto = socket.IPPROTO_ICMPV6 if self.family == socket.AF_INET6 else socket.IPPROTO_ICMP
+        self._recv_sock = socket.socket(self.family, socket.SOCK_RAW, icmp_proto)
+        self._recv_sock.setblocking(False)
+        self._send_sock = socket.socket(self.family, socket.SOCK_DGRAM)
+        self._send_sock.setblocking(False)
+        self._send_sock.bind(('::', 0) if self.family == socket.AF_INET6 else ('0.0.0.0', 0))
+        self._source_port = self._send_sock.getsockname()[1]
+        self._loop.add_reader(self._recv_sock.fileno(), self._on_readable)
+
+    def send(self, ttl: int, probe_id: int) -> None:
+        if self.family == socket.AF_INET6:
+            self._send_sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_UNICAST_HOPS, ttl)
+        else:
+            self._send_sock.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, ttl)
+        self._send_sock.sendto(b'\x00' * 32, (self.target_ip, self.BASE_PORT + probe_id))
+
+    async def receive(self) -> ProbeReply:
+        return await self._replies.get()
+
+    def _on_readable(self):
+        """Drain the raw socket and queue every reply that belongs to us"""
+        while True:
+            try:
+                data, addr = self._recv_sock.recvfrom(1500)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            received_at = time.monotonic()
+            matched = self._match(data)
+            if matched is not None:
+                probe_id, final = matched
+                self._replies.put_nowait(ProbeReply(probe_id, addr[0], final, received_at))
+
+    def _match(self, data: bytes) -> Optional[Tuple[int, bool]]:
+        """
+        Extract the probe id from an ICMP error carrying one of our probes.
+
+        Returns:
+            Optional[Tuple[int, bool]]: (probe id, final) or None if the packet is not ours
+        """
+        if self.family == socket.AF_INET6:
+            # Raw ICMPv6 sockets deliver the message without the IPv6 header
+            icmp = data
+            if len(icmp) < 8 + 40 + 4:
+                return None
+            icmp_type = icmp[0]
+            if icmp_type not in (1, 3):  # destination unreachable, time exceeded
+                return None
+            inner = icmp[8:]
+            if inner[6] != socket.IPPROTO_UDP or inner[24:40] != self._target_packed:
+                return None
+            udp = inner[40:44]
+            final = icmp_type == 1
+        else:
+            header_len = (data[0] & 0x0f) * 4
+            icmp = data[header_len:]
+            if len(icmp) < 8 + 20 + 4:
+                return None
+            icmp_type = icmp[0]
+            if icmp_type not in (3, 11):  # destination unreachable, time exceeded
+                return None
+            inner = icmp[8:]
+            inner_len = (inner[0] & 0x0f) * 4
+            if inner[9] != socket.IPPROTO_UDP or inner[16:20] != self._target_packed:
+                return None
+            udp = inner[inner_len:inner_len + 4]
+            final = icmp_type == 3
+        if len(udp) < 4:
+            return None
+        source_port, dest_port = struct.unpack('!HH', udp)
+        if source_port != self._source_port:
+            return None
+        probe_id = dest_port - self.BASE_PORT
+        if not 0 <= probe_id < self.id_space:
+            return None
+        return probe_id, final
+
+    def close(self) -> None:
+        if self._recv_sock is not None:
+            try:
+                self._loop.remove_reader(self._recv_sock.fileno())
+            except Exception:
+                pass
+            self._recv_sock.close()
+            self._recv_sock = None
+        if self._send_sock is not None:
+            self._send_sock.close()
+            self._send_sock = None
+
+# Why a trace ended, reported as Traceroute.stop_reason
+STOP_DESTINATION_REACHED = 'destination_reached'
+STOP_MAX_HOPS = 'max_hops'
+STOP_GAP_LIMIT = 'gap_limit'
+STOP_STOPPED = 'stopped'
+
+class RTOEstimator:
+    """
+    Probe timeout estimated from the replies already seen on a path.
+
+    Follows the RFC 6298 smoothed RTT and RTT variance, and never goes
+    below twice the largest RTT seen so far, since farther hops answer
+    later than nearer ones.
+    """
+    def __init__(self, initial: float, minimum: float = 0.2, maximum: Optional[float] = None):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum if maximum is not None else initial
+        self.srtt: Optional[float] = None
+        self.rttvar = 0.0
+        self.max_rtt = 0.0
+
+    def update(self, rtt: float) -> None:
+        """Fold in one RTT sample, in seconds"""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.max_rtt = max(self.max_rtt, rtt)
+
+    @property
+    def rto(self) -> float:
+        if self.srtt is None:
+            return self.initial
+        estimate = max(self.srtt + 4 * self.rttvar, 2 * self.max_rtt)
+        return min(self.maximum, max(self.minimum, estimate))
+
+class ProbeEngine:
+    """
+    In-process traceroute that probes the path on the event loop.
+
+    By default one TTL is probed at a time: all probes for a TTL are sent
+    together and the hop is settled once every probe has a reply or the
+    timeout has elapsed. In parallel mode the probes for every TTL are sent
+    at once, so the whole trace takes roughly a single timeout window.
+
+    With adaptive timeouts the wait is shortened to an RTO estimated from
+    the replies seen so far, and a gap limit ends the trace after that many
+    consecutive silent hops. ``stop_reason`` says why the trace ended.
+    """
+    def __init__(self, transport: ProbeTransport, max_hops: int = 30, timeout: float = 1.0, probes_per_hop: int = 3,
+                 parallel: bool = False, first_ttl: int = 1, adaptive_timeout: bool = False,
+                 gap_limit: Optional[int] = None, min_timeout: float = 0.2):
+        self.transport = transport
+        self.max_hops = max_hops
+        self.first_ttl = first_ttl
+        self.timeout = timeout
+        self.probes_per_hop = probes_per_hop
+        self.parallel = parallel
+        self.gap_limit = gap_limit
+        self.rto = RTOEstimator(timeout, minimum=min(min_timeout, timeout), maximum=timeout) if adaptive_timeout else None
+        self.stop_reason: Optional[str] = None
+        self._next_id = 0
+        # probe_id -> (ttl, index within hop, send time)
+        self._pending: Dict[int, Tuple[int, int, float]] = {}
+        self._closed = False
+
+    def _allocate_id(self) -> int:
+        probe_id = self._next_id
+        self._next_id = (self._next_id + 1) % self.transport.id_space
+        return probe_id
+
+    def _send_probes(self, ttl: int) -> None:
+        for index in range(self.probes_per_hop):
+            probe_id = self._allocate_id()
+            self._pending[probe_id] = (ttl, index, time.monotonic())
+            self.transport.send(ttl, probe_id)
+
+    def _current_timeout(self) -> float:
+        return self.rto.rto if self.rto else self.timeout
+
+    def _record_rtt(self, reply: ProbeReply, sent_at: float) -> float:
+        """Return the RTT of a reply in milliseconds and feed the RTO estimate"""
+        rtt = reply.received_at - sent_at
+        if self.rto:
+            self.rto.update(rtt)
+        return round(rtt * 1000, 3)
+
+    async def _next_reply(self, deadline: float) -> Optional[ProbeReply]:
+        """Wait for the next reply until the deadline, None on timeout"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        try:
+            return await asyncio.wait_for(self.transport.receive(), remaining)
+        except asyncio.TimeoutError:
+            return None
+
+    def _gap_reached(self, silent_hops: int) -> bool:
+        return self.gap_limit is not None and silent_hops >= self.gap_limit
+
+    async def run(self) -> AsyncGenerator[Hop, None]:
+        """
+        Probe the path and yield hops in order.
+
+        Yields:
+            Hop: Information about each hop
+        """
+        self.transport.open()
+        try:
+            if self.parallel:
+                async for hop in self._run_parallel():
+                    yield hop
+                return
+            silent_hops = 0
+            for ttl in range(self.first_ttl, self.max_hops + 1):
+                if self._closed:
+                    self.stop_reason = STOP_STOPPED
+                    return
+                hop, final = await self._probe_hop(ttl)
+                yield hop
+                if final:
+                    self.stop_reason = STOP_DESTINATION_REACHED
+                    return
+                silent_hops = silent_hops + 1 if hop.ip is None else 0
+                if self._gap_reached(silent_hops) and ttl < self.max_hops:
+                    self.stop_reason = STOP_GAP_LIMIT
+                    return
+            self.stop_reason = STOP_MAX_HOPS
+        finally:
+            self.close()
+
+    async def _probe_hop(self, ttl: int) -> Tuple[Hop, bool]:
+        self._pending.clear()
+        self._send_probes(ttl)
+        rtts: List[Optional[float]] = [None] * self.probes_per_hop
+        ip = None
+        final = False
+        deadline = time.monotonic() + self._current_timeout()
+        while self._pending:
+            reply = await self._next_reply(deadline)
+            if reply is None:
+                break
+            probe = self._pending.pop(reply.probe_id, None)
+            if probe is None:
+                # Late reply for an earlier hop
+                continue
+            _, index, sent_at = probe
+            rtts[index] = self._record_rtt(reply, sent_at)
+            ip = ip or reply.ip
+            final = final or reply.final
+        self._pending.clear()
+        return Hop(ttl, ip, None, [rtt for rtt in rtts if rtt is not None] or None), final
+
+    async def _run_parallel(self) -> AsyncGenerator[Hop, None]:
+        """
+        Probe every TTL at once and yield hops in order as they settle.
+
+        A hop is settled when all of its probes have replied or the shared
+        deadline has passed. The lowest TTL that reached the destination ends
+        the trace; replies from beyond it are discarded. With adaptive
+        timeouts the shared deadline follows the RTO estimate.
+        """
+        self._pending.clear()
+        rtts = {ttl: [None] * self.probes_per_hop for ttl in range(self.first_ttl, self.max_hops + 1)}
+        ips: Dict[int, Optional[str]] = {}
+        outstanding = {ttl: self.probes_per_hop for ttl in rtts}
+        last_ttl = self.max_hops
+        for ttl in rtts:
+            self._send_probes(ttl)
+        started = time.monotonic()
+        deadline = started + self._current_timeout()
+
+        next_ttl = self.first_ttl
+        timed_out = False
+        reached = False
+        silent_hops = 0
+        while next_ttl <= last_ttl:
+            # Emit every hop that is settled, in order
+            while next_ttl <= last_ttl and (timed_out or outstanding[next_ttl] == 0):
+                hop_rtts = [rtt for rtt in rtts[next_ttl] if rtt is not None]
+                yield Hop(next_ttl, ips.get(next_ttl), None, hop_rtts or None)
+                silent_hops = silent_hops + 1 if next_ttl not in ips else 0
+                next_ttl += 1
+                if self._gap_reached(silent_hops) and next_ttl <= last_ttl:
+                    self.stop_reason = STOP_GAP_LIMIT
+                    self._pending.clear()
+                    return
+            if next_ttl > last_ttl or self._closed:
+                break
+
+            reply = await self._next_reply(deadline)
+            if reply is None:
+                timed_out = True
+                continue
+            probe = self._pending.pop(reply.probe_id, None)
+            if probe is None:
+                continue
+            ttl, index, sent_at = probe
+            if ttl > last_ttl:
+                continue
+            rtts[ttl][index] = self._record_rtt(reply, sent_at)
+            if self.rto:
+                deadline = started + self.rto.rto
+            ips.setdefault(ttl, reply.ip)
+            outstanding[ttl] -= 1
+            if reply.final:
+                reached = True
+                last_ttl = min(last_ttl, ttl)
+        self._pending.clear()
+        if self._closed:
+            self.stop_reason = STOP_STOPPED
+        elif reached:
+            self.stop_reason = STOP_DESTINATION_REACHED
+        else:
+            self.stop_reason = STOP_MAX_HOPS
+
+    def close(self) -> None:
+        """Stop probing and release the sockets"""
+        if not self._closed:
+            self._closed = True
+            self.transport.close()
+
+def native_probing_available() -> bool:
+    """Check whether this process may open the raw ICMP socket the native engine needs"""
+    if platform.system().lower() == 'windows':
+        return False
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+    except OSError:
+        return False
+    sock.close()
+    return True
 
 class Traceroute:
-    def __init__(self, target: str, max_hops: int = 30, timeout: float = 1.0, retries: int = 3):
+    BACKENDS = ('auto', 'native', 'subprocess')
+
+    def __init__(self, target: str, max_hops: int = 30, timeout: float = 1.0, retries: int = 3,
+                 backend: Optional[str] = None, transport_factory: Optional[Callable[[str], ProbeTransport]] = None,
+                 parallel: bool = False, resolved: Optional[ResolvedTarget] = None, family: Optional[int] = None,
+                 stop_set: Optional[StopSet] = None, adaptive_timeout: bool = False, gap_limit: Optional[int] = None):
+        """
+        Args:
+            target: Target hostname or IP address
+            max_hops: Maximum number of hops
+            timeout: Seconds to wait for replies to each hop's probes
+            retries: Number of probes sent per hop
+            backend: 'native' for the in-process probe engine, 'subprocess' for the
+                system traceroute binary, 'auto' to use native when raw sockets are permitted;
+                TRACEROUTE_BACKEND or 'subprocess' when omitted
+            transport_factory: Builds the native engine's socket layer from the target IP
+            parallel: Probe all TTLs at once (native backend only)
+            resolved: Addresses already resolved for the target; looked up synchronously when omitted
+            family: socket.AF_INET or socket.AF_INET6 to choose the traced address family
+            stop_set: Shared stop set; hops it already knows are filled in instead of probed
+            adaptive_timeout: Shorten the wait per hop to an RTO estimated from earlier
+                replies, never longer than ``timeout`` (native backend only)
+            gap_limit: Stop after this many consecutive hops without a reply
+        """
+        backend = backend or os.getenv('TRACEROUTE_BACKEND', 'subprocess')
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown traceroute backend: {backend}")
         self.target = target
         self.max_hops = max_hops
         self.timeout = timeout
         self.retries = retries
+        self.parallel = parallel
         self.process = None
+        self.engine = None
+        self._parser = None
+        self._stopped = False
+        self.transport_factory = transport_factory or UDPProbeTransport
+        if backend == 'auto':
+            backend = 'native' if transport_factory or native_probing_available() else 'subprocess'
+        self.backend = backend
+        self.family = family
+        self.resolved = resolved
+        self.stop_set = stop_set
+        self.adaptive_timeout = adaptive_timeout
+        self.gap_limit = gap_limit
+        # Why the last run ended, one of the STOP_* constants
+        self.stop_reason: Optional[str] = None
         self._resolve_target()
 
+    @classmethod
+    async def create(cls, target: str, resolver: Optional[HostResolver] = None, **kwargs) -> 'Traceroute':
+        """
+        Create a Traceroute without blocking the event loop on name resolution.
+
+        Args:
+            target: Target hostname or IP address
+            resolver: Resolver to use, the shared cached resolver by default
+            **kwargs: Passed through to the constructor
+
+        Returns:
+            Traceroute: Instance with the target already resolved
+        """
+        resolved = await (resolver or default_resolver).resolve(target)
+        return cls(target, resolved=resolved, **kwargs)
+
     def _resolve_target(self):
         """Resolve target hostname to IP address"""
-        try:
-            self.target_ip = socket.gethostbyname(self.target)
-        except socket.gaierror:
-            raise ValueError(f"Could not resolve hostname: {self.target}")
+        if self.resolved is None:
+            self.resolved = default_resolver.resolve_blocking(self.target)
+        self.target_ip = self.resolved.pick(self.family)
 
     async def stop(self):
         """Stop the traceroute process if it's running"""
+        self._stopped = True
+        self.stop_reason = STOP_STOPPED
+        if self.engine:
+            self.engine.close()
+            self.engine = None
         if self.process:
             self.process.terminate()
             await self.process.wait()
@@ -44,56 +491,135 @@ class Traceroute:
         Yields:
             Hop: Information about each hop
         """
-        os_name = platform.system().lower()
-        
+        self.stop_reason = None
+        self._stopped = False
+        prefix = self._known_prefix()
+        observed = []
+        hops = self._run_from_prefix(prefix) if prefix else self._run_backend()
+        async for hop in hops:
+            if not hop.inferred:
+                observed.append(hop)
+            yield hop
+
+        if self.stop_set is not None and not self._stopped:
+            self.stop_set.learn(observed, self.target_ip)
+
+    def _known_prefix(self) -> List[Tuple[int, str]]:
+        """Hops the stop set lets this trace skip; worthwhile from two hops up"""
+        if self.stop_set is None or (self.backend == 'subprocess' and platform.system().lower() == 'windows'):
+            return []
+        prefix = self.stop_set.known_prefix(self.target_ip, self.max_hops)
+        return prefix if len(prefix) >= 2 else []
+
+    async def _run_from_prefix(self, prefix: List[Tuple[int, str]]) -> AsyncGenerator[Hop, None]:
+        """
+        Start probing at the last hop of a known prefix and infer the hops before it.
+
+        The last known hop is probed again to check the path has not changed
+        near the source. If it has, the skipped hops are probed after all and
+        the stop set forgets them.
+        """
+        check_ttl, check_ip = prefix[-1]
+        hops = self._run_backend(first_ttl=check_ttl)
+        try:
+            async for hop in hops:
+                if hop.hop_number == check_ttl:
+                    if hop.ip == check_ip:
+                        for ttl, ip in prefix[:-1]:
+                            yield Hop(ttl, ip, None, [], inferred=True)
+                    else:
+                        self.stop_set.forget_up_to(check_ttl)
+                        reached = False
+                        async for near in self._run_backend(last_ttl=check_ttl - 1):
+                            reached = reached or near.ip == self.target_ip
+                            yield near
+                        if reached or self._stopped:
+                            return
+                yield hop
+        finally:
+            await hops.aclose()
+
+    def _run_backend(self, first_ttl: int = 1, last_ttl: Optional[int] = None) -> AsyncGenerator[Hop, None]:
+        if self.backend == 'native':
+            return self._run_native(first_ttl, last_ttl)
+        return self._run_subprocess(first_ttl, last_ttl)
+
+    async def _run_subprocess(self, first_ttl: int = 1, last_ttl: Optional[int] = None) -> AsyncGenerator[Hop, None]:
+        """Stream hops parsed from the system traceroute binary"""
         # Use the same command build logic as _build_command
-        cmd = self._build_command()
+        cmd = self._build_command(first_ttl, last_ttl)
         print(f"Executing stream command: {cmd}")
 
-        self.process = await asyncio.create_subprocess_shell(
+        # A nested run (probing skipped hops) restores the outer process when done
+        outer = self.process
+        self.process = process = await asyncio.create_subprocess_shell(
             cmd,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE
         )
 
-        # Only skip the actual header line (e.g., "traceroute to example.com")
-        # Read the first line
-        line = await self.process.stdout.readline()
-        if line:
-            decoded_line = line.decode().strip()
-            print(f"Reading line: {decoded_line}")
-            
-            # If it's the actual header line, skip it
-            if "traceroute to" in decoded_line:
-                print(f"Skipping header line: {decoded_line}")
-            # Otherwise, try to parse it as hop data
-            else:
-                hop = self._parse_hop(decoded_line)
+        # Runs bounded by last_ttl probe hops that are known to exist, so no gap limit there
+        gap_limit = self.gap_limit if last_ttl is None else None
+        try:
+            # The parser detects the dialect from the first line and skips the header
+            parser = self._create_parser()
+            last_hop = None
+            silent_hops = 0
+            while True:
+                line = await process.stdout.readline()
+                if not line:
+                    break
+
+                hop = parser.parse_line(line.decode())
                 if hop:
-                    print(f"Yielding hop: {hop}")
+                    last_hop = hop
                     yield hop
-        
-        # Process all remaining lines
-        while True:
-            line = await self.process.stdout.readline()
-            if not line:
-                break
-                
-            line = line.decode().strip()
-            print(f"Reading line: {line}")
-            if not line:
-                continue
-                
-            # Parse hop information
-            hop = self._parse_hop(line)
-            if hop:
-                print(f"Yielding hop: {hop}")
+                    silent_hops = silent_hops + 1 if hop.ip is None else 0
+                    if gap_limit is not None and silent_hops >= gap_limit:
+                        # Terminated in the finally block below
+                        self.stop_reason = STOP_GAP_LIMIT
+                        return
+
+            await process.wait()
+            self.stop_reason = STOP_STOPPED if self._stopped else self._reason_from_last_hop(last_hop)
+        finally:
+            if process.returncode is None:
+                process.terminate()
+                await process.wait()
+            self.process = outer
+
+    async def _run_native(self, first_ttl: int = 1, last_ttl: Optional[int] = None) -> AsyncGenerator[Hop, None]:
+        """Stream hops from the in-process probe engine"""
+        # A nested run (probing skipped hops) restores the outer engine when done
+        outer = self.engine
+        self.engine = engine = ProbeEngine(
+            self.transport_factory(self.target_ip),
+            max_hops=last_ttl or self.max_hops,
+            timeout=self.timeout,
+            probes_per_hop=self.retries,
+            parallel=self.parallel,
+            first_ttl=first_ttl,
+            adaptive_timeout=self.adaptive_timeout,
+            gap_limit=self.gap_limit if last_ttl is None else None
+        )
+        try:
+            async for hop in engine.run():
                 yield hop
-            else:
-                print(f"Could not parse line: {line}")
+            self.stop_reason = engine.stop_reason
+        finally:
+            engine.close()
+            self.engine = outer
 
-        await self.process.wait()
-        self.process = None
+    def _reason_from_last_hop(self, hop: Optional[Hop]) -> str:
+        """Stop reason of a completed run that was not cut short"""
+        if hop is not None and hop.ip == self.target_ip:
+            return STOP_DESTINATION_REACHED
+        return STOP_MAX_HOPS
+
+    def _create_parser(self):
+        """Create a parser for one run of traceroute output"""
+        from geotraceroute.core.parser import TracerouteParser
+        return TracerouteParser()
 
     def _parse_hop(self, line: str) -> Optional[Hop]:
         """
@@ -105,109 +631,9 @@ class Traceroute:
         Returns:
             Optional[Hop]: Hop object if parsed successfully, None otherwise
         """
-        print(f"Parsing line: {line}")
-        # Skip the first line (headline) and empty lines
-        if not line.strip() or "traceroute to" in line:
-            return None
-        
-        # Try to extract hop information
-        try:
-            # Special case: handle mixed asterisks and IP in the last hop
-            # Example: "7  * 8.8.8.8  23.323 ms  19.489 ms"
-            last_hop_mixed = re.match(r'^\s*(\d+)\s+\*\s+([^\s]+)\s+([0-9.]+)\s*ms\s+([0-9.]+)\s*ms', line)
-            if last_hop_mixed:
-                hop_num = int(last_hop_mixed.group(1))
-                ip = last_hop_mixed.group(2)
-                
-                # Extract RTT values, skip the first timeout (*)
-                rtts = []
-                for i in range(3, 5):
-                    if last_hop_mixed.group(i):
-                        rtts.append(float(last_hop_mixed.group(i)))
-                
-                print(f"Successfully parsed mixed line: hop={hop_num}, IP={ip}, RTTs={rtts}")
-                return Hop(hop_num, ip, None, rtts)
-
-            # Optimized macOS/Linux format parsing
-            # Supports hostname with or without parentheses
-            # Supports * * * timeout cases
-            # Matches different numbers of RTT values
-            match = re.match(r'^\s*(\d+)\s+(?:(\*)\s+(\*)\s+(\*)|(?:([^\s]+)(?:\s+\(([^\)]+)\))?\s+([0-9.]+)\s*ms(?:\s+([0-9.]+)\s*ms)?(?:\s+([0-9.]+)\s*ms)?))', line)
-            
-            if not match:
-                # Try a simpler pattern for the -n parameter (not resolving hostnames)
-                match = re.match(r'^\s*(\d+)\s+([^\s]+)\s+([0-9.]+)\s*ms\s+([0-9.]+)\s*ms\s+([0-9.]+)\s*ms', line)
-                if match:
-                    hop_num = int(match.group(1))
-                    ip = match.group(2)
-                    hostname = None  # -n parameter doesn't resolve hostnames
-                    
-                    # Extract RTT values
-                    rtts = []
-                    for i in range(3, 6):
-                        if match.group(i):
-                            rtts.append(float(match.group(i)))
-                    
-                    return Hop(hop_num, ip, hostname, rtts)
-            
-            if match:
-                hop_num = int(match.group(1))
-                
-                # Handle timeout case (* * *)
-                if match.group(2) == '*':
-                    return Hop(hop_num, None, None, [])
-                
-                # Normal case: extract IP and hostname
-                if len(match.groups()) >= 5:
-                    # Process with new pattern
-                    ip = match.group(5)
-                    hostname = match.group(6)
-                    
-                    # Extract RTT values
-                    rtts = []
-                    for i in range(7, 10):
-                        if i <= len(match.groups()) and match.group(i):
-                            rtts.append(float(match.group(i)))
-                
-                return Hop(hop_num, ip, hostname, rtts)
-                
-            # Windows format parsing
-            win_match = re.match(r'^\s*(\d+)\s+(?:\*\s*\*\s*\*|(?:(\d+)\s*ms\s+(\d+)\s*ms\s+(\d+)\s*ms\s+([^\s]+)))', line)
-            if win_match:
-                hop_num = int(win_match.group(1))
-                
-                # Handle timeout case
-                if "*" in line:
-                    return Hop(hop_num, None, None, [])
-                
-                # In Windows format, hostname/IP is in group 5
-                hostname_or_ip = win_match.group(5)
-                
-                # Check if it's an IP address
-                try:
-                    ipaddress.ip_address(hostname_or_ip)
-                    ip = hostname_or_ip
-                    hostname = None
-                except ValueError:
-                    # If not a valid IP, it might be a hostname
-                    ip = None
-                    hostname = hostname_or_ip
-                
-                # Extract RTT values
-                rtts = []
-                for i in range(2, 5):
-                    if win_match.group(i):
-                        rtts.append(float(win_match.group(i)))
-                
-                return Hop(hop_num, ip, hostname, rtts)
-
-            # If no pattern matches, log detailed information and continue processing
-            print(f"Could not match any known pattern: {line}")
-            
-        except Exception as e:
-            print(f"Parsing error: {e}")
-        
-        return None
+        if self._parser is None:
+            self._parser = self._create_parser()
+        return self._parser.parse_line(line)
 
     async def run(self) -> List[Hop]:
         """
@@ -216,6 +642,9 @@ class Traceroute:
         Returns:
             List[Hop]: List of hop objects containing trace information
         """
+        if self.backend == 'native' or self.stop_set is not None:
+            return [hop async for hop in self.run_stream()]
+
         print(f"Executing traceroute command: {self.target}")
         proc = await asyncio.create_subprocess_shell(
             self._build_command(),
@@ -230,17 +659,62 @@ class Traceroute:
         print(f"Standard output: {stdout.decode()}")
         
         output = stdout.decode()
-        return self._parse_output(output)
+        hops = self._parse_output(output)
+        hops = self._apply_gap_limit(hops)
+        if self.stop_reason != STOP_GAP_LIMIT:
+            self.stop_reason = self._reason_from_last_hop(hops[-1] if hops else None)
+        return hops
+
+    def _apply_gap_limit(self, hops: List[Hop]) -> List[Hop]:
+        """Cut a completed trace after ``gap_limit`` consecutive silent hops"""
+        self.stop_reason = None
+        if self.gap_limit is None:
+            return hops
+        silent_hops = 0
+        for index, hop in enumerate(hops):
+            silent_hops = silent_hops + 1 if hop.ip is None else 0
+            if silent_hops >= self.gap_limit and index + 1 < len(hops):
+                self.stop_reason = STOP_GAP_LIMIT
+                return hops[:index + 1]
+        return hops
+
+    async def run_rounds(self, interval: float = 1.0, rounds: Optional[int] = None) -> AsyncGenerator[List[Hop], None]:
+        """
+        Re-probe the path in rounds, like mtr, until stopped.
+
+        Args:
+            interval: Minimum seconds between the starts of consecutive rounds
+            rounds: Number of rounds to run, None to run until stop() is called
+
+        Yields:
+            List[Hop]: The hops seen in each round
+        """
+        self._stopped = False
+        completed = 0
+        while not self._stopped and (rounds is None or completed < rounds):
+            started = time.monotonic()
+            hops = await self.run()
+            if self._stopped:
+                return
+            completed += 1
+            yield hops
+            if rounds is None or completed < rounds:
+                await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
 
-    def _build_command(self):
+    def _build_command(self, first_ttl: int = 1, last_ttl: Optional[int] = None):
         os_name = platform.system().lower()
+        max_hops = last_ttl or self.max_hops
         
+        # Trace the already resolved address so the binary does not look it up again
+        is_ipv6 = ':' in self.target_ip
         if os_name == 'darwin':  # macOS
-            cmd = f'traceroute -n -w {int(self.timeout)} -q {self.retries} -m {self.max_hops} {self.target}'
+            binary = 'traceroute6' if is_ipv6 else 'traceroute'
+            # BSD traceroute only takes whole seconds
+            cmd = f'{binary} -n -f {first_ttl} -w {max(1, round(self.timeout))} -q {self.retries} -m {max_hops} {self.target_ip}'
         elif os_name == 'linux':
-            cmd = f'traceroute -n -w {int(self.timeout)} -q {self.retries} -m {self.max_hops} {self.target}'
+            cmd = f'traceroute -n -f {first_ttl} -w {self.timeout:g} -q {self.retries} -m {max_hops} {self.target_ip}'
         elif os_name == 'windows':
-            cmd = f'tracert -w {int(self.timeout * 1000)} -h {self.max_hops} {self.target}'
+            cmd = f'tracert -w {int(self.timeout * 1000)} -h {max_hops} {self.target_ip}'
         else:
             raise RuntimeError(f"Unsupported operating system: {os_name}")
         
@@ -248,10 +722,4 @@ class Traceroute:
         return cmd
 
     def _parse_output(self, output: str) -> List[Hop]:
-        hops = []
-        lines = output.splitlines()
-        for line in lines:
-            hop = self._parse_hop(line)
-            if hop:
-                hops.append(hop)
-        return hops 
\ No newline at end of file
+        return self._create_parser().parse(output) 
\ No newline at end of file
@@ -5,14 +5,49 @@ from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
 import uvicorn
 import argparse
+import asyncio
+import json
+import os
+import signal
+from contextlib import asynccontextmanager
 from pathlib import Path
 from dotenv import load_dotenv
-from geotraceroute.api.routes import router
+from geotraceroute.api.routes import router, data_processor
+from geotraceroute.core.data_processor import DataProcessor
+from geotraceroute.core.scheduler import TraceScheduler
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the GeoIP databases before serving requests and release them at shutdown"""
+    data_processor.open()
+    # Replaced database and override files are picked up while serving: polled, or on SIGHUP
+    watch_interval = float(os.getenv('GEOIP_WATCH_INTERVAL', '60'))
+    watcher = asyncio.create_task(data_processor.watch_data_files(watch_interval)) if watch_interval > 0 else None
+    # Expired IPInfo answers are dropped from the persistent cache at startup and then daily
+    compact_interval = float(os.getenv('IPINFO_COMPACT_INTERVAL', '86400'))
+    compactor = (asyncio.create_task(data_processor.ip_info_service.compact_store_periodically(compact_interval))
+                 if compact_interval > 0 else None)
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(data_processor.reload_data(force=True)))
+        sighup = True
+    except (AttributeError, NotImplementedError, RuntimeError):
+        # No SIGHUP on Windows, and no signal handlers outside the main thread
+        sighup = False
+    yield
+    if sighup:
+        loop.remove_signal_handler(signal.SIGHUP)
+    for task in (watcher, compactor):
+        if task is not None:
+            task.cancel()
+    data_processor.close()
+    await data_processor.ip_info_service.close()
 
 app = FastAPI(
     title="GeoTraceroute API",
     description="API for performing traceroute with geographical information",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -39,6 +74,18 @@ async def get_home(request: Request):
     """Return the frontend homepage"""
     return templates.TemplateResponse("index.html", {"request": request})
 
+async def run_bulk(targets, concurrency, budget, max_hops, include_reputation, gap_limit=None, parallel=False):
+    """Trace targets from the command line, printing one JSON event per line"""
+    processor = DataProcessor()
+    scheduler = TraceScheduler(processor, concurrency=concurrency, target_budget=budget,
+                               max_hops=max_hops, gap_limit=gap_limit, parallel=parallel)
+    try:
+        async for event in scheduler.run(targets, include_reputation=include_reputation):
+            print(json.dumps(event), flush=True)
+    finally:
+        processor.close()
+        await processor.ip_info_service.close()
+
 def main():
     """Run the application as a script"""
     # Load environment variables
@@ -50,9 +97,27 @@ def main():
     parser.add_argument('--port', type=int, default=8000, help='Port to bind to')
     parser.add_argument('--reload', action='store_true', help='Enable auto-reload')
     parser.add_argument('--workers', type=int, default=1, help='Number of worker processes')
+    parser.add_argument('--trace', nargs='+', metavar='TARGET', help='Trace targets and print JSON lines instead of serving')
+    parser.add_argument('--targets-file', type=str, help='File with one target per line to trace instead of serving')
+    parser.add_argument('--concurrency', type=int, default=None, help='Maximum number of targets traced at once')
+    parser.add_argument('--budget', type=float, default=60.0, help='Seconds allowed for each target')
+    parser.add_argument('--max-hops', type=int, default=30, help='Maximum number of hops per target')
+    parser.add_argument('--reputation', action='store_true', help='Include reputation scores')
+    parser.add_argument('--gap-limit', type=int, default=None,
+                        help='Stop a target after this many consecutive hops without a reply')
+    parser.add_argument('--parallel', action='store_true', help='Probe all hops of a target at once')
     
     args = parser.parse_args()
 
+    if args.trace or args.targets_file:
+        targets = list(args.trace or [])
+        if args.targets_file:
+            with open(args.targets_file) as f:
+                targets.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+        asyncio.run(run_bulk(targets, args.concurrency, args.budget, args.max_hops, args.reputation,
+                             args.gap_limit, args.parallel))
+        return
+
     # Start the service
     uvicorn.run(
         "geotraceroute.main:app",
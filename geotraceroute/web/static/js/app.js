@@ -446,6 +446,12 @@ async function processStream(response) {
                             continue;
                         }
 
+                        // Reverse DNS answers arrive after their hop, update it in place
+                        if (hop && hop.type === 'hostname') {
+                            updateHopHostname(hop, hops);
+                            continue;
+                        }
+
                         // Make sure hop has necessary fields
                         if (hop && hop.hop_number !== undefined) {
                             hasReceivedValidHop = true; // Mark valid data received
@@ -567,7 +573,8 @@ function processSingleHop(hop, hops, latencies) {
     }
 
     // Add result to list
-    addResultLine(formatHopResult(hop), hop.error ? 'error' : 'success');
+    const resultItem = addResultLine(formatHopResult(hop), hop.error ? 'error' : 'success');
+    if (resultItem) resultItem.dataset.hopNumber = hopNumber;
 
     // Add to hops array
     hops.push(hop);
@@ -576,6 +583,18 @@ function processSingleHop(hop, hops, latencies) {
     return { hopCount: hops.length, lastLocation: location };
 }
 
+// Fill in the hostname of a hop already shown
+function updateHopHostname(update, hops) {
+    const hop = hops.find(h => h.hop_number === update.hop_number && h.ip === update.ip);
+    if (!hop) return;
+
+    hop.hostname = update.hostname;
+    logDebugMessage(`Hostname for hop #${hop.hop_number}: ${hop.hostname}`);
+
+    const resultItem = resultList && resultList.querySelector(`[data-hop-number="${hop.hop_number}"]`);
+    if (resultItem) resultItem.innerHTML = formatHopResult(hop);
+}
+
 // Format hop result for display
 function formatHopResult(hop) {
     if (!hop) return "Error: Invalid hop data";
@@ -781,6 +800,7 @@ function addResultLine(text, type = 'info') {
 
     resultList.appendChild(resultItem);
     resultList.scrollTop = resultList.scrollHeight;
+    return resultItem;
 }
 
 // Stop the current traceroute
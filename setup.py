@@ -19,6 +19,10 @@ setup(
         "pytest-asyncio==0.21.1",
         "httpx==0.25.1",
     ],
+    extras_require={
+        # Vectorized bulk GeoIP lookups for offline analysis
+        'bulk': ["numpy>=1.24"],
+    },
     entry_points={
         'console_scripts': [
             'geotraceroute=geotraceroute.main:main',
@@ -2,6 +2,7 @@ import pytest
 from unittest.mock import patch, MagicMock
 from geotraceroute.core.traceroute import Traceroute, Hop
 from geotraceroute.core.ip_info import IPInfo
+from geotraceroute.core.data_processor import DataProcessor
 
 # Test data
 TEST_TARGET = "example.com"
@@ -63,6 +64,25 @@ def mock_data_processor():
         ])
         yield processor
 
+@pytest.fixture
+def processor_with_readers():
+    """Create DataProcessors that look IPs up in mocked GeoIP readers, placing them in Amsterdam by default"""
+    def create(**kwargs):
+        processor = DataProcessor(test_mode=True, **kwargs)
+        processor.test_mode = False
+        processor.city_reader = MagicMock()
+        processor.asn_reader = MagicMock()
+        city = processor.city_reader.city.return_value
+        city.city.name = "Amsterdam"
+        city.country.name = "Netherlands"
+        city.location.latitude = 52.37
+        city.location.longitude = 4.89
+        asn = processor.asn_reader.asn.return_value
+        asn.autonomous_system_organization = "AMS-IX"
+        asn.autonomous_system_number = 1200
+        return processor
+    return create
+
 @pytest.fixture
 def mock_ip_info():
     """Create a mocked IPInfoService"""
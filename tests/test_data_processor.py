@@ -21,7 +21,7 @@ def data_processor():
 @pytest.fixture
 def mock_geoip():
     """创建模拟的GeoIP数据库"""
-    with patch('geotraceroute.core.data_processor.geoip2.database.Reader') as mock:
+    with patch('geotraceroute.core.geoip_readers.geoip2.database.Reader') as mock:
         reader = mock.return_value
         # mock city database response
         city_response = MagicMock()
@@ -230,4 +230,391 @@ async def test_geoip_database_availability():
     # ensure database files exist
     base_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
     assert os.path.exists(os.path.join(base_path, 'GeoLite2-City.mmdb'))
-    assert os.path.exists(os.path.join(base_path, 'GeoLite2-ASN.mmdb')) 
\ No newline at end of file
+    assert os.path.exists(os.path.join(base_path, 'GeoLite2-ASN.mmdb')) 
+
+class StubDNSServer(asyncio.DatagramProtocol):
+    """Answer PTR queries from a fixed table"""
+
+    def __init__(self, records):
+        self.records = records
+        self.queries = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.queries += 1
+        query_id = data[:2]
+        question_end = data.index(b'\x00', 12) + 5
+        question = data[12:question_end]
+        labels, offset = [], 12
+        while data[offset]:
+            labels.append(data[offset + 1:offset + 1 + data[offset]].decode())
+            offset += 1 + data[offset]
+        hostname = self.records.get('.'.join(labels))
+        if hostname is None:
+            self.transport.sendto(query_id + b'\x81\x83\x00\x01\x00\x00\x00\x00\x00\x00' + question, addr)
+            return
+        rdata = b''.join(bytes([len(label)]) + label.encode() for label in hostname.split('.')) + b'\x00'
+        answer = b'\xc0\x0c\x00\x0c\x00\x01\x00\x00\x0e\x10' + len(rdata).to_bytes(2, 'big') + rdata
+        self.transport.sendto(query_id + b'\x81\x80\x00\x01\x00\x01\x00\x00\x00\x00' + question + answer, addr)
+
+@pytest.mark.asyncio
+async def test_reverse_resolver_with_stub_dns_server():
+    """测试通过本地DNS服务器批量解析主机名"""
+    from geotraceroute.core.rdns import ReverseResolver, DNSPTRLookup
+
+    loop = asyncio.get_running_loop()
+    server = StubDNSServer({"8.8.8.8.in-addr.arpa": "dns.google"})
+    transport, _ = await loop.create_datagram_endpoint(lambda: server, local_addr=('127.0.0.1', 0))
+    port = transport.get_extra_info('sockname')[1]
+    try:
+        resolver = ReverseResolver(lookup=DNSPTRLookup('127.0.0.1', port), concurrency=2, deadline=1.0)
+        result = await resolver.resolve_many(["8.8.8.8", "192.0.2.1", "8.8.8.8"])
+        assert result == {"8.8.8.8": "dns.google", "192.0.2.1": None}
+
+        # Positive and negative answers are both served from the cache
+        assert await resolver.resolve("8.8.8.8") == "dns.google"
+        assert await resolver.resolve("192.0.2.1") is None
+        assert server.queries == 2
+    finally:
+        transport.close()
+
+@pytest.mark.asyncio
+async def test_process_traceroute_stream_hostname_updates():
+    """测试主机名查询不会延迟跳转点事件"""
+    from geotraceroute.core.rdns import ReverseResolver
+
+    async def slow_lookup(ip):
+        await asyncio.sleep(0.05)
+        return "dns.google" if ip == "8.8.8.8" else None
+
+    processor = DataProcessor(test_mode=True, reverse_resolver=ReverseResolver(lookup=slow_lookup))
+    tracer = Traceroute("8.8.8.8", backend='subprocess')
+
+    async def mock_run_stream():
+        yield Hop(1, "192.168.1.1", None, [1.0])
+        yield Hop(2, "8.8.8.8", None, [2.0])
+
+    with patch.object(tracer, 'run_stream', side_effect=mock_run_stream):
+        events = [event async for event in processor.process_traceroute_stream(tracer)]
+
+    assert [event.get("type") for event in events] == [None, None, "hostname"]
+    assert events[1]["hostname"] is None
+    assert events[2] == {"type": "hostname", "hop_number": 2, "ip": "8.8.8.8", "hostname": "dns.google"}
+
+@pytest.mark.asyncio
+async def test_process_monitor_stream_enriches_once_per_ip_change(data_processor):
+    """测试持续监控模式只在IP变化时丰富数据"""
+    scripted_rounds = [
+        [Hop(1, "192.168.1.1", None, [1.0]), Hop(2, "8.8.8.8", None, [2.0])],
+        [Hop(1, "192.168.1.1", None, [1.2]), Hop(2, "8.8.8.8", None, [2.4])],
+        [Hop(1, "192.168.1.1", None, [1.1]), Hop(2, "8.8.4.4", None, [3.0])],
+    ]
+    tracer = Traceroute("8.8.8.8", backend='subprocess')
+
+    async def mock_run_rounds(interval, rounds=None):
+        for hops in scripted_rounds:
+            yield hops
+
+    with patch.object(tracer, 'run_rounds', side_effect=mock_run_rounds), \
+            patch.object(data_processor, '_enrich_hop_data', wraps=data_processor._enrich_hop_data) as enrich:
+        deltas = [delta async for delta in data_processor.process_monitor_stream(tracer, interval=0)]
+
+    assert [delta["round"] for delta in deltas] == [1, 2, 3]
+    # Two hops in round one, then only the hop whose IP changed
+    assert enrich.call_count == 3
+    assert "city" in deltas[0]["hops"][1]
+    assert "city" not in deltas[1]["hops"][1]
+    assert deltas[2]["hops"][1]["ip"] == "8.8.4.4"
+    assert deltas[1]["hops"][1]["received"] == 2
+    assert deltas[1]["hops"][1]["avg_ms"] == 2.2
+
+@pytest.mark.asyncio
+async def test_process_traceroute_enriches_hops_concurrently():
+    """测试并发丰富所有跃点, 保持顺序并在截止时间后返回已完成的跃点"""
+    processor = DataProcessor(test_mode=True, enrich_concurrency=10, enrich_deadline=0.5)
+    tracer = Traceroute("8.8.8.8", backend='subprocess')
+    hops = [Hop(n, f"8.8.4.{n}", None, [float(n)]) for n in range(1, 11)]
+    original = processor._enrich_hop_data
+
+    async def slow_enrich(hop, include_reputation=False):
+        # The last hop's lookup never finishes in time
+        await asyncio.sleep(5 if hop.hop_number == 10 else 0.2)
+        return await original(hop, include_reputation)
+
+    async def mock_run_stream():
+        for hop in hops:
+            yield hop
+
+    with patch.object(tracer, 'run_stream', side_effect=mock_run_stream), \
+            patch.object(processor, '_enrich_hop_data', side_effect=slow_enrich):
+        started = asyncio.get_running_loop().time()
+        result = await processor.process_traceroute(tracer)
+        elapsed = asyncio.get_running_loop().time() - started
+
+    # Roughly one lookup plus the deadline, not the sum of all lookups
+    assert elapsed < 1.0
+    assert [hop["hop_number"] for hop in result["hops"]] == list(range(1, 11))
+    assert result["hops"][1]["city"] == "Mountain View"
+    assert result["hops"][9]["city"] is None
+    assert result["hops"][9]["rtt_ms"] == [10.0]
+
+@pytest.mark.asyncio
+async def test_process_traceroute_stream_pipelines_enrichment(data_processor):
+    """测试流式处理时探测与数据丰富并行进行且按跃点顺序输出"""
+    tracer = Traceroute("8.8.8.8", backend='subprocess')
+    original = data_processor._enrich_hop_data
+    read = []
+
+    async def mock_run_stream():
+        for n in range(1, 7):
+            read.append(n)
+            yield Hop(n, f"8.8.4.{n}", None, [float(n)])
+            await asyncio.sleep(0.01)
+
+    async def slow_enrich(hop, include_reputation=False):
+        # Early hops take longest, so completion order differs from hop order
+        await asyncio.sleep(0.3 - hop.hop_number * 0.04)
+        return await original(hop, include_reputation)
+
+    with patch.object(tracer, 'run_stream', side_effect=mock_run_stream), \
+            patch.object(data_processor, '_enrich_hop_data', side_effect=slow_enrich):
+        started = asyncio.get_running_loop().time()
+        stream = data_processor.process_traceroute_stream(tracer)
+        first = await stream.__anext__()
+        # The trace kept being read while the first hop was enriched
+        assert len(read) == 6
+        events = [first] + [event async for event in stream]
+        elapsed = asyncio.get_running_loop().time() - started
+
+    assert [event["hop_number"] for event in events] == [1, 2, 3, 4, 5, 6]
+    assert elapsed < 0.6
+
+
+@pytest.mark.asyncio
+async def test_process_traceroute_stream_applies_backpressure():
+    """测试消费者缓慢时读取端受有界队列限制"""
+    processor = DataProcessor(test_mode=True, enrich_concurrency=2)
+    tracer = Traceroute("8.8.8.8", backend='subprocess')
+    read = []
+
+    async def mock_run_stream():
+        for n in range(1, 21):
+            read.append(n)
+            yield Hop(n, f"8.8.4.{n}", None, [float(n)])
+
+    with patch.object(tracer, 'run_stream', side_effect=mock_run_stream):
+        stream = processor.process_traceroute_stream(tracer)
+        await stream.__anext__()
+        await asyncio.sleep(0.05)
+        # One emitted, the queue full and the reader holding one more
+        assert len(read) <= 5
+        await stream.aclose()
+
+@pytest.mark.asyncio
+async def test_enrichment_cache_reuses_lookups(mock_geoip, mock_ip_info):
+    """测试丰富数据缓存复用查询结果并统计命中、未命中和淘汰"""
+    from geotraceroute.core.enrichment_cache import EnrichmentCache
+
+    cache = EnrichmentCache(max_entries=2)
+    processor = DataProcessor(enrichment_cache=cache)
+
+    first = await processor._enrich_hop_data(Hop(5, "8.8.8.8", None, [1.0]), include_reputation=True)
+    second = await processor._enrich_hop_data(Hop(7, "8.8.8.8", None, [2.0]), include_reputation=True)
+
+    assert mock_geoip.city.call_count == 1
+    assert mock_ip_info.call_count == 1
+    assert second["city"] == first["city"] == "Mountain View"
+    assert second["hop_number"] == 7 and second["rtt_ms"] == [2.0]
+    assert second["reputation_score"] == first["reputation_score"]
+    assert cache.stats()["hits"] == 2
+
+    await processor._enrich_hop_data(Hop(5, "8.8.4.4", None, [1.0]))
+    await processor._enrich_hop_data(Hop(5, "1.1.1.1", None, [1.0]))
+    assert cache.stats()["evictions"] == 1
+    assert cache.get("8.8.8.8") is None
+    # Equal strings from different lookups share one object
+    cache.put("9.9.9.9", {"organization": "".join(["Quad", "9"])}, "ipinfo")
+    cache.put("149.112.112.112", {"organization": "".join(["Qua", "d9"])}, "ipinfo")
+    assert cache.get("9.9.9.9")["organization"] is cache.get("149.112.112.112")["organization"]
+
+    expired = EnrichmentCache(ttls={"geoip": -1})
+    expired.put("8.8.8.8", first, "geoip")
+    assert expired.get("8.8.8.8") is None
+    assert expired.stats()["expirations"] == 1
+
+@pytest.mark.asyncio
+async def test_negative_cache_skips_known_empty_ips(mock_geoip, mock_ip_info):
+    """测试没有位置数据的IP被单独负缓存, 重复出现时不再查询, 强制刷新时重新查询"""
+    from geotraceroute.core.enrichment_cache import EnrichmentCache
+
+    mock_geoip.city.return_value.location.latitude = None
+    mock_ip_info.return_value = IPInfo(ip="8.8.4.4", country=None, city=None, latitude=None,
+                                       longitude=None, org=None, reputation_score=None)
+    cache = EnrichmentCache()
+    processor = DataProcessor(enrichment_cache=cache)
+
+    first = await processor._enrich_hop_data(Hop(5, "8.8.4.4", None, [1.0]))
+    second = await processor._enrich_hop_data(Hop(6, "8.8.4.4", None, [1.0]))
+
+    assert mock_ip_info.call_count == 1
+    assert first["latitude"] is second["latitude"] is None
+    # The ASN answer is kept with the negative entry
+    assert second["organization"] == "Google LLC"
+    stats = cache.stats()
+    assert stats["size"] == 0 and stats["negative_size"] == 1
+    assert stats["negative_hits"] == 1
+
+    await processor.refresh_location("8.8.4.4")
+    assert mock_ip_info.call_count == 2
+    assert mock_ip_info.call_args.kwargs == {"refresh": True}
+    assert cache.negative_strikes("8.8.4.4") == 1
+
+    # A location found later replaces the negative entry
+    cache.put("8.8.4.4", {"city": "Mountain View", "latitude": 37.4, "longitude": -122.0}, "ipinfo")
+    assert cache.get("8.8.4.4")["city"] == "Mountain View"
+    assert cache.stats()["negative_size"] == 0
+
+@pytest.mark.asyncio
+async def test_failed_ipinfo_lookup_is_not_cached(mock_geoip, mock_ip_info):
+    """测试IPInfo查询失败(熔断、限流、超时)时不写入负缓存, 下一跳重新查询"""
+    from geotraceroute.core.enrichment_cache import EnrichmentCache
+    from geotraceroute.core.ip_info import UnavailableIPInfo
+
+    mock_geoip.city.return_value.location.latitude = None
+    mock_ip_info.return_value = UnavailableIPInfo("8.8.4.4")
+    cache = EnrichmentCache()
+    processor = DataProcessor(enrichment_cache=cache)
+
+    await processor._enrich_hop_data(Hop(5, "8.8.4.4", None, [1.0]), include_reputation=True)
+    second = await processor._enrich_hop_data(Hop(6, "8.8.4.4", None, [1.0]), include_reputation=True)
+
+    assert mock_ip_info.call_count == 2
+    assert second["latitude"] is None and second["reputation_score"] is None
+    assert "8.8.4.4" not in cache and cache.negative_strikes("8.8.4.4") == 0
+    assert cache.get_reputation("8.8.4.4")[0] is False
+
+def test_negative_cache_backoff_escalates():
+    """测试负缓存的有效期随连续失败次数加倍, 并受上限约束"""
+    from geotraceroute.core.enrichment_cache import EnrichmentCache
+
+    cache = EnrichmentCache(ttls={"none": 60}, negative_max_ttl=300)
+    ttls = [cache.put("8.8.4.4", {}, "none") for _ in range(5)]
+    assert ttls == [60, 120, 240, 300, 300]
+    assert cache.put("8.8.4.4", {}, "none", strikes=1) == 60
+    assert "8.8.4.4" in cache
+
+    cache.forget("8.8.4.4")
+    assert "8.8.4.4" not in cache
+    assert cache.negative_strikes("8.8.4.4") == 0
+
+class FakeRedis:
+    """内存中的Redis替身, 只实现缓存层用到的流水线接口"""
+
+    def __init__(self, fail=False):
+        self.data = {}
+        self.ttls = {}
+        self.pipelines = 0
+        self.fail = fail
+
+    def pipeline(self, transaction=True):
+        fake = self
+
+        class _Pipeline:
+            def __init__(self):
+                self.commands = []
+
+            def get(self, key):
+                self.commands.append(('get', key, None, None))
+
+            def set(self, key, value, ex=None):
+                self.commands.append(('set', key, value, ex))
+
+            async def execute(self):
+                import redis.exceptions
+                if fake.fail:
+                    raise redis.exceptions.ConnectionError("connection refused")
+                fake.pipelines += 1
+                results = []
+                for command, key, value, ex in self.commands:
+                    if command == 'get':
+                        results.append(fake.data.get(key))
+                    else:
+                        fake.data[key] = value.encode()
+                        fake.ttls[key] = ex
+                        results.append(True)
+                return results
+
+        return _Pipeline()
+
+@pytest.mark.asyncio
+async def test_redis_tier_shares_enrichment_between_instances(processor_with_readers):
+    """测试Redis共享缓存层在实例之间共享数据丰富结果并批量读取"""
+    from geotraceroute.core.redis_cache import RedisCache
+
+    redis_client = FakeRedis()
+    first = processor_with_readers(shared_cache=RedisCache(client=redis_client))
+    second = processor_with_readers(shared_cache=RedisCache(client=redis_client))
+
+    hops = [Hop(n, f"80.249.208.{n}", None, [float(n)]) for n in range(2, 6)]
+    for hop in hops:
+        await first._enrich_hop_data(hop)
+    assert all(ttl == 86400 for ttl in redis_client.ttls.values())
+
+    pipelines = redis_client.pipelines
+    enriched = await second._enrich_hops(hops)
+    # One pipelined read for the whole trace, no database lookups
+    assert redis_client.pipelines == pipelines + 1
+    assert second.city_reader.city.call_count == 0
+    assert [hop["city"] for hop in enriched] == ["Amsterdam"] * 4
+
+@pytest.mark.asyncio
+async def test_redis_tier_degrades_to_local_cache(processor_with_readers):
+    """测试Redis不可用时退回本地缓存且暂停重试"""
+    from geotraceroute.core.redis_cache import RedisCache
+
+    redis_client = FakeRedis(fail=True)
+    processor = processor_with_readers(shared_cache=RedisCache(client=redis_client, retry_after=60))
+
+    result = await processor._enrich_hop_data(Hop(3, "80.249.208.1", None, [1.0]))
+    assert result["city"] == "Amsterdam"
+    assert not processor.shared_cache._available()
+    assert await processor.shared_cache.get_many("location", ["80.249.208.1"]) == {}
+    assert RedisCache(url=None).enabled is False
+
+@pytest.mark.asyncio
+async def test_ipinfo_lookup_merged_per_hop_and_across_traces(tmp_path, processor_with_readers):
+    """测试每个跃点只查询一次IPInfo, 并发的相同查询只发出一次上游请求"""
+    from geotraceroute.core.ipinfo_store import IPInfoStore
+
+    upstream = []
+
+    async def mock_fetch(ip):
+        upstream.append(ip)
+        await asyncio.sleep(0.05)
+        return IPInfo(ip, "SG", "Singapore", 1.29, 103.85, "Example Transit", 0.6)
+
+    def processor_without_location():
+        processor = processor_with_readers()
+        processor.city_reader.city.return_value.location.latitude = None
+        processor.ip_info_service = service
+        return processor
+
+    service = IPInfoService(store=IPInfoStore(str(tmp_path / "ipinfo.sqlite3")))
+    with patch.object(service, '_fetch_ip_info', side_effect=mock_fetch):
+        result = await processor_without_location()._enrich_hop_data(
+            Hop(4, "203.0.114.9", None, [1.0]), include_reputation=True
+        )
+        assert result["city"] == "Singapore"
+        assert result["reputation_score"] == 0.6
+        assert upstream == ["203.0.114.9"]
+
+        # The same new IP in ten simultaneous traces
+        processors = [processor_without_location() for _ in range(10)]
+        results = await asyncio.gather(*(
+            processor._enrich_hop_data(Hop(6, "203.0.114.77", None, [1.0]), include_reputation=True)
+            for processor in processors
+        ))
+        assert upstream.count("203.0.114.77") == 1
+        assert all(result["city"] == "Singapore" for result in results)
@@ -1,6 +1,7 @@
 import pytest
 from unittest.mock import patch, MagicMock
 import asyncio
+import ipaddress
 import sys
 import os
 
@@ -139,4 +140,317 @@ async def test_multiple_hops():
                 assert hop['city'] is not None or hop['country'] is not None, "Should have some location data"
                 assert hop['organization'] is not None, "Should have organization data"
                 if hop['asn'] is not None:
-                    assert isinstance(hop['asn'], int), "Should have valid ASN" 
\ No newline at end of file
+                    assert isinstance(hop['asn'], int), "Should have valid ASN" 
+def test_geoip_readers_open_lazily(tmp_path):
+    """Readers are opened on first use, once, and opened again after close()"""
+    from geotraceroute.core.geoip_readers import GeoIPReaders, OPEN_MODES
+
+    for name in ("GeoLite2-City.mmdb", "GeoLite2-ASN.mmdb"):
+        (tmp_path / name).write_bytes(b"mmdb")
+
+    with patch('geotraceroute.core.geoip_readers.geoip2.database.Reader') as reader_class:
+        reader_class.return_value.metadata.return_value.build_epoch = 1
+        readers = GeoIPReaders(str(tmp_path), mode='memory')
+        reader_class.assert_not_called()
+
+        city = readers.city
+        assert readers.city is city
+        reader_class.assert_called_once_with(str(tmp_path / "GeoLite2-City.mmdb"), mode=OPEN_MODES['memory'])
+        assert readers.stats()["open"] == ["city"]
+
+        readers.close()
+        city.close.assert_called_once()
+        assert readers.stats()["open"] == [] and readers.version == ""
+        assert readers.city is not None
+        assert reader_class.call_count == 2
+
+def test_geoip_readers_validate_mode():
+    """GEOIP_MODE must name one of the open modes"""
+    from geotraceroute.core.geoip_readers import GeoIPReaders
+
+    with patch.dict(os.environ, {"GEOIP_MODE": "mmap"}):
+        assert GeoIPReaders().mode == "mmap"
+    with patch.dict(os.environ, {"GEOIP_MODE": "swap"}):
+        with pytest.raises(ValueError, match="Unknown GeoIP open mode"):
+            GeoIPReaders()
+
+def test_geoip_readers_remember_open_errors(tmp_path):
+    """A database that fails to open is reported once and not retried on every lookup"""
+    from geotraceroute.core.geoip_readers import GeoIPReaders
+
+    with patch('geotraceroute.core.geoip_readers.geoip2.database.Reader',
+               side_effect=FileNotFoundError("missing")) as reader_class:
+        readers = GeoIPReaders(str(tmp_path))
+        assert readers.asn is None
+        assert readers.asn is None
+        assert reader_class.call_count == 1
+        assert "asn" in readers.stats()["errors"]
+
+        # close() forgets the error, so the next lookup tries again
+        readers.close()
+        assert readers.asn is None
+        assert reader_class.call_count == 2
+
+def test_prefix_trie_longest_match():
+    """The prefix trie finds the longest matching prefix for IPv4 and IPv6"""
+    from geotraceroute.core.prefix_trie import PrefixTrie
+
+    trie = PrefixTrie()
+    trie.insert("8.0.0.0/8", "wide")
+    trie.insert("8.8.8.0/24", "google")
+    trie.insert("2001:4860::/32", "google6")
+    trie.insert("0.0.0.0/0", "default")
+
+    assert trie.lookup("8.8.8.8")[1] == "google"
+    assert str(trie.lookup("8.8.4.4")[0]) == "8.0.0.0/8"
+    assert trie.lookup("1.1.1.1")[1] == "default"
+    assert trie.lookup("2001:4860:4860::8888")[1] == "google6"
+    assert trie.lookup("2606:4700::1111") is None
+    assert len(trie) == 4
+    assert [str(network) for network, _ in trie.items()][:2] == ["0.0.0.0/0", "8.0.0.0/8"]
+
+@pytest.mark.asyncio
+async def test_geoip_prefix_cache_answers_whole_network(processor_with_readers):
+    """GeoIP answers are cached per network, so other IPs in it skip the database"""
+    import geoip2.errors
+
+    processor = processor_with_readers()
+    city = processor.city_reader.city.return_value
+    city.city.name = "Frankfurt"
+    city.country.name = "Germany"
+    city.location.latitude = 50.1
+    city.location.longitude = 8.7
+    city.traits.network = ipaddress.ip_network("80.81.192.0/21")
+    asn = processor.asn_reader.asn.return_value
+    asn.autonomous_system_organization = "DE-CIX"
+    asn.autonomous_system_number = 6695
+    asn.network = ipaddress.ip_network("80.81.192.0/21")
+
+    for last in (1, 2, 200):
+        result = await processor._enrich_hop_data(Hop(5, f"80.81.19{last % 3}.{last}", None, [1.0]))
+        assert result["city"] == "Frankfurt" and result["asn"] == 6695
+
+    assert processor.city_reader.city.call_count == 1
+    assert processor.asn_reader.asn.call_count == 1
+
+    # Addresses missing from the database are remembered per network as well
+    processor.city_reader.city.side_effect = geoip2.errors.AddressNotFoundError("not found", "100.64.0.1", 10)
+    assert processor.geoip_cache.city(processor.city_reader, "100.64.0.1") is None
+    assert processor.geoip_cache.city(processor.city_reader, "100.100.0.1") is None
+    assert processor.city_reader.city.call_count == 2
+
+def test_geoip_lean_lookup_reads_raw_records():
+    """The lean lookup reads raw records, returning the city and ASN fields at once without building geoip2 models"""
+    import maxminddb.reader
+    from geotraceroute.core.geoip_cache import GeoIPPrefixCache, GeoRecord, lookup_record
+
+    class RawReader(maxminddb.reader.Reader):
+        def __init__(self, record, prefix_len):
+            self.record = record
+            self.prefix_len = prefix_len
+            self.calls = 0
+
+        def get_with_prefix_len(self, ip):
+            self.calls += 1
+            return self.record, self.prefix_len
+
+        def get(self, ip):
+            self.calls += 1
+            return self.record
+
+    city_reader = MagicMock()
+    city_reader._db_reader = RawReader({
+        "city": {"names": {"en": "Frankfurt", "de": "Frankfurt am Main"}},
+        "country": {"names": {"en": "Germany", "de": "Deutschland"}},
+        "location": {"latitude": 50.1, "longitude": 8.7, "time_zone": "Europe/Berlin"},
+        "subdivisions": [{"names": {"en": "Hesse"}}],
+    }, 21)
+    asn_reader = MagicMock()
+    asn_reader._db_reader = RawReader({"autonomous_system_organization": "DE-CIX", "autonomous_system_number": 6695}, 21)
+
+    record = lookup_record(city_reader, asn_reader, "80.81.192.1")
+    assert isinstance(record, GeoRecord) and not hasattr(record, "__dict__")
+    assert record.as_dict() == {"city": "Frankfurt", "country": "Germany", "latitude": 50.1,
+                                "longitude": 8.7, "organization": "DE-CIX", "asn": 6695}
+
+    cache = GeoIPPrefixCache()
+    assert cache.locate(city_reader, asn_reader, "80.81.192.1").city == "Frankfurt"
+    assert cache.locate(city_reader, asn_reader, "80.81.199.254").asn == 6695
+    assert city_reader._db_reader.calls == 2 and asn_reader._db_reader.calls == 2
+    city_reader.city.assert_not_called()
+
+    # Addresses without a record are cached under the network the tree ended in
+    missing = MagicMock()
+    missing._db_reader = RawReader(None, 10)
+    assert cache.locate(missing, None, "100.64.0.1").latitude is None
+    assert cache.locate(missing, None, "100.100.0.1").latitude is None
+    assert missing._db_reader.calls == 1
+
+def test_bulk_geo_engine_resolves_arrays(tmp_path):
+    """The bulk engine compiles databases into sorted intervals, looks them up vectorized and caches the compiled tables"""
+    np = pytest.importorskip("numpy")
+    from geotraceroute.core.bulk_geo import BulkGeoEngine, IntervalTable, CITY_COLUMNS, ASN_COLUMNS, _city_row, _asn_row
+
+    def city(name, country, lat, lon):
+        return {"city": {"names": {"en": name}}, "country": {"names": {"en": country}},
+                "location": {"latitude": lat, "longitude": lon}}
+
+    city_networks = [
+        (ipaddress.ip_network("80.81.192.0/21"), city("Frankfurt", "Germany", 50.1, 8.7)),
+        (ipaddress.ip_network("8.8.8.0/24"), city("Mountain View", "United States", 37.4, -122.0)),
+        (ipaddress.ip_network("8.8.4.0/24"), city("Mountain View", "United States", 37.4, -122.0)),
+        (ipaddress.ip_network("2001:4860::/32"), city("Mountain View", "United States", 37.4, -122.0)),
+        (ipaddress.ip_network("1.1.1.0/24"), {"country": {"names": {"en": "Australia"}}}),
+    ]
+    asn_networks = [(ipaddress.ip_network("8.8.0.0/16"),
+                     {"autonomous_system_organization": "Google LLC", "autonomous_system_number": 15169})]
+    city_table = IntervalTable.compile(city_networks, CITY_COLUMNS, _city_row)
+    asn_table = IntervalTable.compile(asn_networks, ASN_COLUMNS, _asn_row)
+
+    # Equal records and names are stored once, IPv6 networks are left to the per-IP path
+    assert len(city_table.starts) == 4
+    assert len(city_table.arrays["col_city"]) == 3
+    assert sorted(city_table.arrays["strings"]) == ["Australia", "Frankfurt", "Germany", "Mountain View", "United States"]
+
+    path = str(tmp_path / "city.npz")
+    city_table.save(path)
+    engine = BulkGeoEngine(IntervalTable.load(path, CITY_COLUMNS), asn_table)
+    result = engine.lookup(["8.8.8.8", "80.81.199.255", "80.81.200.0", "1.1.1.1", "2001:4860::1", "bogus"])
+
+    assert list(result["city"]) == ["Mountain View", "Frankfurt", None, None, None, None]
+    assert list(result["country"]) == ["United States", "Germany", None, "Australia", None, None]
+    assert result["latitude"][1] == 50.1 and np.isnan(result["latitude"][3])
+    assert list(result["asn"]) == [15169, 0, 0, 0, 0, 0]
+    assert list(result["organization"][:2]) == ["Google LLC", None]
+
+    numbers = np.array([int(ipaddress.ip_address("8.8.4.4")), int(ipaddress.ip_address("9.9.9.9"))], dtype=np.uint32)
+    assert list(engine.lookup(numbers)["city"]) == ["Mountain View", None]
+
+@pytest.mark.asyncio
+async def test_geoip_hot_reload_swaps_readers(tmp_path):
+    """Replaced database files are hot reloaded, the old readers close after a grace period and derived caches are dropped"""
+    from geotraceroute.core.enrichment_cache import EnrichmentCache
+    from geotraceroute.core.geoip_readers import GeoIPReaders
+
+    def write(name, content):
+        temporary = tmp_path / f"{name}.tmp"
+        temporary.write_bytes(content)
+        os.replace(temporary, tmp_path / name)
+
+    write("GeoLite2-City.mmdb", b"v1")
+    write("GeoLite2-ASN.mmdb", b"v1")
+    opened = []
+
+    def open_reader(path, mode):
+        reader = MagicMock()
+        reader.metadata.return_value.build_epoch = len(opened) + 1
+        opened.append(reader)
+        return reader
+
+    with patch('geotraceroute.core.geoip_readers.geoip2.database.Reader', side_effect=open_reader) as reader_class:
+        readers = GeoIPReaders(str(tmp_path), close_grace=0)
+        cache = EnrichmentCache()
+        processor = DataProcessor(enrichment_cache=cache, geoip_readers=readers)
+        processor.open()
+        old_city = readers.city
+        assert readers.version == "2-1"
+        cache.put("8.8.8.8", {"city": "Mountain View", "latitude": 37.4, "longitude": -122.0}, "geoip")
+        cache.put("8.8.4.4", {}, "none")
+        cache.put_reputation("8.8.8.8", 0.8)
+
+        assert not await processor.reload_geoip()
+        write("GeoLite2-City.mmdb", b"v2")
+        assert readers.changed()
+        assert await processor.reload_geoip()
+
+        assert readers.city is not old_city and readers.version == "4-3"
+        assert "8.8.8.8" not in cache and "8.8.4.4" not in cache
+        assert cache.get_reputation("8.8.8.8") == (True, 0.8)
+        # The old reader closes once the grace period has passed
+        old_city.close.assert_not_called()
+        await asyncio.sleep(0.01)
+        old_city.close.assert_called_once()
+
+        # A failed reload keeps serving the current databases
+        reader_class.side_effect = OSError("truncated")
+        assert not await processor.reload_geoip(force=True)
+        assert readers.version == "4-3" and readers.stats()["reloads"] == 1
+    processor.close()
+
+def test_override_table_longest_match_and_reload(tmp_path):
+    """Overrides load from CSV or JSON, the longest prefix wins, reloads keep hit counts and an invalid file keeps the old table"""
+    from geotraceroute.core.overrides import DEFAULT_OVERRIDES_PATH, OverrideTable
+
+    path = tmp_path / "geo_overrides.csv"
+    path.write_text("# transit corrections\n"
+                    "network,city,country,latitude,longitude,organization,asn\n"
+                    "84.116.0.0/16,Dublin,Ireland,53.3498,-6.2603,Aorta Network,AS6830\n"
+                    "84.116.130.0/24,Amsterdam,Netherlands,52.37,4.89,,\n"
+                    "2001:7f8:1::/64,,,,,AMS-IX,1200\n")
+    table = OverrideTable(str(path))
+    assert table.lookup("84.116.130.7").fields["city"] == "Amsterdam"
+    dublin = table.lookup("84.116.1.1")
+    assert dublin.fields == {"city": "Dublin", "country": "Ireland", "latitude": 53.3498, "longitude": -6.2603,
+                             "organization": "Aorta Network", "asn": 6830}
+    assert not table.lookup("2001:7f8:1::a500:1200:1").located
+    assert table.lookup("8.8.8.8") is None
+    assert table.stats()["hits"] == {"84.116.0.0/16": 1, "84.116.130.0/24": 1, "2001:7f8:1::/64": 1}
+
+    # Unchanged files are not read again, changed ones keep the hits of networks still listed
+    assert not table.reload()
+    version = table.version
+    table.reload(force=True)
+    other_worker = OverrideTable(str(path))
+    other_worker.reload()
+    # The version follows the content, so other workers loading the same file agree on it
+    assert table.version == version == other_worker.version != ""
+    path.write_text("network,city,latitude,longitude\n84.116.0.0/16,Cork,51.9,-8.47\n")
+    assert table.reload()
+    assert table.version != version
+    assert table.lookup("84.116.130.7").fields["city"] == "Cork"
+    assert table.stats()["hits"] == {"84.116.0.0/16": 2}
+
+    path.write_text("network,latitude\n84.116.0.0/16,north\n")
+    assert not table.reload()
+    assert len(table) == 1 and table.lookup("84.116.1.1").fields["city"] == "Cork"
+
+    json_path = tmp_path / "geo_overrides.json"
+    json_path.write_text('{"192.0.2.0/24": {"city": "Lab", "latitude": 1.5, "longitude": 2.5}}')
+    assert OverrideTable(str(json_path)).lookup("192.0.2.9").located
+    assert OverrideTable(str(tmp_path / "missing.csv")).lookup("192.0.2.9") is None
+    # The shipped table places the Aorta transit network GeoLite2 leaves without a city
+    assert OverrideTable(DEFAULT_OVERRIDES_PATH).lookup("84.116.238.46").fields["city"] == "Dublin"
+
+@pytest.mark.asyncio
+async def test_overrides_consulted_before_geoip_and_ipinfo(tmp_path, processor_with_readers):
+    """Overrides apply before GeoIP and IPInfo, with the ASN database filling in a missing organization"""
+    from geotraceroute.core.overrides import OverrideTable
+
+    path = tmp_path / "geo_overrides.csv"
+    path.write_text("network,city,country,latitude,longitude,organization\n"
+                    "80.81.192.0/21,Frankfurt,Germany,50.11,8.68,\n"
+                    "8.8.8.0/24,,,,,Google Anycast\n")
+    processor = processor_with_readers(overrides=OverrideTable(str(path)))
+    city = processor.city_reader.city.return_value
+    city.city.name = "Mountain View"
+    city.country.name = "United States"
+    city.location.latitude = 37.4
+    city.location.longitude = -122.0
+    city.traits.network = ipaddress.ip_network("8.8.8.0/24")
+    asn = processor.asn_reader.asn.return_value
+    asn.autonomous_system_organization = "DE-CIX"
+    asn.autonomous_system_number = 6695
+    asn.network = ipaddress.ip_network("80.81.192.0/21")
+
+    with patch.object(processor.ip_info_service, 'get_ip_info') as ip_info:
+        result = await processor._enrich_hop_data(Hop(5, "80.81.192.1", None, [1.0]))
+        assert (result["city"], result["latitude"], result["organization"], result["asn"]) == \
+            ("Frankfurt", 50.11, "DE-CIX", 6695)
+        processor.city_reader.city.assert_not_called()
+
+        # Overrides without a location correct the fields they list on top of the usual lookup
+        result = await processor._enrich_hop_data(Hop(6, "8.8.8.8", None, [1.0]))
+        assert (result["city"], result["organization"]) == ("Mountain View", "Google Anycast")
+        ip_info.assert_not_called()
+
+    assert processor.overrides.stats()["hits"] == {"8.8.8.0/24": 1, "80.81.192.0/21": 1}
@@ -1,4 +1,5 @@
 import pytest
+import asyncio
 from unittest.mock import patch, MagicMock
 from geotraceroute.core.ip_info import IPInfoService, IPInfo
 
@@ -112,4 +113,289 @@ def test_calculate_reputation_score(ip_info_service):
     # Unknown organization should have default score
     unknown_data = {"org": "AS12345 Unknown Organization"}
     unknown_score = ip_info_service._calculate_reputation_score(unknown_data)
-    assert unknown_score == 0.5 
\ No newline at end of file
+    assert unknown_score == 0.5 
+
+
+def test_ipinfo_store_skips_writes_while_locked(tmp_path):
+    """Writes give up at once when another process holds the write lock"""
+    import sqlite3
+    import time
+    from geotraceroute.core.ipinfo_store import IPInfoStore
+
+    path = str(tmp_path / "ipinfo.sqlite3")
+    store = IPInfoStore(path)
+    info = IPInfo("8.8.8.8", "US", "Mountain View", 37.4, -122.0, "Google LLC", 0.8)
+    assert store.put(info)
+
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    started = time.perf_counter()
+    assert not store.put(IPInfo("1.1.1.1", "AU", "Sydney", -33.8, 151.2, "Cloudflare", 0.8))
+    assert time.perf_counter() - started < 0.5
+    # Reads go on while the other writer holds the lock
+    assert store.get("8.8.8.8") == info
+    other.execute("ROLLBACK")
+    other.close()
+
+    assert store.put(IPInfo("1.1.1.1", "AU", "Sydney", -33.8, 151.2, "Cloudflare", 0.8))
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_ipinfo_store_compacts_in_a_thread(tmp_path):
+    """Expired results are removed by compaction running off the event loop"""
+    from geotraceroute.core.ipinfo_store import IPInfoStore
+
+    store = IPInfoStore(str(tmp_path / "ipinfo.sqlite3"), ttl=-1)
+    store.put_many([IPInfo(f"8.8.4.{n}", "US", None, None, None, "Google LLC", 0.8) for n in range(3)])
+    service = IPInfoService(store=store)
+
+    assert await service.compact_store() == 3
+    assert len(store) == 0
+    store.close()
+
+
+def test_ipinfo_store_persists_and_compacts(tmp_path):
+    """The persistent cache reads in bulk, expires and compacts results shared by several connections"""
+    from geotraceroute.core.ipinfo_store import IPInfoStore
+
+    path = str(tmp_path / "ipinfo.sqlite3")
+    writer = IPInfoStore(path, ttl=60)
+    reader = IPInfoStore(path, ttl=60)
+    infos = [IPInfo(f"8.8.4.{n}", "US", "Mountain View", 37.4, -122.0, "Google LLC", 0.8) for n in range(1, 6)]
+    writer.put_many(infos)
+
+    assert reader.get("8.8.4.1") == infos[0]
+    assert reader.get("1.1.1.1") is None
+    assert set(reader.get_many(["8.8.4.2", "8.8.4.3", "9.9.9.9"])) == {"8.8.4.2", "8.8.4.3"}
+
+    expired = IPInfoStore(path, ttl=-1)
+    expired.put(IPInfo("9.9.9.9", "US", None, None, None, "Quad9", 0.5))
+    assert reader.get("9.9.9.9") is None
+    assert reader.compact() == 1
+    assert len(reader) == 5
+    writer.close()
+    reader.close()
+    expired.close()
+
+
+@pytest.mark.asyncio
+async def test_ipinfo_service_reads_persistent_cache(tmp_path):
+    """The service reads the persistent cache first and only looks up missing IPs"""
+    from geotraceroute.core.ipinfo_store import IPInfoStore
+
+    store = IPInfoStore(str(tmp_path / "ipinfo.sqlite3"))
+    store.put(IPInfo("8.8.8.8", "US", "Mountain View", 37.4, -122.0, "Google LLC", 0.8))
+    service = IPInfoService(store=store)
+    fetched = []
+
+    async def mock_fetch(ip):
+        fetched.append(ip)
+        return IPInfo(ip, "AU", "Sydney", -33.8, 151.2, "Cloudflare", 0.8)
+
+    with patch.object(service, '_fetch_ip_info', side_effect=mock_fetch):
+        assert (await service.get_ip_info("8.8.8.8")).city == "Mountain View"
+        results = await service.get_ip_info_many(["8.8.8.8", "1.1.1.1", "1.1.1.1"])
+
+    assert fetched == ["1.1.1.1"]
+    assert results["1.1.1.1"].city == "Sydney"
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_ipinfo_service_batch_reads_and_writes_off_the_event_loop(tmp_path):
+    """Batch reads and writes of the persistent cache run in worker threads"""
+    import threading
+    from unittest.mock import AsyncMock
+    from geotraceroute.core.ipinfo_store import IPInfoStore
+
+    store = IPInfoStore(str(tmp_path / "ipinfo.sqlite3"))
+    service = IPInfoService(store=store)
+    threads = {}
+
+    def recording(method):
+        original = getattr(store, method)
+
+        def call(*args):
+            threads[method] = threading.get_ident()
+            return original(*args)
+        return call
+
+    data = {"country": "AU", "city": "Sydney", "loc": "-33.8,151.2", "org": "AS13335 Cloudflare"}
+    with patch.object(store, 'get_many', side_effect=recording('get_many')), \
+            patch.object(store, 'put_many', side_effect=recording('put_many')), \
+            patch.object(service, '_request', AsyncMock(return_value=data)):
+        results = await service.get_ip_info_many(["1.1.1.1"])
+
+    assert results["1.1.1.1"].city == "Sydney"
+    assert set(threads) == {"get_many", "put_many"}
+    assert threading.get_ident() not in threads.values()
+    assert store.get("1.1.1.1").city == "Sydney"
+    store.close()
+
+
+async def _start_ipinfo_stub(fail_batch=False, single_failures=()):
+    """Start a local IPInfo stand-in recording the requests it gets; single lookups first answer with single_failures in turn"""
+    from aiohttp import web
+
+    requests_seen = []
+
+    def answer(ip):
+        return {"ip": ip, "city": "Tokyo", "country": "JP", "loc": "35.68,139.69", "org": "AS2516 KDDI"}
+
+    failures = list(single_failures)
+
+    async def single(request):
+        requests_seen.append("single")
+        if failures:
+            return web.Response(status=failures.pop(0), headers={"Retry-After": "0"})
+        return web.json_response(answer(request.match_info["ip"]))
+
+    async def batch(request):
+        requests_seen.append("batch")
+        if fail_batch:
+            return web.Response(status=500)
+        return web.json_response({ip: answer(ip) for ip in await request.json()})
+
+    app = web.Application()
+    app.router.add_get("/{ip}/json", single)
+    app.router.add_post("/batch", batch)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}", requests_seen
+
+
+@pytest.mark.asyncio
+async def test_ipinfo_batches_concurrent_lookups(tmp_path):
+    """Concurrent lookups are merged into one batch request, falling back to single requests when it fails"""
+    from geotraceroute.core.ipinfo_store import IPInfoStore
+
+    for fail_batch in (False, True):
+        runner, url, requests_seen = await _start_ipinfo_stub(fail_batch)
+        service = IPInfoService(store=IPInfoStore(str(tmp_path / f"ipinfo-{fail_batch}.sqlite3")),
+                                base_url=url, batch_window=0.02, batch_size=50, max_retries=0)
+        service.api_key = "test-token"
+        try:
+            ips = [f"210.{n}.0.1" for n in range(20)]
+            results = await asyncio.gather(*(service.get_ip_info(ip) for ip in ips))
+        finally:
+            await service.close()
+            await runner.cleanup()
+
+        assert [result.ip for result in results] == ips
+        assert all(result.city == "Tokyo" and result.latitude == 35.68 for result in results)
+        if fail_batch:
+            assert requests_seen == ["batch"] + ["single"] * 20
+        else:
+            assert requests_seen == ["batch"]
+
+
+@pytest.mark.asyncio
+async def test_ipinfo_batches_fit_rate_limit(tmp_path):
+    """Batches are charged per IP and never exceed the limiter's burst"""
+    from geotraceroute.core.ipinfo_store import IPInfoStore
+    from geotraceroute.core.resilience import TokenBucket
+
+    runner, url, requests_seen = await _start_ipinfo_stub()
+    limiter = TokenBucket(rate=1000, burst=5)
+    service = IPInfoService(store=IPInfoStore(str(tmp_path / "ipinfo.sqlite3")), base_url=url,
+                            batch_window=0.02, batch_size=100, limiter=limiter)
+    service.api_key = "test-token"
+    try:
+        results = await asyncio.gather(*(service.get_ip_info(f"210.{n}.0.1") for n in range(12)))
+    finally:
+        await service.close()
+        await runner.cleanup()
+
+    assert all(result.city == "Tokyo" for result in results)
+    assert requests_seen == ["batch"] * 3
+    assert limiter.stats()["rejections"] == 0
+
+
+@pytest.mark.asyncio
+async def test_ipinfo_retries_rate_limited_requests(tmp_path):
+    """A 429 is retried after Retry-After and the breaker stays closed once it succeeds"""
+    from geotraceroute.core.ipinfo_store import IPInfoStore
+
+    runner, url, requests_seen = await _start_ipinfo_stub(single_failures=[429, 503])
+    service = IPInfoService(store=IPInfoStore(str(tmp_path / "ipinfo.sqlite3")), base_url=url,
+                            batch_window=0, max_retries=2)
+    try:
+        info = await service.get_ip_info("8.8.4.4")
+    finally:
+        await service.close()
+        await runner.cleanup()
+
+    assert info.city == "Tokyo"
+    assert requests_seen == ["single"] * 3
+    assert service.status()["breaker"]["state"] == "closed"
+
+
+@pytest.mark.asyncio
+async def test_ipinfo_circuit_breaker_fails_fast(tmp_path):
+    """After repeated failures the breaker opens and later lookups return empty at once without a request"""
+    from geotraceroute.core.ipinfo_store import IPInfoStore
+    from geotraceroute.core.resilience import CircuitBreaker
+    from geotraceroute.core.ip_info import UnavailableIPInfo
+
+    runner, url, requests_seen = await _start_ipinfo_stub(single_failures=[500] * 10)
+    store = IPInfoStore(str(tmp_path / "ipinfo.sqlite3"))
+    service = IPInfoService(store=store, base_url=url,
+                            batch_window=0, max_retries=0, breaker=CircuitBreaker(3, reset_timeout=60))
+    try:
+        results = [await service.get_ip_info(f"8.8.4.{n}") for n in range(10)]
+    finally:
+        await service.close()
+        await runner.cleanup()
+
+    # Failures are told apart from empty answers and are not stored
+    assert all(isinstance(result, UnavailableIPInfo) and result.latitude is None for result in results)
+    assert len(store) == 0
+    assert requests_seen == ["single"] * 3
+    status = service.status()["breaker"]
+    assert status["state"] == "open"
+    assert status["rejected"] == 7
+    assert status["retry_in_s"] > 0
+
+
+def test_circuit_breaker_half_open_trial():
+    """After the cooldown the breaker lets one trial through and closes when it succeeds"""
+    from geotraceroute.core.resilience import CircuitBreaker
+
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_waits_then_rejects():
+    """The token bucket waits for refills once empty and rejects waits that are too long"""
+    from geotraceroute.core.resilience import TokenBucket
+
+    import time
+
+    bucket = TokenBucket(rate=100, burst=2, max_wait=0.05)
+    assert await bucket.acquire()
+    assert await bucket.acquire()
+    start = time.perf_counter()
+    assert await bucket.acquire()
+    assert time.perf_counter() - start >= 0.005
+    assert bucket.stats()["waits"] == 1
+
+    slow = TokenBucket(rate=10, burst=1, max_wait=0.05)
+    assert await slow.acquire()
+    assert not await slow.acquire()
+    assert slow.stats()["rejections"] == 1
+
+    # A charge larger than the bucket is refused rather than silently capped
+    with pytest.raises(ValueError):
+        await bucket.acquire(3)
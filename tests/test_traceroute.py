@@ -1,27 +1,59 @@
 import pytest
 import asyncio
-from unittest.mock import patch, MagicMock
-import os
-import sys
+import socket
+import time
+from unittest.mock import patch
+from geotraceroute.core.traceroute import Traceroute, Hop, ProbeEngine, ProbeTransport, ProbeReply
+from geotraceroute.core.parser import TracerouteParser
+from geotraceroute.core.resolver import HostResolver
+from geotraceroute.core.data_processor import DataProcessor
 
-# Add the project root directory to the Python path
-project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-if project_root not in sys.path:
-    sys.path.insert(0, project_root)
+TEST_TARGET_IP = "8.8.8.8"
+TEST_PATH = ["192.168.1.1", "10.0.0.1", None, TEST_TARGET_IP]
+
+
+class FakeTransport(ProbeTransport):
+    """Answer probes from a scripted path instead of the network"""
+
+    def __init__(self, path, delay=0.001):
+        self.path = path
+        self.delay = delay
+        self.sent = []
+        self.closed = False
+        self._replies = None
+
+    def open(self):
+        self._replies = asyncio.Queue()
+
+    def send(self, ttl, probe_id):
+        self.sent.append((ttl, probe_id))
+        if ttl > len(self.path) or self.path[ttl - 1] is None:
+            return
+        ip = self.path[ttl - 1]
+        final = ttl == len(self.path)
+        loop = asyncio.get_running_loop()
+        loop.call_later(self.delay, lambda: self._replies.put_nowait(
+            ProbeReply(probe_id, ip, final, time.monotonic())
+        ))
+
+    async def receive(self):
+        return await self._replies.get()
+
+    def close(self):
+        self.closed = True
 
-from geotraceroute.core.traceroute import Traceroute, Hop
-from geotraceroute.core.data_processor import DataProcessor
 
 @pytest.fixture
 def traceroute():
-    """创建Traceroute实例"""
-    return Traceroute("example.com")
+    """创建Traceroute实例, 探测由脚本化路径应答"""
+    return Traceroute(TEST_TARGET_IP, timeout=0.05, backend='native',
+                      transport_factory=lambda ip: FakeTransport(TEST_PATH))
 
 @pytest.mark.asyncio
 async def test_traceroute_initialization():
     """测试Traceroute初始化"""
-    tracer = Traceroute("example.com")
-    assert tracer.target == "example.com"
+    tracer = Traceroute(TEST_TARGET_IP)
+    assert tracer.target == TEST_TARGET_IP
     assert tracer.max_hops == 30
     assert tracer.timeout == 1.0
     assert tracer.retries == 3
@@ -29,7 +61,7 @@ async def test_traceroute_initialization():
 @pytest.mark.asyncio
 async def test_traceroute_with_custom_params():
     """测试带自定义参数的Traceroute初始化"""
-    tracer = Traceroute("example.com", max_hops=15, timeout=2.0, retries=5)
+    tracer = Traceroute(TEST_TARGET_IP, max_hops=15, timeout=2.0, retries=5)
     assert tracer.max_hops == 15
     assert tracer.timeout == 2.0
     assert tracer.retries == 5
@@ -44,31 +76,34 @@ async def test_traceroute_run_stream(traceroute):
         assert isinstance(hop.rtt_ms, list) or hop.rtt_ms is None
 
 @pytest.mark.asyncio
-async def test_traceroute_with_timeout():
+async def test_traceroute_with_timeout(traceroute):
     """测试traceroute超时处理"""
-    tracer = Traceroute("example.com", timeout=0.1)  # set very short timeout
-    async for hop in tracer.run_stream():
+    async for hop in traceroute.run_stream():
         if hop.ip is None:
             assert hop.rtt_ms is None
             break
+    else:
+        pytest.fail("The silent hop was not reported")
 
 @pytest.mark.asyncio
 async def test_traceroute_stop(traceroute):
     """测试停止traceroute"""
-    # start traceroute
-    task = asyncio.create_task(traceroute.run_stream().__anext__())
-    
-    # wait a short time to ensure the task starts running
-    await asyncio.sleep(0.1)
-    
-    # stop traceroute
+    hops = []
+    async for hop in traceroute.run_stream():
+        hops.append(hop)
+        await traceroute.stop()
+
+    assert len(hops) == 1
+    assert traceroute.stop_reason == "stopped"
+
+@pytest.mark.asyncio
+async def test_traceroute_runs_again_after_stop(traceroute):
+    """测试停止后再次运行的traceroute正常完成并报告到达目标"""
     await traceroute.stop()
-    
-    # wait for task to complete
-    try:
-        await task
-    except (asyncio.CancelledError, StopAsyncIteration):
-        pass  # expected behavior
+    hops = await traceroute.run()
+
+    assert [hop.ip for hop in hops] == TEST_PATH
+    assert traceroute.stop_reason == "destination_reached"
 
 @pytest.mark.asyncio
 async def test_traceroute_invalid_target():
@@ -79,64 +114,52 @@ async def test_traceroute_invalid_target():
 @pytest.mark.asyncio
 async def test_traceroute_max_hops():
     """测试最大跳数限制"""
-    tracer = Traceroute("example.com", max_hops=5)
+    tracer = Traceroute(TEST_TARGET_IP, max_hops=2, timeout=0.05, backend='native',
+                        transport_factory=lambda ip: FakeTransport(TEST_PATH))
     hop_count = 0
     async for hop in tracer.run_stream():
         hop_count += 1
-        assert hop.hop_number <= 5
-    assert hop_count <= 5
+        assert hop.hop_number <= 2
+    assert hop_count == 2
 
 @pytest.mark.asyncio
 async def test_traceroute_retries():
     """测试重试机制"""
-    tracer = Traceroute("example.com", retries=2)
+    tracer = Traceroute(TEST_TARGET_IP, retries=2, timeout=0.05, backend='native',
+                        transport_factory=lambda ip: FakeTransport(TEST_PATH))
     async for hop in tracer.run_stream():
-        if hop.rtt_ms is not None:
-            assert len(hop.rtt_ms) <= 2  # maximum 2 retries
+        assert len(hop.rtt_ms) == 2  # one RTT per probe
         break
 
 @pytest.mark.asyncio
 async def test_traceroute_with_data_processor(traceroute):
     """测试与DataProcessor的集成"""
-    processor = DataProcessor()
+    processor = DataProcessor(test_mode=True)
     async for hop in processor.process_traceroute_stream(traceroute):
         assert isinstance(hop, dict)
         assert "hop_number" in hop
         assert "ip" in hop
-        assert "rtt_ms" in hop
-        break
+        if hop.get("type") != "hostname":
+            assert "rtt_ms" in hop
 
 @pytest.mark.asyncio
-async def test_traceroute_execution():
-    """Test traceroute execution with a known target"""
-    traceroute = Traceroute("8.8.8.8")  # Google's DNS server
-    
-    # mock hop data
-    hops = [
-        Hop(1, "192.168.1.1", None, [1.0]),
-        Hop(2, "8.8.8.8", None, [2.0, 2.1])
-    ]
-    
-    async def mock_run_stream():
-        for hop in hops:
-            yield hop
-    
-    with patch.object(traceroute, 'run_stream', side_effect=mock_run_stream):
-        try:
-            result = await traceroute.run()
-            assert isinstance(result, list)
-            assert len(result) > 0
-            
-            # Check hop structure
-            for hop in result:
-                assert isinstance(hop, Hop)
-                assert isinstance(hop.hop_number, int)
-                assert hop.hop_number > 0
-                assert isinstance(hop.rtt_ms, list)
-                assert all(isinstance(rtt, float) for rtt in hop.rtt_ms)
-                
-        except Exception as e:
-            pytest.fail(f"Traceroute execution failed: {str(e)}")
+async def test_traceroute_execution(traceroute):
+    """Test traceroute execution with a scripted path"""
+    result = await traceroute.run()
+    assert isinstance(result, list)
+    assert len(result) > 0
+
+    # Check hop structure
+    for hop in result:
+        assert isinstance(hop, Hop)
+        assert isinstance(hop.hop_number, int)
+        assert hop.hop_number > 0
+        if hop.ip is None:
+            # The scripted path has a silent hop
+            assert hop.rtt_ms is None
+            continue
+        assert isinstance(hop.rtt_ms, list)
+        assert all(isinstance(rtt, float) for rtt in hop.rtt_ms)
 
 def test_invalid_target():
     """Test traceroute with an invalid target"""
@@ -144,74 +167,446 @@ def test_invalid_target():
         Traceroute("invalid.domain.that.does.not.exist")
 
 @pytest.mark.asyncio
-async def test_traceroute_stream():
+async def test_traceroute_stream(traceroute):
     """Test the streaming functionality of traceroute"""
-    target = "google.com"
-    tracer = Traceroute(target, timeout=2)  # Add timeout
-    processor = DataProcessor()
-    
+    processor = DataProcessor(test_mode=True)
+
     # Test streaming individual hops without reputation
     hop_count = 0
-    async for hop in processor.process_traceroute_stream(tracer):
-        assert "hop_number" in hop
-        assert "ip" in hop
-        assert "hostname" in hop
-        assert "rtt_ms" in hop
-        assert "city" in hop
-        assert "country" in hop
-        assert "latitude" in hop
-        assert "longitude" in hop
-        assert "organization" in hop
-        assert "asn" in hop
-        assert "reputation_score" in hop
+    async for hop in processor.process_traceroute_stream(traceroute):
+        if hop.get("type") == "hostname":
+            continue
+        for field in ("hop_number", "ip", "hostname", "rtt_ms", "city", "country", "latitude",
+                      "longitude", "organization", "asn", "reputation_score"):
+            assert field in hop
         assert hop["reputation_score"] is None  # Should be None when not requested
         hop_count += 1
-        if hop_count >= 5:  # Limit the number of hops to test
-            break
-        
-    assert hop_count > 0, "Should have received at least one hop"
-    
+
+    assert hop_count == len(TEST_PATH)
+
     # Test streaming with reputation score
-    hop_count = 0
-    async for hop in processor.process_traceroute_stream(tracer, include_reputation=True):
-        if hop["ip"] and not hop["ip"].startswith('*'):
+    async for hop in processor.process_traceroute_stream(traceroute, include_reputation=True):
+        if hop.get("ip"):
             assert "reputation_score" in hop
-            # Note: reputation_score might still be None if IPInfo API call fails
-        hop_count += 1
-        if hop_count >= 5:  # Limit the number of hops to test
-            break
 
 @pytest.mark.asyncio
-async def test_complete_traceroute():
+async def test_complete_traceroute(traceroute):
     """Test complete traceroute processing"""
-    target = "8.8.8.8"  # Use a reliable target
-    tracer = Traceroute(target, max_hops=3, timeout=2)  # Add timeout and limit hops
-    processor = DataProcessor()
-    
+    processor = DataProcessor(test_mode=True)
+
     # Test without reputation score
-    result = await processor.process_traceroute(tracer)
-    
+    result = await processor.process_traceroute(traceroute)
+
     assert "target" in result
     assert "hops" in result
-    assert len(result["hops"]) > 0
-    
+    assert len(result["hops"]) == len(TEST_PATH)
+
     # Verify first hop structure
     first_hop = result["hops"][0]
-    assert "hop_number" in first_hop
-    assert "ip" in first_hop
-    assert "hostname" in first_hop
-    assert "rtt_ms" in first_hop
-    assert "city" in first_hop
-    assert "country" in first_hop
-    assert "latitude" in first_hop
-    assert "longitude" in first_hop
-    assert "organization" in first_hop
-    assert "asn" in first_hop
-    assert "reputation_score" in first_hop
+    for field in ("hop_number", "ip", "hostname", "rtt_ms", "city", "country", "latitude",
+                  "longitude", "organization", "asn", "reputation_score"):
+        assert field in first_hop
     assert first_hop["reputation_score"] is None  # Should be None when not requested
-    
+
     # Test with reputation score
-    tracer = Traceroute(target, max_hops=3, timeout=2)  # Create new instance
-    result = await processor.process_traceroute(tracer, include_reputation=True)
-    assert len(result["hops"]) > 0
-    # Note: We don't assert the reputation_score value as it depends on IPInfo API 
\ No newline at end of file
+    result = await processor.process_traceroute(traceroute, include_reputation=True)
+    assert len(result["hops"]) == len(TEST_PATH)
+
+
+@pytest.mark.asyncio
+async def test_probe_engine_yields_hops_in_order():
+    """The native engine yields one Hop per TTL and stops at the destination"""
+    transport = FakeTransport(TEST_PATH)
+    engine = ProbeEngine(transport, max_hops=30, timeout=0.05, probes_per_hop=3)
+
+    hops = [hop async for hop in engine.run()]
+
+    assert [hop.hop_number for hop in hops] == [1, 2, 3, 4]
+    assert [hop.ip for hop in hops] == TEST_PATH
+    assert all(isinstance(hop, Hop) for hop in hops)
+    assert len(hops[0].rtt_ms) == 3
+    assert hops[2].rtt_ms is None
+    assert transport.closed
+    # Nothing is probed beyond the destination
+    assert max(ttl for ttl, _ in transport.sent) == 4
+
+
+@pytest.mark.asyncio
+async def test_traceroute_native_backend():
+    """Traceroute streams hops from the native engine when selected"""
+    tracer = Traceroute(
+        TEST_TARGET_IP,
+        timeout=0.05,
+        backend='native',
+        transport_factory=lambda ip: FakeTransport(TEST_PATH)
+    )
+    assert tracer.backend == 'native'
+
+    hops = [hop async for hop in tracer.run_stream()]
+    assert [hop.ip for hop in hops] == TEST_PATH
+
+    hops = await tracer.run()
+    assert len(hops) == 4
+
+
+def test_traceroute_unknown_backend():
+    """Unknown backends are rejected"""
+    with pytest.raises(ValueError):
+        Traceroute(TEST_TARGET_IP, backend='raw')
+
+
+def test_traceroute_backend_defaults_to_subprocess(monkeypatch):
+    """The system traceroute is used unless TRACEROUTE_BACKEND asks for another backend"""
+    monkeypatch.delenv("TRACEROUTE_BACKEND", raising=False)
+    assert Traceroute(TEST_TARGET_IP).backend == 'subprocess'
+
+    monkeypatch.setenv("TRACEROUTE_BACKEND", "native")
+    assert Traceroute(TEST_TARGET_IP).backend == 'native'
+    assert Traceroute(TEST_TARGET_IP, backend='subprocess').backend == 'subprocess'
+
+    monkeypatch.setenv("TRACEROUTE_BACKEND", "auto")
+    assert Traceroute(TEST_TARGET_IP, transport_factory=lambda ip: FakeTransport(TEST_PATH)).backend == 'native'
+
+
+@pytest.mark.asyncio
+async def test_probe_engine_parallel_mode():
+    """Parallel mode probes every TTL up front and still yields hops in order"""
+    transport = FakeTransport(TEST_PATH)
+    engine = ProbeEngine(transport, max_hops=10, timeout=0.2, probes_per_hop=2, parallel=True)
+
+    started = time.monotonic()
+    hops = [hop async for hop in engine.run()]
+    elapsed = time.monotonic() - started
+
+    assert [hop.hop_number for hop in hops] == [1, 2, 3, 4]
+    assert [hop.ip for hop in hops] == TEST_PATH
+    assert len(hops[3].rtt_ms) == 2
+    # All TTLs were probed in one burst
+    assert sorted({ttl for ttl, _ in transport.sent}) == list(range(1, 11))
+    # The silent hop costs a single timeout window, not one per hop
+    assert elapsed < 0.4
+
+
+def test_parser_linux_dialect():
+    """Linux output is detected from its header and parsed with any number of RTT columns"""
+    parser = TracerouteParser()
+    hops = parser.parse(
+        "traceroute to 8.8.8.8 (8.8.8.8), 30 hops max, 60 byte packets\n"
+        " 1  192.168.1.1  0.512 ms  0.468 ms  0.441 ms  0.430 ms\n"
+        " 2  * * *\n"
+        " 3  * 8.8.8.8  23.323 ms  19.489 ms\n"
+        " 4  dns.google (8.8.4.4)  15.012 ms  14.988 ms\n"
+    )
+
+    assert parser.dialect == TracerouteParser.DIALECT_LINUX
+    assert hops == [
+        Hop(1, "192.168.1.1", None, [0.512, 0.468, 0.441, 0.430]),
+        Hop(2, None, None, None),
+        Hop(3, "8.8.8.8", None, [23.323, 19.489]),
+        Hop(4, "8.8.4.4", "dns.google", [15.012, 14.988]),
+    ]
+
+
+def test_parser_macos_and_windows_dialects():
+    """macOS rows without a header and Windows tracert rows are both recognised"""
+    parser = TracerouteParser()
+    assert parser.parse_line(" 1  192.168.1.254  3.102 ms !Z  2.487 ms") == Hop(1, "192.168.1.254", None, [3.102, 2.487])
+    assert parser.dialect == TracerouteParser.DIALECT_MACOS
+
+    parser = TracerouteParser()
+    hops = parser.parse(
+        "Tracing route to dns.google [8.8.8.8]\r\n"
+        "  1    <1 ms    <1 ms    <1 ms  192.168.1.1\r\n"
+        "  2     *        *        *     Request timed out.\r\n"
+        "  3    15 ms     *       15 ms  dns.google [8.8.8.8]\r\n"
+    )
+    assert parser.dialect == TracerouteParser.DIALECT_WINDOWS
+    assert hops == [
+        Hop(1, "192.168.1.1", None, [1.0, 1.0, 1.0]),
+        Hop(2, None, None, None),
+        Hop(3, "8.8.8.8", "dns.google", [15.0, 15.0]),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_resolver_caches_and_deduplicates():
+    """Concurrent lookups of one name share a single query and both families are returned"""
+    calls = []
+
+    async def fake_getaddrinfo(host, port, **kwargs):
+        calls.append(host)
+        await asyncio.sleep(0.01)
+        return [
+            (socket.AF_INET6, socket.SOCK_DGRAM, 0, '', ('2606:2800:220:1::1', 0, 0, 0)),
+            (socket.AF_INET, socket.SOCK_DGRAM, 0, '', ('93.184.216.34', 0)),
+        ]
+
+    resolver = HostResolver(ttl=60)
+    loop = asyncio.get_running_loop()
+    with patch.object(loop, 'getaddrinfo', side_effect=fake_getaddrinfo):
+        results = await asyncio.gather(*(resolver.resolve("example.com") for _ in range(5)))
+        await resolver.resolve("example.com")
+        tracer = await Traceroute.create("example.com", resolver=resolver, backend='subprocess', family=socket.AF_INET6)
+
+    assert calls == ["example.com"]
+    assert all(result is results[0] for result in results)
+    assert results[0].ipv4 == ["93.184.216.34"]
+    assert results[0].ipv6 == ["2606:2800:220:1::1"]
+    assert results[0].pick() == "93.184.216.34"
+    assert tracer.target_ip == "2606:2800:220:1::1"
+
+
+@pytest.mark.asyncio
+async def test_resolver_failure():
+    """Unresolvable names raise ValueError and the failure is cached"""
+    calls = []
+
+    async def fake_getaddrinfo(host, port, **kwargs):
+        calls.append(host)
+        raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+
+    resolver = HostResolver()
+    loop = asyncio.get_running_loop()
+    with patch.object(loop, 'getaddrinfo', side_effect=fake_getaddrinfo):
+        for _ in range(2):
+            with pytest.raises(ValueError, match="Could not resolve hostname: invalid.target"):
+                await resolver.resolve("invalid.target")
+
+    assert calls == ["invalid.target"]
+
+
+def test_hop_statistics_streaming_aggregates():
+    """Rolling statistics match their batch definitions"""
+    from geotraceroute.core.monitor import HopStatistics
+
+    stats = HopStatistics(3)
+    assert stats.add_round("10.0.0.1", [10.0, 12.0], probes_sent=3) is True
+    assert stats.add_round("10.0.0.1", [14.0], probes_sent=3) is False
+    assert stats.add_round(None, [], probes_sent=3) is False
+
+    snapshot = stats.to_dict()
+    assert snapshot["sent"] == 9
+    assert snapshot["received"] == 3
+    assert snapshot["loss_pct"] == pytest.approx(66.7)
+    assert snapshot["last_ms"] == 14.0
+    assert snapshot["best_ms"] == 10.0
+    assert snapshot["worst_ms"] == 14.0
+    assert snapshot["avg_ms"] == 12.0
+    assert snapshot["stddev_ms"] == pytest.approx(1.633, abs=1e-3)
+    assert snapshot["jitter_ms"] == 2.0
+
+
+@pytest.mark.asyncio
+async def test_stop_set_skips_shared_near_hops():
+    """Hops shared by earlier traces are inferred instead of probed"""
+    from geotraceroute.core.stop_set import StopSet
+
+    stop_set = StopSet(ttl=60, min_destinations=2)
+    shared = ["192.168.1.1", "10.0.0.1", "100.64.0.1"]
+    paths = {
+        "1.1.1.1": shared + ["203.0.113.1", "1.1.1.1"],
+        "9.9.9.9": shared + ["198.51.100.1", "9.9.9.9"],
+        "8.8.8.8": shared + ["192.0.2.1", "8.8.8.8"],
+    }
+    transports = []
+
+    def factory(ip):
+        transports.append(FakeTransport(paths[ip]))
+        return transports[-1]
+
+    for target in ("1.1.1.1", "9.9.9.9"):
+        tracer = Traceroute(target, timeout=0.05, backend='native', transport_factory=factory, stop_set=stop_set)
+        hops = await tracer.run()
+        assert not any(hop.inferred for hop in hops)
+    assert stop_set.known_prefix("8.8.8.8") == [(1, "192.168.1.1"), (2, "10.0.0.1"), (3, "100.64.0.1")]
+
+    tracer = Traceroute("8.8.8.8", timeout=0.05, backend='native', transport_factory=factory, stop_set=stop_set)
+    hops = await tracer.run()
+
+    assert [hop.ip for hop in hops] == paths["8.8.8.8"]
+    assert [hop.inferred for hop in hops] == [True, True, False, False, False]
+    # Probing started at the last shared hop to confirm the path
+    assert min(ttl for ttl, _ in transports[-1].sent) == 3
+
+
+@pytest.mark.asyncio
+async def test_stop_set_reprobes_when_path_changed():
+    """A changed near path is probed in full and forgotten by the stop set"""
+    from geotraceroute.core.stop_set import StopSet
+
+    stop_set = StopSet(ttl=60, min_destinations=1)
+    stop_set.learn([Hop(1, "192.168.1.1", None, [1.0]), Hop(2, "10.0.0.1", None, [2.0])], "1.1.1.1")
+    path = ["192.168.1.1", "10.9.9.9", "8.8.8.8"]
+
+    tracer = Traceroute(
+        "8.8.8.8", timeout=0.05, backend='native',
+        transport_factory=lambda ip: FakeTransport(path), stop_set=stop_set
+    )
+    hops = await tracer.run()
+
+    assert [hop.ip for hop in hops] == path
+    assert not any(hop.inferred for hop in hops)
+    assert stop_set.known_prefix("8.8.8.8") == [(1, "192.168.1.1"), (2, "10.9.9.9")]
+
+
+@pytest.mark.asyncio
+async def test_stop_set_learns_from_tracer_rerun_after_stop():
+    """A tracer stopped once still teaches the stop set when it runs again"""
+    from geotraceroute.core.stop_set import StopSet
+
+    stop_set = StopSet(ttl=60, min_destinations=1)
+    tracer = Traceroute(
+        TEST_TARGET_IP, timeout=0.05, backend='native',
+        transport_factory=lambda ip: FakeTransport(TEST_PATH), stop_set=stop_set
+    )
+    await tracer.stop()
+    await tracer.run()
+
+    assert tracer.stop_reason == "destination_reached"
+    assert stop_set.known_prefix("1.1.1.1") == [(1, "192.168.1.1"), (2, "10.0.0.1")]
+
+
+@pytest.mark.asyncio
+async def test_gap_limit_stops_after_silent_hops():
+    """A trace into a filtered network ends after gap_limit silent hops instead of max_hops"""
+    path = ["192.168.1.1", "10.0.0.1"] + [None] * 28
+    for parallel in (False, True):
+        tracer = Traceroute(
+            TEST_TARGET_IP, max_hops=30, timeout=0.05, backend='native', parallel=parallel,
+            transport_factory=lambda ip: FakeTransport(path), gap_limit=3
+        )
+        hops = await tracer.run()
+
+        assert [hop.hop_number for hop in hops] == [1, 2, 3, 4, 5]
+        assert tracer.stop_reason == 'gap_limit'
+
+    tracer = Traceroute(TEST_TARGET_IP, timeout=0.05, backend='native',
+                        transport_factory=lambda ip: FakeTransport(TEST_PATH), gap_limit=3)
+    await tracer.run()
+    assert tracer.stop_reason == 'destination_reached'
+
+
+@pytest.mark.asyncio
+async def test_adaptive_timeout_shortens_silent_hops():
+    """Silent hops wait for an RTO learned from fast replies, not the full timeout"""
+    from geotraceroute.core.traceroute import RTOEstimator
+
+    path = ["192.168.1.1", "10.0.0.1", None, None, TEST_TARGET_IP]
+    engine = ProbeEngine(FakeTransport(path), timeout=1.0, probes_per_hop=2, adaptive_timeout=True, min_timeout=0.05)
+
+    started = time.monotonic()
+    hops = [hop async for hop in engine.run()]
+    elapsed = time.monotonic() - started
+
+    assert [hop.ip for hop in hops] == path
+    assert engine.stop_reason == 'destination_reached'
+    assert elapsed < 0.5
+
+    estimator = RTOEstimator(1.0, minimum=0.2)
+    assert estimator.rto == 1.0
+    estimator.update(0.01)
+    assert estimator.rto == 0.2
+    estimator.update(0.9)
+    assert estimator.rto == 1.0
+
+
+@pytest.mark.asyncio
+async def test_trace_cache_coalesces_and_reports_age():
+    """Concurrent identical traces share one run, later ones are served from the cache"""
+    from geotraceroute.core.trace_cache import TraceCache
+
+    cache = TraceCache(ttl=60)
+    runs = []
+
+    async def run():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return {"target": TEST_TARGET_IP, "hops": [{"hop_number": 1}]}
+
+    tracer = Traceroute(TEST_TARGET_IP, backend='subprocess')
+    key = cache.key_for(tracer, include_reputation=False)
+    assert key != cache.key_for(tracer, include_reputation=True)
+    assert key != cache.key_for(Traceroute(TEST_TARGET_IP, backend='subprocess', max_hops=10), include_reputation=False)
+
+    results = await asyncio.gather(*(cache.get_or_run(key, run) for _ in range(5)))
+    assert len(runs) == 1
+    assert all(result == results[0][0] for result, _ in results)
+    # Every caller gets its own copy to adjust
+    results[0][0]["hops"][0]["city"] = "Mountain View"
+    assert "city" not in results[1][0]["hops"][0]
+
+    await asyncio.sleep(0.01)
+    result, age = await cache.get_or_run(key, run)
+    assert len(runs) == 1
+    assert age > 0
+
+    # Failures are shared with waiters but not cached
+    async def failing():
+        raise RuntimeError("probe failed")
+
+    cache.clear()
+    with pytest.raises(RuntimeError):
+        await cache.get_or_run(key, failing)
+    assert len(cache) == 0
+
+    # So are traces stopped before the end
+    async def stopped():
+        return {"target": TEST_TARGET_IP, "hops": [], "stop_reason": "stopped"}
+
+    result, _ = await cache.get_or_run(key, stopped)
+    assert result["stop_reason"] == "stopped"
+    assert len(cache) == 0
+
+    # A caller that goes away does not cut the shared trace short for the others
+    first = asyncio.ensure_future(cache.get_or_run(key, run))
+    second = asyncio.ensure_future(cache.get_or_run(key, run))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    result, _ = await second
+    assert result["hops"] == [{"hop_number": 1}]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_traces_many_targets_with_bounded_concurrency():
+    """The scheduler interleaves tagged results, caps traces in flight and enforces budgets"""
+    from geotraceroute.core.data_processor import DataProcessor
+    from geotraceroute.core.scheduler import TraceScheduler
+
+    targets = [f"198.51.100.{n}" for n in range(1, 9)]
+    in_flight = []
+    peak = []
+
+    class CountingTransport(FakeTransport):
+        def open(self):
+            super().open()
+            in_flight.append(self)
+            peak.append(len(in_flight))
+
+        def close(self):
+            if self in in_flight:
+                in_flight.remove(self)
+            super().close()
+
+    def factory(ip):
+        if ip == targets[-1]:
+            # Never answers, so only the budget ends it
+            return CountingTransport([None] * 30)
+        return CountingTransport(["192.168.1.1", "10.0.0.1", ip], delay=0.01)
+
+    scheduler = TraceScheduler(
+        DataProcessor(test_mode=True), concurrency=3, target_budget=0.3,
+        backend='native', transport_factory=factory, timeout=0.2
+    )
+    events = [event async for event in scheduler.run(targets + targets[:2])]
+
+    completed = {event["target"]: event for event in events if event.get("type") == "completed"}
+    assert set(completed) == set(targets)
+    assert completed[targets[0]]["reason"] == "destination_reached"
+    assert completed[targets[0]]["hops"] == 3
+    assert completed[targets[-1]]["reason"] == "budget"
+    hops = [event for event in events if "hop_number" in event]
+    assert all(event["target"] in targets for event in hops)
+    assert max(peak) <= 3
+    assert not in_flight
+    # Near hops learned from the first targets are shared with the later ones
+    assert any(event["inferred"] for event in hops)